@@ -10,7 +10,62 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY='dev',
         DATABASE=os.path.join(app.instance_path, 'flaskr.sqlite'),
-        UPLOAD_FOLDER=os.path.join(app.instance_path,'uploads') 
+        UPLOAD_FOLDER=os.path.join(app.instance_path,'uploads'),
+        COMMENTS_PER_PAGE=20, # comments rendered with a post; the rest load from blog.post_comments
+        PAGE_COUNT_TTL=60, # seconds a cached "page x of y" total stays valid, see flaskr/pagination.py
+        SEARCH_CANDIDATES=1000, # newest matches of a search that get ranked; older ones are left out, see flaskr/search.py
+        PAGE_COUNT_CACHE_SIZE=1024, # totals kept per process, one per tag or search query
+        MARKDOWN_CACHE_SIZE=1024, # rendered bodies kept in memory for posts without a stored body_html
+        DB_POOL_SIZE=5, # sqlite connections kept open per worker process
+        DB_POOL_TIMEOUT=10, # seconds a request waits for a free connection before giving up
+        DB_READ_ONLY_REQUESTS=True, # GET requests read through read-only connections, see flaskr/db.py
+        DATABASE_REPLICA=None, # a copy of DATABASE that read-only connections open instead, if set
+        SQLITE_JOURNAL_MODE='wal',
+        SQLITE_SYNCHRONOUS='normal',
+        SQLITE_MMAP_SIZE=256 * 1024 * 1024,
+        SQLITE_CACHE_SIZE=-16000, # negative means KiB, so about 16MB of page cache per connection
+        SQLITE_BUSY_TIMEOUT=5000, # milliseconds to wait for a lock before raising "database is locked"
+        USER_CACHE_SIZE=1024, # logged in users kept in memory by auth.load_logged_in_user
+        USER_CACHE_TTL=60,
+        USER_CACHE_SKIP_ENDPOINTS=('static', 'hello', 'blog.uploaded_in_instance'), # these never look at g.user
+        UPLOAD_MAX_AGE=365 * 24 * 60 * 60, # uploads never change, so clients may keep them for a year
+        UPLOAD_ACCEL_REDIRECT=None, # e.g. '/protected-uploads' to let nginx serve the files with X-Accel-Redirect
+        UPLOAD_ETAG_CACHE_SIZE=4096,
+        MAX_IMAGE_SIZE=10 * 1024 * 1024, # largest image upload accepted, in bytes
+        MAX_CONTENT_LENGTH=12 * 1024 * 1024, # whole request bodies above this are refused with a 413 before being read
+        UPLOAD_CHUNK_SIZE=64 * 1024,
+        IMAGE_VARIANT_WIDTHS=(320, 640, 1280), # resized WebP copies made of every upload, see flaskr/images.py
+        IMAGE_FEED_WIDTH=640, # variant used as the plain src for browsers that ignore srcset
+        IMAGE_WEBP_QUALITY=80,
+        IMAGE_WORKERS=2, # background threads per process that resize uploads
+        IMAGE_PROCESSING_SYNC=False, # resize inside the request instead, e.g. for tests
+        PAGE_CACHE_TYPE='simple', # 'simple' (per process LRU), 'filesystem' (shared by all workers) or 'null'
+        PAGE_CACHE_SIZE=2048,
+        PAGE_CACHE_TTL=300,
+        PAGE_CACHE_DIR=None, # for 'filesystem', defaults to <instance>/cache
+        SQL_RECORD_QUERIES=True, # time every statement of a request, see flaskr/querylog.py
+        SQL_SLOW_QUERY_MS=100, # statements slower than this are logged as warnings
+        SQL_LOG_PARAMS=False, # write bound parameters (password hashes, post bodies, ...) into slow query warnings
+        SQL_N_PLUS_ONE_THRESHOLD=5, # the same statement this many times in one request is logged as a possible N+1
+        SQL_QUERY_HEADERS=False, # add X-Query-Count, X-Query-Time and Server-Timing headers to responses
+        SQL_DEBUG_ENDPOINT=False, # serve the queries of recent requests at /_debug/queries; never in production
+        SQL_HISTORY_SIZE=50,
+        METRICS_ENABLED=True, # record request, query and cache metrics and serve them at /metrics
+        METRICS_DIR=None, # where every worker process keeps its values, defaults to <instance>/metrics
+        METRICS_STATS_INTERVAL=1.0, # seconds between two refreshes of the cache and pool stats by a worker
+        PROFILE_SAMPLE_RATE=0, # profile 1 in this many requests, 0 for none; see flaskr/profiler.py
+        PROFILE_HEADER='X-Profile-Token', # requests carrying a token from `flask profile-token` here are profiled
+        PROFILE_TOKEN_MAX_AGE=60 * 60,
+        PROFILE_INTERVAL=0.005, # seconds between two stack samples of a profiled request
+        PROFILE_DIR=None, # collapsed stacks per endpoint, defaults to <instance>/profiles
+        PASSWORD_HASH_METHOD='scrypt', # werkzeug method for new hashes, e.g. 'pbkdf2:sha256:600000'
+        PASSWORD_HASH_WORKERS=2, # threads per process that hash and check passwords
+        PASSWORD_HASH_QUEUE=8, # hashing jobs allowed to wait; more get a 503 straight away
+        PASSWORD_HASH_TIMEOUT=30, # seconds a request waits for its hash before failing
+        WRITE_QUEUE_ENABLED=True, # likes and comments are committed in groups by one thread, see flaskr/writer.py
+        WRITE_QUEUE_WINDOW=0.002, # seconds the writer keeps collecting after the first queued write
+        WRITE_QUEUE_MAX_BATCH=100, # most writes committed together
+        WRITE_QUEUE_TIMEOUT=10, # seconds a request waits for its write to be committed
     )
 
    # If test_config is provided, load the test configuration
@@ -39,6 +94,39 @@ def create_app(test_config=None):
     from . import db
     db.init_app(app)
 
+    from . import querylog
+    querylog.init_app(app)
+
+    from . import metrics
+    metrics.init_app(app)
+
+    from . import profiler
+    profiler.init_app(app)
+
+    from . import passwords
+    passwords.init_app(app)
+
+    from . import render
+    render.init_app(app)
+
+    from . import search
+    search.init_app(app)
+
+    from . import explain
+    explain.init_app(app)
+
+    from . import uploads
+    uploads.init_app(app)
+
+    from . import images
+    images.init_app(app)
+
+    from . import pagecache
+    pagecache.init_app(app)
+
+    from . import transfer
+    transfer.init_app(app)
+
 
     from . import auth
     app.register_blueprint(auth.bp)
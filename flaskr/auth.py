@@ -1,11 +1,14 @@
 import functools
+from types import MappingProxyType
 
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, session, url_for
+    Blueprint, current_app, flash, g, redirect, render_template, request, session, url_for
 )
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.exceptions import ServiceUnavailable
 
+from flaskr.cache import LRUCache
 from flaskr.db import get_db
+from flaskr.passwords import hash_password, needs_rehash, verify_password
 
 import sqlite3
 
@@ -29,7 +32,7 @@ def register():
             try:
                 db.execute(
                     "INSERT INTO user (username, password) VALUES (?, ?)",
-                    (username, generate_password_hash(password)),
+                    (username, hash_password(password)),
                 )
                 db.commit()
             except db.IntegrityError:
@@ -56,10 +59,12 @@ def login():
 
         if user is None:
             error = 'Incorrect username.'
-        elif not check_password_hash(user['password'], password):
+        elif not verify_password(user['password'], password):
             error = 'Incorrect password.'
 
         if error is None:
+            if needs_rehash(user['password']):
+                rehash_password(db, user['id'], password)
             session.clear() #session is a dict that stores data across requests. 
             session['user_id'] = user['id']
             return redirect(url_for('index'))
@@ -69,20 +74,62 @@ def login():
     return render_template('auth/login.html')
 
 
+def rehash_password(db, user_id, password):
+    # the password is only at hand while logging in, so this is where old hashes move to PASSWORD_HASH_METHOD
+    try:
+        password_hash = hash_password(password)
+    except ServiceUnavailable:
+        return # the pool is busy; the login still counts, the next one upgrades the hash
+    db.execute('UPDATE user SET password = ? WHERE id = ?', (password_hash, user_id))
+    db.commit()
+    invalidate_user(user_id)
+
+
+@bp.record_once
+def create_user_cache(state):
+    state.app.extensions['flaskr_user_cache'] = LRUCache(
+        state.app.config['USER_CACHE_SIZE'], state.app.config['USER_CACHE_TTL']
+    )
+
+
+def get_user_cache():
+    return current_app.extensions['flaskr_user_cache']
+
+
+def invalidate_user(user_id):
+    get_user_cache().delete(user_id)
+
+
 @bp.before_app_request
 def load_logged_in_user():
     user_id = session.get('user_id')
 
-    if user_id is None:
+    if user_id is None or request.endpoint in current_app.config['USER_CACHE_SKIP_ENDPOINTS']:
         g.user = None
     else:
-        g.user = get_db().execute(
-            'SELECT * FROM user WHERE id = ?', (user_id,)
-        ).fetchone()
+        cache = get_user_cache()
+        g.user = cache.get(user_id)
+        if g.user is None:
+            # never the password hash; g.user ends up in templates and in the cache
+            user = get_db().execute(
+                'SELECT id, username FROM user WHERE id = ?', (user_id,)
+            ).fetchone()
+            # read only, because every request of this user gets the same object from the cache
+            g.user = MappingProxyType(dict(user)) if user is not None else None
+            if g.user is not None:
+                cache.set(user_id, g.user)
+
+'''Every request used to look the logged in user up again. The user row is now kept in a small per-process cache for
+USER_CACHE_TTL seconds, and endpoints that never look at g.user (static files, uploads, /hello) skip the lookup
+altogether. Anything that changes a user row calls invalidate_user(); other worker processes pick the change up
+once the TTL runs out. get_user_cache().stats() has the hit and miss counters.'''
 
 
 @bp.route('/logout')
 def logout():
+    user_id = session.get('user_id')
+    if user_id is not None:
+        invalidate_user(user_id)
     session.clear()
     return redirect(url_for('index'))
 
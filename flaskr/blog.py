@@ -1,71 +1,90 @@
 from flask import (
-    Blueprint,send_from_directory, flash, g,current_app, redirect, render_template, request, url_for
+    Blueprint, flash, g,current_app, jsonify, redirect, render_template, request, url_for
 )
-from werkzeug.exceptions import abort
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import NotFound, abort
 
 from flaskr.auth import login_required
-from flaskr.db import get_db
-import markdown, uuid
-from datetime import datetime
-import os
+from flaskr.db import bump_data_version, get_db, read_only
+from flaskr.images import schedule_image_processing, with_variants
+from flaskr.pagecache import cached_data, cached_page, conditional_page
+from flaskr.pagination import invalidate_counts, paginate_keyset, paginate_posts
+from flaskr.render import render_markdown
+from flaskr.search import search_posts
+from flaskr.tags import add_post_tags, paginate_tag, parse_tags, post_tag_names, set_post_tags, tag_cloud
+from flaskr.uploads import send_upload, store_upload
+from flaskr.writer import write
 
 bp = Blueprint('blog', __name__)
 
 
-def generate_unique_filename(filename):
-    extention = filename.rsplit('.',1)[1].lower() if '.' in filename else ''
-    unique_filename = f"{uuid.uuid4().hex}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    if extention:
-        unique_filename = f"{unique_filename}.{extention}"
-    return unique_filename
-
-
-
 @bp.route('/')
+@conditional_page
+@cached_page
 def index():
     db = get_db()
     user_id = 0
     if g.user is not None:
         user_id = g.user['id']
-    
 
-    query = '''SELECT p.id, title, body, p.created, author_id, username, count(distinct l.id) as likes, count(DISTINCT c.id) as comments_count,
-    CASE WHEN ul.post_id IS NOT NULL THEN 1 ELSE 0 END AS user_liked, GROUP_CONCAT(DISTINCT t.tag) AS tags 
-    FROM post p 
-    JOIN user u ON p.author_id = u.id 
-    LEFT JOIN likes l on p.id = l.post_id 
-    LEFT JOIN likes ul on ul.post_id = p.id AND ul.user_id = ? 
-    LEFT JOIN comments c on c.post_id = p.id
-    LEFT JOIN post_tag pt on pt.post_id = p.id
-    LEFT JOIN tags t on pt.tag_id = t.id 
-    GROUP BY p.id, p.title, p.body, p.created, p.author_id, u.username
-    ORDER BY p.created DESC'''
-    posts = db.execute(query, (user_id,)).fetchall()
-
-    len_per_page = 15
-    page = request.args.get('page', 1, type=int)
-    start_page = (page-1)*len_per_page 
-    end_page = start_page+len_per_page
-    paginated_posts = posts[start_page:end_page]
-    total_pages = (len(posts)+len_per_page-1)//len_per_page
-    
-    paginated_posts_dict = [dict(post) for post in paginated_posts]
+    pagination = paginate_posts(db, count_key='index')
+    posts = load_page_posts(db, pagination, user_id)
 
-    images_by_post = {}
-    for post in paginated_posts:
-        images = db.execute('SELECT * FROM images where post_id=?',(post['id'],)).fetchall()
-        if images:
-            images_by_post[post['id']]=images
-        #print(images_by_post) #{58: [<sqlite3.Row object at 0x000001F3DD43AEF0>, <sqlite3.Row object at 0x000001F3DD43AF50>]}
+    images_by_post = load_images_by_post(db, pagination.ids)
 
+    for content in posts:
+        content['body'] = content['body_html'] if content['body_html'] is not None else render_markdown(content['body'])
 
 
-    for content in paginated_posts_dict:
-        content['body'] = markdown.markdown(content['body'])
+    return render_template('blog/index.html', page=pagination.number, pagination=pagination, posts=posts, images_by_post=images_by_post)
 
 
-    return render_template('blog/index.html', page=page,posts=paginated_posts_dict,total_pages=total_pages,images_by_post=images_by_post)
+def load_page_posts(db, pagination, user_id):
+    if not pagination.ids:
+        return []
+
+    placeholders = ','.join('?' * len(pagination.ids))
+
+    def load():
+        query = f'''SELECT p.id, title, body, body_html, p.created, author_id, username, p.like_count as likes, p.comment_count as comments_count,
+        (SELECT GROUP_CONCAT(t.tag) FROM post_tag pt JOIN tags t on pt.tag_id = t.id WHERE pt.post_id = p.id) AS tags
+        FROM post p 
+        JOIN user u ON p.author_id = u.id 
+        WHERE p.id IN ({placeholders})'''
+        return [dict(post) for post in db.execute(query, pagination.ids).fetchall()]
+
+    posts = [dict(post) for post in cached_data('page_posts', tuple(pagination.ids), load)]
+
+    liked = set()
+    if user_id:
+        liked = {row[0] for row in db.execute(
+            f'SELECT post_id FROM likes WHERE user_id = ? AND post_id IN ({placeholders})', (user_id, *pagination.ids)
+        )}
+    for post in posts:
+        post['user_liked'] = 1 if post['id'] in liked else 0
+
+    order = {id: i for i, id in enumerate(pagination.ids)}
+    return sorted(posts, key=lambda post: order[post['id']]) # keep the page's own order, e.g. search relevance
+
+def load_images_by_post(db, post_ids):
+    images_by_post = {}
+    if not post_ids:
+        return images_by_post
+
+    placeholders = ','.join('?' * len(post_ids))
+    images = db.execute(
+        f'SELECT * FROM images WHERE post_id IN ({placeholders}) ORDER BY post_id, id', tuple(post_ids)
+    ).fetchall()
+    for image in with_variants(images):
+        images_by_post.setdefault(image['post_id'], []).append(image)
+    return images_by_post #{58: [{'id': 3, 'filename': ..., 'src': ..., 'srcset': ...}, ...]}
+
+'''One query for the images of every post on the page, and one for all of their resized variants, grouped by post
+id in Python, instead of queries per post.'''
+
+
+'''Pagination happens on the bare post table first (see flaskr/pagination.py), so the query above only ever runs
+over the 15 posts of the current page instead of the whole blog. Likes and comments are read from the counters on
+post that the triggers in schema.sql maintain, so there is no fan-out of LEFT JOINs to GROUP BY.'''
 
 '''The purpose of this JOIN operation is to combine the data from the post table and the user table so that 
 you can retrieve information about both the post and the user who created it in a single query.
@@ -93,61 +112,49 @@ def create():
     if request.method == 'POST':
         title = request.form['title']
         body = request.form['body']
-        tags = request.form['tags']
-        image_file = request.files['image']
+        tags = request.form.get('tags', '')
+        image_file = request.files.get('image')
         error = None
 
+        filename = None
+
         if not title:
             error = 'Title is required.'
+        elif image_file and image_file.filename:
+            filename, _, error = store_upload(image_file)
 
         if error is not None:
             flash(error)
         else:
             db = get_db()
-            cursor = db.cursor()
 
-            cursor.execute(
-                'INSERT INTO post (title, body, author_id)'
-                ' VALUES (?, ?, ?)',
-                (title, body, g.user['id'])
+            cursor = db.execute(
+                'INSERT INTO post (title, body, body_html, author_id)'
+                ' VALUES (?, ?, ?, ?)',
+                (title, body, render_markdown(body), g.user['id'])
             )
-            db.commit()
             post_id = cursor.lastrowid
-            print(post_id)
-
-            if tags:
-                tag_names = [tag.strip() for tag in tags.split('#')]
-                tag_ids = []
-            
-                for tag in tag_names:
-                    tag_id_database = db.execute('SELECT id FROM tags where tag =?',(tag,)).fetchone()
-                    if tag_id_database:
-                       tag_id = tag_id_database[0]
-                       tag_ids.append(tag_id)
-                    else: 
-                       db.execute('INSERT INTO tags(tag) VALUES(?)',(tag,))
-                       db.commit()
-                       #tag_id = db.last_insert_rowid
-                       tag_id=db.execute('SELECT id from tags WHERE tag=?', (tag,)).fetchone()[0]
-                       tag_ids.append(tag_id)
-                tag_ids = set(tag_ids)
-                for tag_id in tag_ids:
-                    db.execute('INSERT INTO post_tag(post_id,tag_id) VALUES(?,?)',(post_id,tag_id))
-                    db.commit()
-
-            if image_file and image_file.filename:
-                filename = secure_filename(generate_unique_filename(image_file.filename))
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'],filename) # app object created inside create_app() is local to that function scope. It is returned from the factory function and typically stored in a variable in your main application script (e.g., app = create_app() in run.py). Once the Flask application (app) is created, it is accessible via the current_app context variable within the request context.
-                image_file.save(file_path)
-
-                db.execute('INSERT INTO images(post_id,filename) VALUES(?,?)',(post_id, filename))
-                db.commit()
-
-            
+
+            add_post_tags(db, post_id, parse_tags(tags))
+
+            image_id = None
+            if filename:
+                image_id = db.execute('INSERT INTO images(post_id,filename) VALUES(?,?)',(post_id, filename)).lastrowid
+            bump_data_version(db)
+            db.commit()
+            invalidate_counts()
+            if image_id is not None:
+                schedule_image_processing(image_id)
+
             return redirect(url_for('blog.index'))
 
     return render_template('blog/create.html')
 
+'''The post, its tags and its image row are written in one transaction and committed once, so a post never shows
+up half created and the whole thing costs a single fsync. The image file is written first; if the transaction
+fails it is left where it is, since a concurrent upload of the same picture may already point at it, and
+clean-uploads removes the blobs no row refers to.'''
+
 
 '''Both the update and delete views will need to fetch a post by id and check if the author matches the 
 logged in user. To avoid duplicating code, you can write a function to get the post and call it from each view.'''
@@ -186,6 +193,7 @@ def update(id):
     if request.method == 'POST':
         title = request.form['title']
         body = request.form['body']
+        tags = request.form.get('tags')
         error = None
 
         if not title:
@@ -196,14 +204,18 @@ def update(id):
         else:
             db = get_db()
             db.execute(
-                'UPDATE post SET title = ?, body = ?'
+                'UPDATE post SET title = ?, body = ?, body_html = ?'
                 ' WHERE id = ?',
-                (title, body, id)
+                (title, body, render_markdown(body), id)
             )
+            if tags is not None: # the form always sends it, an empty field removes every tag
+                set_post_tags(db, id, parse_tags(tags))
+            bump_data_version(db)
             db.commit()
             return redirect(url_for('blog.index'))
 
-    return render_template('blog/update.html', post=post)
+    tags = ' '.join('#' + tag for tag in post_tag_names(get_db(), id))
+    return render_template('blog/update.html', post=post, tags=tags)
 
 '''The pattern {{ request.form['title'] or post['title'] }} is used to choose what data appears in the form. 
 When the form hasn’t been submitted, the original post data appears, but if invalid form data was posted you want to display that so the user can fix the error, so request.form is used instead. request is another variable that’s automatically available in templates.'''
@@ -216,7 +228,9 @@ def delete(id):
     get_post(id)
     db = get_db()
     db.execute('DELETE FROM post WHERE id = ?', (id,))
+    bump_data_version(db)
     db.commit()
+    invalidate_counts()
     return redirect(url_for('blog.index'))
 
 
@@ -226,42 +240,162 @@ it will only handle the POST method and then redirect to the index view.'''
 
 #A detail view to show a single post. Click a post’s title to go to its page.
 @bp.route('/<int:id>', methods=('GET',))
+@conditional_page
+@cached_page
 def post(id):
     db = get_db()
     user_id = 0
     if g.user is not None:
         user_id = g.user['id']
 
-    query = '''SELECT p.id, title, body, p.created, author_id, username, count(DISTINCT l.id) as likes, count(DISTINCT c.id) as comment_count,
-    CASE WHEN ul.post_id IS NOT NULL THEN 1 ELSE 0 END AS user_liked 
+    query = '''SELECT p.id, title, body, p.created, author_id, username, p.like_count as likes, p.comment_count as comment_count,
+    EXISTS(SELECT 1 FROM likes ul WHERE ul.post_id = p.id AND ul.user_id = ?) AS user_liked
     FROM post p 
     JOIN user u ON p.author_id = u.id 
-    LEFT JOIN likes l on p.id = l.post_id 
-    LEFT JOIN likes ul on ul.post_id = p.id AND ul.user_id = ?
-    LEFT JOIN comments c on p.id = c.post_id
-    WHERE p.id=? 
-    GROUP BY p.id, p.title, p.body, p.created, p.author_id, u.username
-    ORDER BY p.created DESC'''
+    WHERE p.id=?'''
     post = db.execute(query, (user_id, id)).fetchone()
 
-    comments = db.execute(('SELECT c.id, c.comment,c.post_id,c.user_id, u.username, c.created'
-                          ' FROM comments c'
-                          ' LEFT JOIN user u on u.id = c.user_id'  
-                          ' WHERE c.post_id =?'
-                          ' ORDER BY c.created DESC'),(id,)).fetchall()
-    
-    images_by_post = db.execute('SELECT * FROM images where post_id=?',(id,)).fetchall()
-    #print(images_by_post) #[<sqlite3.Row object at 0x000002DDFCBE1FF0>]
-
-    
-
     error = None
     if not post:
         error = 'No Post Found'
         return redirect(url_for('blog.index'))
-    
 
-    return render_template('blog/post.html',post=post, comments=comments,images_by_post=images_by_post)
+    comments_page, comments = None, []
+    if g.user is not None: # only logged in users see the comments
+        comments_page, comments = load_comments(db, id, post['comment_count'])
+
+    images_by_post = load_images_by_post(db, [id]).get(id, [])
+    #print(images_by_post) #[<sqlite3.Row object at 0x000002DDFCBE1FF0>]
+
+    return render_template('blog/post.html',post=post, comments=comments, comments_page=comments_page, images_by_post=images_by_post)
+
+
+def load_comments(db, post_id, total=None):
+    """Return (page, comments): one COMMENTS_PER_PAGE page of the post's comments, newest first, from the cursor in
+    the query string."""
+    pagination = paginate_keyset(
+        db, 'comments c', 'c.id', 'c.created', 'c.post_id = ?', (post_id,), current_app.config['COMMENTS_PER_PAGE'],
+        (lambda: total) if total is not None else None
+    )
+    if not pagination.ids:
+        return pagination, []
+
+    placeholders = ','.join('?' * len(pagination.ids))
+    comments = db.execute(
+        'SELECT c.id, c.comment, c.post_id, c.user_id, u.username, c.created'
+        ' FROM comments c'
+        ' LEFT JOIN user u on u.id = c.user_id'
+        f' WHERE c.id IN ({placeholders})'
+        ' ORDER BY c.created DESC, c.id DESC',
+        pagination.ids
+    ).fetchall()
+    return pagination, comments
+
+'''A post used to render every one of its comments. Now the page shows the newest COMMENTS_PER_PAGE and a "more"
+link; the keyset query walks the comments_post_created index on (post_id, created), whose entries end in the
+rowid, so the (created, id) cursor is resolved inside the index and a post with 50,000 comments costs the same as
+one with 50. Without JavaScript the link reloads the post with the next cursor, with comments.js it fetches just
+the next comments from post_comments and appends them.'''
+
+
+def load_post_comments(id):
+    """load_comments() for post ``id``; aborts with a 404 if there is no such post."""
+    db = get_db()
+    post = db.execute('SELECT comment_count FROM post WHERE id = ?', (id,)).fetchone()
+    if post is None:
+        abort(404, f"Post id {id} doesn't exist.")
+    return load_comments(db, id, post['comment_count'])
+
+
+@bp.route('/<int:id>/comments', methods=('GET',))
+def post_comments(id):
+    """The next page of comments as an HTML fragment, for the "more comments" link."""
+    if g.user is None:
+        abort(401)
+    pagination, comments = load_post_comments(id)
+    return render_template('blog/_comments.html', post_id=id, comments=comments, comments_page=pagination)
+
+
+@bp.route('/<int:id>/comments.json', methods=('GET',))
+def post_comments_api(id):
+    if g.user is None:
+        return jsonify(error='Log in to see comments.'), 401
+    try:
+        pagination, comments = load_post_comments(id)
+    except NotFound:
+        return jsonify(error=f"Post id {id} doesn't exist."), 404
+    return jsonify(
+        post_id=id,
+        total=pagination.total,
+        comments=[
+            {
+                'id': comment['id'],
+                'comment': comment['comment'],
+                'user_id': comment['user_id'],
+                'username': comment['username'],
+                'created': comment['created'].isoformat(sep=' '),
+            }
+            for comment in comments
+        ],
+        next_cursor=pagination.next_cursor,
+        next_url=url_for('blog.post_comments_api', id=id, cursor=pagination.next_cursor)
+            if pagination.next_cursor else None,
+    )
+
+
+def set_like(db, post_id, user_id, liked=None):
+    """Like or unlike a post, or toggle when ``liked`` is None. Returns (liked, like_count); aborts with a 404 if
+    there is no such post. Doesn't commit, run it with flaskr.writer.write().
+    """
+    if liked is None:
+        # UNIQUE(post_id, user_id) decides: the insert is a no-op exactly when the like already exists
+        liked = db.execute(
+            'INSERT INTO likes (post_id, user_id) VALUES (?, ?) ON CONFLICT (post_id, user_id) DO NOTHING',
+            (post_id, user_id)
+        ).rowcount == 1
+        if not liked:
+            db.execute('DELETE FROM likes WHERE post_id = ? AND user_id = ?', (post_id, user_id))
+    elif liked:
+        db.execute(
+            'INSERT INTO likes (post_id, user_id) VALUES (?, ?) ON CONFLICT (post_id, user_id) DO NOTHING',
+            (post_id, user_id)
+        )
+    else:
+        db.execute('DELETE FROM likes WHERE post_id = ? AND user_id = ?', (post_id, user_id))
+
+    post = db.execute('SELECT like_count FROM post WHERE id = ?', (post_id,)).fetchone()
+    if post is None:
+        abort(404, f"Post id {post_id} doesn't exist.") # write() rolls the like back
+    return liked, post['like_count']
+
+'''The first statement takes sqlite's write lock, so the insert-or-delete, the like_count trigger and the version
+bump land in one transaction that no other like can interleave with; two quick clicks can't both insert, and the
+count read back is the one that was just written.'''
+
+
+def add_comment(db, post_id, user_id, text):
+    return db.execute(
+        'INSERT INTO comments (comment, post_id, user_id) VALUES (?, ?, ?)', (text, post_id, user_id)
+    ).lastrowid
+
+
+def remove_comment(db, comment_id):
+    db.execute('DELETE FROM comments WHERE id = ?', (comment_id,))
+
+
+@bp.route('/<int:id>/like.json', methods=('POST',))
+def like_api(id):
+    if g.user is None:
+        return jsonify(error='Log in to like posts.'), 401
+
+    liked = request.form.get('liked')
+    if liked is not None:
+        liked = liked.lower() in ('1', 'true', 'yes', 'on')
+    try:
+        liked, count = write(set_like, id, g.user['id'], liked)
+    except NotFound:
+        return jsonify(error=f"Post id {id} doesn't exist."), 404
+    return jsonify(post_id=id, liked=liked, likes=count)
 
 
 #a view for like
@@ -270,21 +404,14 @@ def post(id):
 def likeMeOrNot(id):
     if request.method == 'POST':
         page = request.args.get('page')
-        db = get_db()
-        count = db.execute("SELECT count(*) FROM likes WHERE post_id=? and user_id=?",(id, g.user['id'])).fetchone()[0]
-        if(count == 0 ):
-            db.execute(
-                'INSERT INTO likes(post_id, user_id) VALUES(?,?)',(id,g.user['id'])
-                )
-        else: db.execute('DELETE FROM likes where post_id=? and user_id=?',(id,g.user['id']))
-        db.commit()
+        write(set_like, id, g.user['id'])
     
     index_page = request.args.get('post_page')
     if index_page == 'true':
         return redirect(url_for('blog.post',id=id))
     
     
-    return redirect(url_for('blog.index',page=page))
+    return redirect(url_for('blog.index',page=page,cursor=request.args.get('cursor'),dir=request.args.get('dir')))
 
 #a view for comments
 @bp.route('/<int:id>/comment',methods=('POST',))
@@ -292,15 +419,13 @@ def likeMeOrNot(id):
 def comment(id):
     if request.method == 'POST':
         page = request.args.get('page')
-        db = get_db()
         error = None
         comment = request.form['comment']
         user_id = g.user['id']      
         if comment: 
-            db.execute("INSERT INTO comments(comment, post_id,user_id) Values(?,?,?)",(comment, id, user_id))
+            write(add_comment, id, user_id, comment)
         else:
             error = 'comment is empty'  
-        db.commit()
 
     return redirect(url_for('blog.post',id=id,page=page))
 
@@ -308,50 +433,52 @@ def comment(id):
 @bp.route('/<int:post_id>/delete/<int:comment_id>/', methods=('POST',))
 @login_required
 def delete_comment(post_id, comment_id):
-    db = get_db()
-    db.execute('DELETE FROM comments WHERE id = ?', (comment_id,))
-    db.commit()
+    write(remove_comment, comment_id)
     return redirect(url_for('blog.post', id=post_id))
 
 
 @bp.route('/tag/<string:tag_name>', methods=('GET',))
+@conditional_page
+@cached_page
 def tags(tag_name):
     user_id = 0
     db =get_db()
     if g.user is not None:
         user_id = g.user['id']
-    posts = db.execute('''SELECT p.id, p.title, p.body, p.created, p.author_id, u.username, COUNT(DISTINCT l.id) as likes, 
-                       GROUP_CONCAT(DISTINCT t.tag) as tags, CASE WHEN ul.post_id IS NOT NULL THEN 1 ELSE 0 END AS user_liked 
-                       from post p 
-                       LEFT JOIN post_tag pt ON p.id = pt.post_id  
-                       LEFT JOIN tags t ON t.id=pt.tag_id 
-                       LEFT JOIN post_tag pt_specific ON pt_specific.post_id = p.id AND pt_specific.tag_id IN (SELECT id FROM tags where tag=?) 
-                       LEFT JOIN user u on u.id=p.author_id 
-                       LEFT JOIN likes l on l.post_id= p.id 
-                       LEFT JOIN likes ul on ul.post_id = p.id AND ul.user_id = ?
-                       WHERE pt_specific.tag_id IS NOT NULL 
-                       GROUP BY p.id
-                       ORDER BY p.created DESC''',
-                       (tag_name,user_id)
-                       ).fetchall()
-    return render_template('blog/tag.html',posts=posts)
+    pagination = paginate_tag(db, tag_name)
+    posts = load_page_posts(db, pagination, user_id)
+    images_by_post = load_images_by_post(db, pagination.ids)
+    return render_template('blog/tag.html', posts=posts, page=pagination.number, pagination=pagination, images_by_post=images_by_post, tag_name=tag_name)
+
+
+@bp.route('/tags', methods=('GET',))
+@conditional_page
+@cached_page
+def tag_cloud_view():
+    tags = tag_cloud(get_db())
+    most = max([tag['post_count'] for tag in tags], default=1)
+    return render_template('blog/tag_cloud.html', tags=tags, most=most)
 
 
 @bp.route('/search>',methods=('GET','POST'))
+@conditional_page
+@read_only
 def search():
+    query = request.args.get('query', '')
+    user_id = 0
+    if g.user is not None:
+        user_id = g.user['id']
 
-    if request.method == 'GET':
-        query = request.args.get('query')   
-    
-        db =get_db()
-        users = db.execute('SELECT username FROM user WHERE username=?',(query,)).fetchone()
-        posts = db.execute(''' SELECT p.id, p.title, p.title, p.created,p.body, u.username 
-                       FROM post p
-                       JOIN user u ON p.author_id = u.id
-                       WHERE body LIKE ? OR BODY LIKE ?;''', ('%'+ query + '%','%' + query + '%')).fetchall()
-        
-    
-    return render_template('blog/search.html',posts=posts,users=users,query=query)
+    db =get_db()
+    users = db.execute('SELECT username FROM user WHERE username=?',(query,)).fetchone()
+    pagination = search_posts(db, query)
+    posts = load_page_posts(db, pagination, user_id)
+    snippets = {item['id']: item['snippet'] for item in pagination.items}
+    for post in posts:
+        post['snippet'] = snippets[post['id']]
+    images_by_post = load_images_by_post(db, pagination.ids)
+
+    return render_template('blog/search.html', posts=posts, users=users, query=query, page=pagination.number, pagination=pagination, images_by_post=images_by_post)
 
     
 
@@ -364,5 +491,5 @@ def global_page_not_found(e):
 
 @bp.route('/uploads/<filename>')
 def uploaded_in_instance(filename):
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'],filename)
+    return send_upload(filename)
     
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """A small thread-safe least-recently-used cache with an optional time-to-live per entry."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+'''OrderedDict keeps insertion order, and move_to_end() on every hit turns that into "least recently used first",
+so evicting is just popping from the front once the cache grows past maxsize.'''
+
+
+class NullCache(object):
+    """Never stores anything, for turning a cache off."""
+
+    hits = misses = 0
+
+    def get(self, key, default=None):
+        return default
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'hits': 0, 'misses': 0, 'size': 0, 'maxsize': 0}
+
+
+class FileSystemCache(object):
+    """Pickles entries into files in ``directory`` so that every worker process on the machine shares them."""
+
+    def __init__(self, directory, maxsize=1024, ttl=None):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.prune_every = max(maxsize // 10, 1)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._count = len(self._entries()) # approximate, see _prune()
+        self._sets = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode('utf8')).hexdigest() + '.cache')
+
+    def get(self, key, default=None):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return default
+        if expires is not None and expires <= time.time():
+            self.delete(key)
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl else None
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self._path(key)) # readers in other processes see the old file or the new one, never half
+        with self._lock:
+            self._count += 1
+            self._sets += 1
+            prune = self._count > self.maxsize or self._sets % self.prune_every == 0
+        if prune:
+            self._prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._count = max(self._count - 1, 0)
+
+    def clear(self):
+        for name in self._entries():
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._count = 0
+
+    def _entries(self):
+        return [name for name in os.listdir(self.directory) if name.endswith('.cache')]
+
+    def _prune(self):
+        entries = self._entries()
+        if len(entries) > self.maxsize:
+            # drop the least recently written fifth in one go, so the next set() calls don't have to delete again
+            paths = [os.path.join(self.directory, name) for name in entries]
+            paths.sort(key=_mtime)
+            doomed = paths[:len(paths) - self.maxsize + self.maxsize // 5]
+            for path in doomed:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            entries = entries[len(doomed):]
+        with self._lock:
+            self._count = len(entries)
+
+    def stats(self):
+        # size is this process's running estimate; listing the directory on every scrape would cost O(entries)
+        return {'hits': self.hits, 'misses': self.misses, 'size': self._count, 'maxsize': self.maxsize}
+
+'''Listing the directory is the expensive part of a filesystem cache with thousands of entries, so set() only does
+it once the estimate passes maxsize, or every maxsize // 10 sets to pick up what the other workers wrote in the
+meantime. Each process only counts its own writes between two listings, so with N workers the directory can run
+over maxsize by about N * maxsize / 10 entries before one of them prunes it.'''
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError: # another worker pruned it meanwhile
+        return 0
+
+
+def make_cache(cache_type, maxsize, ttl=None, directory=None):
+    if cache_type == 'simple':
+        return LRUCache(maxsize, ttl)
+    if cache_type == 'filesystem':
+        return FileSystemCache(directory, maxsize, ttl)
+    if cache_type == 'null':
+        return NullCache()
+    raise ValueError(f'Unknown cache type {cache_type!r}.')
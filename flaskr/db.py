@@ -1,26 +1,221 @@
+import os
+import pathlib
+import queue
 import sqlite3
+import threading
+import time
 
 import click
-from flask import current_app, g
+from flask import current_app, g, has_request_context, request
+from flask.cli import with_appcontext
 
+from flaskr.querylog import instrument
 
-def get_db():
-    if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'], # app object created inside create_app() is local to that function scope. It is returned from the factory function and typically stored in a variable in your main application script (e.g., app = create_app() in run.py). Once the Flask application (app) is created, it is accessible via the current_app context variable within the request context.
-            detect_types=sqlite3.PARSE_DECLTYPES  #When you set detect_types=sqlite3.PARSE_DECLTYPES, SQLite will attempt to detect and convert column values into Python types specified by the column declarations (DECLTYPE).
-        )
 
-        g.db.row_factory = sqlite3.Row
+def connect(config, read_only=False):
+    if read_only:
+        # mode=ro opens the file read only, query_only makes sqlite refuse writes even where the file would allow them
+        path = pathlib.Path(os.path.abspath(config['DATABASE_REPLICA'] or config['DATABASE'])).as_uri() + '?mode=ro'
+    else:
+        path = config['DATABASE']
+    db = sqlite3.connect(
+        path, # app object created inside create_app() is local to that function scope. It is returned from the factory function and typically stored in a variable in your main application script (e.g., app = create_app() in run.py). Once the Flask application (app) is created, it is accessible via the current_app context variable within the request context.
+        detect_types=sqlite3.PARSE_DECLTYPES,  #When you set detect_types=sqlite3.PARSE_DECLTYPES, SQLite will attempt to detect and convert column values into Python types specified by the column declarations (DECLTYPE).
+        check_same_thread=False, # pooled connections are handed to whichever thread serves the next request
+        uri=read_only,
+    )
+    db.row_factory = sqlite3.Row
+
+    db.execute(f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT'])}")
+    if read_only:
+        db.execute('PRAGMA query_only = 1')
+    else:
+        db.execute(f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+        db.execute(f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}")
+    db.execute(f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}")
+    db.execute(f"PRAGMA cache_size = {int(config['SQLITE_CACHE_SIZE'])}")
+    return db
+
+'''The pragmas are per connection (journal_mode=WAL is also remembered in the database file). WAL lets readers keep
+reading while one writer commits, synchronous=NORMAL only fsyncs at checkpoints instead of on every commit, which
+is safe with WAL, and busy_timeout makes a connection wait for the write lock instead of failing straight away
+with "database is locked". A negative cache_size is in KiB.'''
+
+
+class ConnectionPool(object):
+    def __init__(self, config, read_only=False):
+        self.config = config
+        self.read_only = read_only
+        self.size = config['DB_POOL_SIZE']
+        self.timeout = config['DB_POOL_TIMEOUT']
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue() # LIFO hands out the most recently used, warmest connection first
+        self._lock = threading.Lock()
+        self._created_at = {}
+        self._opening = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def acquire(self):
+        try:
+            db = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = len(self._created_at) + self._opening < self.size
+                if create:
+                    self._opening += 1 # claim the slot, then connect outside the lock
+            if create:
+                try:
+                    db = connect(self.config, self.read_only)
+                finally:
+                    with self._lock:
+                        self._opening -= 1
+                with self._lock:
+                    self._created_at[id(db)] = time.monotonic()
+            else:
+                started = time.monotonic()
+                try:
+                    db = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise RuntimeError(f'No database connection became free within {self.timeout} seconds.')
+                finally:
+                    with self._lock:
+                        self.waits += 1
+                        self.wait_time += time.monotonic() - started
+
+        with self._lock:
+            self.checkouts += 1
+        return db
+
+    def release(self, db):
+        if db.in_transaction:
+            db.rollback() # don't leak a half finished transaction into the next request
+        self._idle.put(db)
+
+    def close(self):
+        while True:
+            try:
+                db = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            db.close()
+            with self._lock:
+                self._created_at.pop(id(db), None)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - created for created in self._created_at.values()]
+            return {
+                'size': self.size,
+                'connections': len(ages),
+                'idle': self._idle.qsize(),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'oldest_connection_age': max(ages, default=0.0),
+                'mean_connection_age': sum(ages) / len(ages) if ages else 0.0,
+            }
+
+
+class PooledConnection(object):
+    """Stands in for a sqlite3.Connection borrowed from the pool; close() gives it back."""
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return getattr(self._connection, name)
+
+    def close(self):
+        if self._connection is not None:
+            self._pool.release(self._connection)
+            self._connection = None
+
+
+def get_pool(app=None, read_only=False):
+    app = app or current_app
+    name = 'flaskr_db_read_pool' if read_only else 'flaskr_db_pool'
+    pool = app.extensions.get(name)
+    if pool is None or pool.pid != os.getpid():
+        # the pool is created lazily, and again after a fork, so gunicorn workers never share sqlite connections
+        pool = app.extensions[name] = ConnectionPool(app.config, read_only)
+    return pool
+
+
+def close_pool(app):
+    for name in ('flaskr_db_pool', 'flaskr_db_read_pool'):
+        pool = app.extensions.pop(name, None)
+        if pool is not None:
+            pool.close()
+
+
+def read_only(view):
+    """Serve ``view`` from a read-only connection whatever the HTTP method, e.g. a search form that POSTs."""
+    view.db_access = 'read'
+    return view
+
+
+def needs_writer(view):
+    """Give ``view`` the writer connection even for GET and HEAD requests."""
+    view.db_access = 'write'
+    return view
+
+
+def wants_read_only():
+    if not current_app.config['DB_READ_ONLY_REQUESTS'] or not has_request_context():
+        return False # CLI commands, background threads and init_db write
+    view = current_app.view_functions.get(request.endpoint)
+    access = getattr(view, 'db_access', None)
+    if access is not None:
+        return access == 'read'
+    return request.method in ('GET', 'HEAD', 'OPTIONS')
+
+
+def get_write_db():
+    """The request's connection to the primary database, whichever kind of request it is."""
+    if 'db' not in g:
+        pool = get_pool()
+        g.db = instrument(PooledConnection(pool, pool.acquire()))
 
     return g.db
 
 
+def get_read_db():
+    if 'read_db' not in g:
+        pool = get_pool(read_only=True)
+        g.read_db = instrument(PooledConnection(pool, pool.acquire()))
+
+    return g.read_db
+
+
+def get_db():
+    if wants_read_only():
+        return get_read_db()
+    return get_write_db()
+
+'''GET, HEAD and OPTIONS requests read through their own pool of connections opened with mode=ro and
+query_only, so a page view can never take the write lock, and with WAL it neither waits for a writer nor holds one
+up. Everything else, and everything outside a request, gets the writer pool. The choice is made per request from
+the method and the view (see read_only and needs_writer above), before the first query, which is why it is an
+attribute on the view rather than something a view sets while it runs: auth.load_logged_in_user already queries
+before the view is called.
+
+Readers open DATABASE_REPLICA when it is set, e.g. a copy kept up to date by Litestream or LiteFS. That copy lags
+the primary, so a page right after a write may not show it yet; with the default (no replica) readers open the
+primary file and see every committed write straight away.'''
+
+
 def close_db(e=None):
-    db = g.pop('db', None) #pops the value db to db if it exists or else none. 
- 
-    if db is not None:
-        db.close()
+    for name in ('db', 'read_db'):
+        db = g.pop(name, None) #pops the value db to db if it exists or else none.
+
+        if db is not None:
+            db.close() # returns the connection to the pool rather than closing it
 
 '''During the request handling (some_route), g.pop('db', None) retrieves this database connection (db) from g.
 After retrieving db, it is removed from g, ensuring that it won't be mistakenly reused or left open after the request completes.
@@ -33,6 +228,89 @@ def init_db():
         db.executescript(f.read().decode('utf8'))
 
 
+def get_data_version():
+    # read once per request; a write view bumps it but never reads it back afterwards
+    if 'data_version' not in g:
+        g.data_version = get_db().execute('SELECT version, updated FROM data_version WHERE id = 1').fetchone()
+    return g.data_version
+
+
+def bump_data_version(db):
+    """Mark every cached page as stale. Call it inside the transaction that changes the data."""
+    db.execute('UPDATE data_version SET version = version + 1, updated = CURRENT_TIMESTAMP WHERE id = 1')
+
+
+# Columns added to tables after they were first shipped. CREATE TABLE IF NOT EXISTS in schema.sql
+# won't touch a table that already exists, so older databases get them through ALTER TABLE instead.
+ADDED_COLUMNS = (
+    ('post', 'like_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('post', 'comment_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('post', 'body_html', 'TEXT'),
+    ('images', 'width', 'INTEGER'),
+    ('images', 'height', 'INTEGER'),
+    ('tags', 'post_count', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+
+# Columns (and tables) that start out empty on an existing database and have to be filled in from the data.
+DERIVED_COLUMNS = (('post', 'like_count'), ('post', 'comment_count'), ('tags', 'post_count'))
+
+
+def migrate_db():
+    db = get_db()
+
+    merge_duplicate_tags(db)
+
+    backfill = False
+    for table, column, declaration in ADDED_COLUMNS:
+        columns = [row['name'] for row in db.execute(f'PRAGMA table_info({table})')]
+        if columns and column not in columns:
+            db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+            backfill = backfill or (table, column) in DERIVED_COLUMNS
+    had_search_index = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'post_fts'").fetchone() is not None
+    db.commit()
+
+    init_db()
+
+    if backfill:
+        rebuild_counters()
+    if not had_search_index:
+        # the triggers only index posts written from now on
+        db.execute("INSERT INTO post_fts(post_fts) VALUES('rebuild')")
+        bump_data_version(db)
+        db.commit()
+
+'''A database from before the counters, tag counts or search index existed gets the new columns at their default
+of 0 and an empty post_fts; the triggers only keep them right from then on. So the first migration also works
+them out from the existing rows (which also resets post_tag.created to each post's time), and later migrations,
+with nothing new to add, don't pay for that again.'''
+
+
+def merge_duplicate_tags(db):
+    # tags.tag used to allow duplicates; fold them into the oldest row so the unique index in schema.sql can be built
+    if not db.execute("SELECT 1 FROM sqlite_master WHERE name = 'tags'").fetchone():
+        return
+    db.execute(
+        'UPDATE OR IGNORE post_tag SET tag_id = (SELECT min(t2.id) FROM tags t1 JOIN tags t2 ON t1.tag = t2.tag WHERE t1.id = post_tag.tag_id)'
+    )
+    db.execute('DELETE FROM post_tag WHERE tag_id NOT IN (SELECT min(id) FROM tags GROUP BY tag)')
+    db.execute('DELETE FROM tags WHERE id NOT IN (SELECT min(id) FROM tags GROUP BY tag)')
+
+
+def rebuild_counters():
+    db = get_db()
+    db.execute(
+        'UPDATE post SET'
+        ' like_count = (SELECT count(*) FROM likes l WHERE l.post_id = post.id),'
+        ' comment_count = (SELECT count(*) FROM comments c WHERE c.post_id = post.id)'
+    )
+    db.execute('UPDATE tags SET post_count = (SELECT count(*) FROM post_tag pt WHERE pt.tag_id = tags.id)')
+    db.execute('UPDATE post_tag SET created = (SELECT p.created FROM post p WHERE p.id = post_tag.post_id)'
+               ' WHERE post_id IN (SELECT id FROM post)')
+    bump_data_version(db)
+    db.commit()
+
+
 @click.command('init-db')
 def init_db_command():
     """Clear the existing data and create new tables."""
@@ -49,6 +327,25 @@ It is not a standard Flask command but often implemented using Flask's flask.cli
 
 """
 
+@click.command('migrate-db')
+@with_appcontext
+def migrate_db_command():
+    """Bring an existing database up to the current schema (columns, indexes, triggers) without losing data."""
+    migrate_db()
+    click.echo('Migrated the database.')
+
+
+@click.command('rebuild-counters')
+@with_appcontext
+def rebuild_counters_command():
+    """Add any missing columns and recompute the like, comment and tag counters."""
+    migrate_db()
+    rebuild_counters()
+    click.echo('Rebuilt like, comment and tag counters.')
+
+
 def init_app(app):
     app.teardown_appcontext(close_db) # """Ensures that resources like database connections are properly cleaned up after each request."""
     app.cli.add_command(init_db_command) # The app.cli.add_command() function in Flask is used to add custom CLI commands to your Flask application. These commands are typically used for administrative tasks such as database initialization, management, or other application-specific tasks that you want to execute from the command line interface.
+    app.cli.add_command(migrate_db_command)
+    app.cli.add_command(rebuild_counters_command)
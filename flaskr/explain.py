@@ -0,0 +1,156 @@
+import ast
+import os
+import re
+
+import click
+from flask import current_app, request_finished, request_started
+from flask.cli import with_appcontext
+
+from flaskr.db import get_db
+from flaskr.pagination import encode_cursor
+
+
+SCANNED_MODULES = ('blog.py', 'auth.py')
+
+# Tables that grow with the blog. A plain SCAN of any of them means a query reads every row.
+LARGE_TABLES = {'user', 'post', 'likes', 'comments', 'tags', 'post_tag', 'images'}
+
+NOT_AN_ALIAS = {
+    'where', 'on', 'join', 'left', 'inner', 'cross', 'natural', 'group', 'order', 'limit',
+    'using', 'having', 'window', 'union', 'values', 'set',
+}
+
+
+def _sql_text(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        # f-strings here only ever interpolate placeholder lists like IN ({placeholders}), so one ? stands in
+        return ''.join(
+            part.value if isinstance(part, ast.Constant) else '?'
+            for part in node.values
+        )
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, right = _sql_text(node.left), _sql_text(node.right)
+        if left is not None and right is not None:
+            return left + right
+    return None
+
+
+def static_queries():
+    """Yield (location, sql) for every literal query passed to execute() in SCANNED_MODULES."""
+    for name in SCANNED_MODULES:
+        path = os.path.join(os.path.dirname(__file__), name)
+        with open(path, encoding='utf8') as f:
+            tree = ast.parse(f.read(), path)
+
+        for node in ast.walk(tree):
+            if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and node.func.attr in ('execute', 'executemany') and node.args):
+                sql = _sql_text(node.args[0])
+                if sql is not None:
+                    yield f'{name}:{node.lineno}', sql
+
+
+def crawled_queries(app):
+    """Yield (location, sql) for the statements the read-only pages actually run, as seen by sqlite's trace hook."""
+    db = get_db()
+    post = db.execute('SELECT id, created FROM post ORDER BY created DESC, id DESC LIMIT 1').fetchone()
+    tag = db.execute('SELECT tag FROM tags LIMIT 1').fetchone()
+    user = db.execute('SELECT id FROM user LIMIT 1').fetchone()
+
+    paths = ['/', '/search>?query=the']
+    if post is not None:
+        paths += [f'/{post["id"]}', '/?cursor=' + encode_cursor(post['created'], post['id'])]
+    if tag is not None:
+        paths.append(f'/tag/{tag["tag"]}')
+
+    statements = []
+
+    def trace(sql):
+        if sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'):
+            statements.append(sql)
+
+    def start_tracing(sender, **extra):
+        get_db().set_trace_callback(trace)
+
+    def stop_tracing(sender, **extra):
+        get_db().set_trace_callback(None)
+
+    client = app.test_client()
+    with request_started.connected_to(start_tracing, app), request_finished.connected_to(stop_tracing, app):
+        for logged_in in (False, True):
+            if logged_in and user is not None:
+                with client.session_transaction() as session:
+                    session['user_id'] = user['id']
+            for path in paths:
+                del statements[:]
+                # a request reuses an app context that is already pushed, and with it g, the connection and the
+                # query log, so each page gets its own; otherwise every page's queries pile up in one N+1 report
+                with app.app_context():
+                    client.get(path)
+                for sql in statements:
+                    yield f'GET {path}', sql
+
+
+def table_aliases(sql):
+    aliases = {}
+    pattern = r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?'
+    for table, alias in re.findall(pattern, sql, re.IGNORECASE):
+        aliases[table] = table
+        if alias and alias.lower() not in NOT_AN_ALIAS:
+            aliases[alias] = table
+    return aliases
+
+
+def full_scans(db, sql):
+    plan = db.execute('EXPLAIN QUERY PLAN ' + sql, (None,) * sql.count('?')).fetchall()
+    aliases = table_aliases(sql)
+    scans = []
+    for row in plan:
+        detail = row['detail']
+        match = re.match(r'SCAN (\w+)(.*)', detail)
+        if match and 'INDEX' not in match.group(2) and aliases.get(match.group(1)) in LARGE_TABLES:
+            scans.append(detail)
+    return [row['detail'] for row in plan], scans
+
+'''"SCAN x USING INDEX i" still walks an index, but in index order and usually stopping early because of a LIMIT,
+and "USING COVERING INDEX" never touches the table at all, so only a bare "SCAN x" counts as a full table scan.'''
+
+
+@click.command('db-explain')
+@click.option('--verbose', '-v', is_flag=True, help='Print the plan of every query, not only the failing ones.')
+@with_appcontext
+def db_explain_command(verbose):
+    """Run EXPLAIN QUERY PLAN over the queries in blog.py and auth.py and fail on full scans of large tables."""
+    db = get_db()
+    seen = set()
+    failures = 0
+
+    queries = list(static_queries()) + list(crawled_queries(current_app._get_current_object()))
+    for location, sql in queries:
+        key = ' '.join(sql.split())
+        if key in seen:
+            continue
+        seen.add(key)
+
+        try:
+            plan, scans = full_scans(db, sql)
+        except db.Error as e:
+            failures += 1
+            click.echo(f'ERROR {location}: could not explain ({e})\n  {key}')
+            continue
+
+        failures += bool(scans)
+        if scans or verbose:
+            click.echo(f'{"SCAN " if scans else "ok   "}{location}\n  {key}')
+            for detail in plan:
+                click.echo(f'    {detail}')
+
+    click.echo(f'Explained {len(seen)} queries, {failures} failing.')
+    if failures:
+        raise click.ClickException('Some queries scan a large table or cannot be explained; fix or index them.')
+
+
+def init_app(app):
+    app.cli.add_command(db_explain_command)
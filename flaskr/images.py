@@ -0,0 +1,171 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+
+from flaskr.db import bump_data_version, get_db, migrate_db
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Pillow is optional, without it uploads are simply served as they are
+    Image = None
+
+
+def make_variants(path, widths, quality):
+    """Write WebP copies of the image at ``path`` for every width smaller than the original.
+
+    Returns the original (width, height) and a list of (filename, width, height) for the variants.
+    """
+    folder, name = os.path.split(path)
+    stem = name.rsplit('.', 1)[0]
+    variants = []
+
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        for variant_width in sorted(set(widths)):
+            if variant_width >= width:
+                break
+            variant_height = max(round(height * variant_width / width), 1)
+            filename = f'{stem}_{variant_width}w.webp'
+            image.resize((variant_width, variant_height), Image.LANCZOS).save(
+                os.path.join(folder, filename), 'WEBP', quality=quality
+            )
+            variants.append((filename, variant_width, variant_height))
+
+        filename = f'{stem}_{width}w.webp'
+        image.save(os.path.join(folder, filename), 'WEBP', quality=quality)
+        variants.append((filename, width, height))
+
+    return (width, height), variants
+
+
+def process_image(image_id):
+    db = get_db()
+    image = db.execute('SELECT id, filename FROM images WHERE id = ?', (image_id,)).fetchone()
+    if image is None:
+        return
+
+    done = db.execute(
+        'SELECT id, width, height FROM images WHERE filename = ? AND id != ? AND width IS NOT NULL LIMIT 1',
+        (image['filename'], image_id)
+    ).fetchone()
+    if done is not None:
+        # the same blob was uploaded before (uploads are stored by content hash), reuse its variants
+        db.execute('UPDATE images SET width = ?, height = ? WHERE id = ?', (done['width'], done['height'], image_id))
+        db.execute('DELETE FROM image_variants WHERE image_id = ?', (image_id,))
+        db.execute(
+            'INSERT INTO image_variants (image_id, filename, width, height)'
+            ' SELECT ?, filename, width, height FROM image_variants WHERE image_id = ?',
+            (image_id, done['id'])
+        )
+        bump_data_version(db)
+        db.commit()
+        return
+
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], image['filename'])
+    try:
+        (width, height), variants = make_variants(
+            path, current_app.config['IMAGE_VARIANT_WIDTHS'], current_app.config['IMAGE_WEBP_QUALITY']
+        )
+    except (OSError, Image.DecompressionBombError) as e: # not an image Pillow can read, keep serving the original
+        current_app.logger.warning('Could not make variants of %s: %s', image['filename'], e)
+        return
+
+    db.execute('UPDATE images SET width = ?, height = ? WHERE id = ?', (width, height, image_id))
+    db.execute('DELETE FROM image_variants WHERE image_id = ?', (image_id,))
+    db.executemany(
+        'INSERT INTO image_variants (image_id, filename, width, height) VALUES (?, ?, ?, ?)',
+        [(image_id, filename, w, h) for filename, w, h in variants]
+    )
+    bump_data_version(db) # cached pages still point at the original
+    db.commit()
+
+
+def _process_in_app_context(app, image_id):
+    with app.app_context():
+        try:
+            process_image(image_id)
+        except Exception:
+            app.logger.exception('Processing image %s failed', image_id)
+
+
+def get_executor(app):
+    executor = app.extensions.get('flaskr_image_executor')
+    if executor is None or executor.pid != os.getpid():
+        executor = ThreadPoolExecutor(app.config['IMAGE_WORKERS'], thread_name_prefix='flaskr-images')
+        executor.pid = os.getpid()
+        app.extensions['flaskr_image_executor'] = executor
+    return executor
+
+
+def schedule_image_processing(image_id):
+    if Image is None:
+        return None
+
+    app = current_app._get_current_object()
+    if app.config['IMAGE_PROCESSING_SYNC']:
+        _process_in_app_context(app, image_id)
+        return None
+    return get_executor(app).submit(_process_in_app_context, app, image_id)
+
+'''Resizing a photo takes anything from tens to hundreds of milliseconds, so create() only stores the upload and
+hands the rest to a small thread pool (Pillow releases the GIL while it resizes). Until the worker is done the
+feed just shows the original. Set IMAGE_PROCESSING_SYNC to do the work inline, which is what the tests use.'''
+
+
+def with_variants(images):
+    """Turn image rows into dicts with ``src``, ``srcset``, ``width`` and ``height`` for the templates."""
+    images = [dict(image) for image in images]
+    if not images:
+        return images
+
+    db = get_db()
+    placeholders = ','.join('?' * len(images))
+    variants = {}
+    for row in db.execute(
+        f'SELECT image_id, filename, width FROM image_variants WHERE image_id IN ({placeholders}) ORDER BY width',
+        [image['id'] for image in images]
+    ):
+        variants.setdefault(row['image_id'], []).append(row)
+
+    feed_width = current_app.config['IMAGE_FEED_WIDTH']
+    for image in images:
+        image['src'] = url_for('blog.uploaded_in_instance', filename=image['filename'])
+        image['srcset'] = ''
+        image_variants = variants.get(image['id'])
+        if image_variants:
+            image['srcset'] = ', '.join(
+                url_for('blog.uploaded_in_instance', filename=v['filename']) + f' {v["width"]}w' for v in image_variants
+            )
+            fallback = next((v for v in image_variants if v['width'] >= feed_width), image_variants[-1])
+            image['src'] = url_for('blog.uploaded_in_instance', filename=fallback['filename'])
+    return images
+
+
+def process_missing_images():
+    db = get_db()
+    ids = [row['id'] for row in db.execute('SELECT id FROM images WHERE width IS NULL ORDER BY id')]
+    for image_id in ids:
+        process_image(image_id)
+    return len(ids)
+
+
+@click.command('process-images')
+@with_appcontext
+def process_images_command():
+    """Make resized WebP variants for uploads that don't have them yet."""
+    if Image is None:
+        raise click.ClickException('Pillow is not installed.')
+    migrate_db()
+    count = process_missing_images()
+    click.echo(f'Processed {count} images.')
+
+
+def init_app(app):
+    app.cli.add_command(process_images_command)
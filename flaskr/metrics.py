@@ -0,0 +1,346 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from flask import current_app, g, request
+
+from flaskr.db import get_pool
+
+
+# name: (type, help). Label values are added where the metric is recorded.
+METRICS = {
+    'flaskr_http_requests_total': ('counter', 'Requests handled, by endpoint, method and status.'),
+    'flaskr_http_request_duration_seconds': ('histogram', 'Time spent handling a request, by endpoint.'),
+    'flaskr_http_requests_in_flight': ('gauge', 'Requests being handled right now.'),
+    'flaskr_db_queries_total': ('counter', 'SQL statements run while handling requests, by endpoint.'),
+    'flaskr_db_query_seconds_total': ('counter', 'Time spent running SQL statements, by endpoint.'),
+    'flaskr_db_pool_connections': ('gauge', 'Open sqlite connections in the pools.'),
+    'flaskr_db_pool_idle_connections': ('gauge', 'Pooled sqlite connections not lent to a request.'),
+    'flaskr_db_pool_waits_total': ('counter', 'Times a request had to wait for a free sqlite connection.'),
+    'flaskr_cache_hits_total': ('counter', 'Cache lookups that found an entry, by cache.'),
+    'flaskr_cache_misses_total': ('counter', 'Cache lookups that found nothing, by cache.'),
+    'flaskr_cache_entries': ('gauge', 'Entries held by a cache, by cache.'),
+}
+
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+# app.extensions key of every cache that reports hits and misses, by the name used in the cache label.
+CACHES = {
+    'page': 'flaskr_page_cache',
+    'markdown': 'flaskr_markdown_cache',
+    'user': 'flaskr_user_cache',
+    'upload_etag': 'flaskr_upload_etags',
+    'page_count': 'flaskr_page_counts',
+}
+
+# Counters of workers that have exited, folded together by mark_process_dead().
+AGGREGATE_FILE = 'dead.values'
+
+_HEADER = struct.Struct('<I4x')
+_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+
+
+def _padded(length):
+    return (_LENGTH.size + length + 7) // 8 * 8 # so that the double after the key is 8 byte aligned
+
+
+def read_entries(data):
+    """Yield (key, value, offset of the value) for the entries in the bytes of a values file."""
+    used = _HEADER.unpack_from(data, 0)[0] if len(data) >= _HEADER.size else 0
+    position = _HEADER.size
+    while position < used:
+        length = _LENGTH.unpack_from(data, position)[0]
+        key = bytes(data[position + _LENGTH.size:position + _LENGTH.size + length]).decode('utf8')
+        offset = position + _padded(length)
+        yield key, _VALUE.unpack_from(data, offset)[0], offset
+        position = offset + _VALUE.size
+
+
+class MmapValues(object):
+    """Float values by key, kept in a memory mapped file that only this process writes and any process can read."""
+
+    initial_size = 64 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self.initial_size:
+            self._file.truncate(self.initial_size)
+            size = self.initial_size
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = max(_HEADER.unpack_from(self._map, 0)[0], _HEADER.size)
+        self._offsets = {key: offset for key, value, offset in read_entries(self._map)}
+
+    def _offset(self, key):
+        offset = self._offsets.get(key)
+        if offset is None:
+            encoded = key.encode('utf8')
+            entry_size = _padded(len(encoded)) + _VALUE.size
+            if self._used + entry_size > len(self._map):
+                size = max(len(self._map) * 2, self._used + entry_size)
+                self._map.close()
+                self._file.truncate(size)
+                self._map = mmap.mmap(self._file.fileno(), size)
+            _LENGTH.pack_into(self._map, self._used, len(encoded))
+            self._map[self._used + _LENGTH.size:self._used + _LENGTH.size + len(encoded)] = encoded
+            offset = self._used + _padded(len(encoded))
+            _VALUE.pack_into(self._map, offset, 0.0)
+            self._used += entry_size
+            _HEADER.pack_into(self._map, 0, self._used) # readers only see the entry once it is complete
+            self._offsets[key] = offset
+        return offset
+
+    def inc(self, key, amount=1.0):
+        with self._lock:
+            offset = self._offset(key)
+            _VALUE.pack_into(self._map, offset, _VALUE.unpack_from(self._map, offset)[0] + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            _VALUE.pack_into(self._map, self._offset(key), value)
+
+    def close(self):
+        with self._lock:
+            self._map.close()
+            self._file.close()
+
+'''Every worker process writes its own file in METRICS_DIR, so there is no locking between processes and recording
+a request is a handful of in-place writes to memory. Whichever worker answers /metrics reads all the files and adds
+them up. A file is a small header holding the number of bytes in use, followed by (key length, key, value) entries
+that are only ever appended, which is what lets a reader in another process walk it safely while it grows.'''
+
+
+def metric_key(name, **labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+def get_values(app=None):
+    app = app or current_app
+    values = app.extensions.get('flaskr_metrics')
+    if values is None or values.pid != os.getpid():
+        directory = metrics_dir(app)
+        os.makedirs(directory, exist_ok=True)
+        values = MmapValues(os.path.join(directory, f'{os.getpid()}.values'))
+        # a file left by an earlier process with the same pid keeps its counters, but not its in-flight requests
+        reset_gauges(values)
+        values.pid = os.getpid()
+        values.stats_recorded = float('-inf')
+        app.extensions['flaskr_metrics'] = values
+    return values
+
+
+def is_gauge(key):
+    return METRICS.get(json.loads(key)[0], ('',))[0] == 'gauge'
+
+
+def reset_gauges(values):
+    for key in list(values._offsets):
+        if is_gauge(key):
+            values.set(key, 0.0)
+
+
+def metrics_dir(app):
+    return app.config['METRICS_DIR'] or os.path.join(app.instance_path, 'metrics')
+
+
+def observe_request(values, endpoint, method, status, duration):
+    values.inc(metric_key('flaskr_http_requests_total', endpoint=endpoint, method=method, status=str(status)))
+    bucket = next(le for le in BUCKETS if duration <= le)
+    values.inc(metric_key('flaskr_http_request_duration_seconds_bucket', endpoint=endpoint, le=_number(bucket)))
+    values.inc(metric_key('flaskr_http_request_duration_seconds_sum', endpoint=endpoint), duration)
+    values.inc(metric_key('flaskr_http_request_duration_seconds_count', endpoint=endpoint))
+
+
+def record_stats(values, app):
+    for name, extension in CACHES.items():
+        cache = app.extensions.get(extension)
+        if cache is not None:
+            stats = cache.stats()
+            values.set(metric_key('flaskr_cache_hits_total', cache=name), stats['hits'])
+            values.set(metric_key('flaskr_cache_misses_total', cache=name), stats['misses'])
+            values.set(metric_key('flaskr_cache_entries', cache=name), stats['size'])
+
+    for pool_name, extension, read_only in (('write', 'flaskr_db_pool', False), ('read', 'flaskr_db_read_pool', True)):
+        if extension in app.extensions:
+            stats = get_pool(app, read_only).stats()
+            values.set(metric_key('flaskr_db_pool_connections', pool=pool_name), stats['connections'])
+            values.set(metric_key('flaskr_db_pool_idle_connections', pool=pool_name), stats['idle'])
+            values.set(metric_key('flaskr_db_pool_waits_total', pool=pool_name), stats['waits'])
+
+
+def start_request():
+    g.metrics_started = time.perf_counter()
+    get_values().inc(metric_key('flaskr_http_requests_in_flight'))
+
+
+def remember_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def finish_request(exc=None):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+
+    app = current_app._get_current_object()
+    values = get_values(app)
+    endpoint = request.endpoint or 'none'
+    status = 500 if exc is not None else g.pop('metrics_status', 500)
+    values.inc(metric_key('flaskr_http_requests_in_flight'), -1)
+    observe_request(values, endpoint, request.method, status, time.perf_counter() - started)
+
+    log = g.get('query_log')
+    if log is not None:
+        values.inc(metric_key('flaskr_db_queries_total', endpoint=endpoint), len(log))
+        values.inc(metric_key('flaskr_db_query_seconds_total', endpoint=endpoint), log.total_time)
+
+    # cache and pool stats are running totals, refreshing them every METRICS_STATS_INTERVAL is plenty
+    now = time.monotonic()
+    if now - values.stats_recorded >= app.config['METRICS_STATS_INTERVAL']:
+        values.stats_recorded = now
+        record_stats(values, app)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect(directory):
+    """Add up the values of every process in ``directory``. Gauges only count processes that are still running."""
+    totals = {}
+    for filename in os.listdir(directory):
+        if not filename.endswith('.values'):
+            continue
+        try:
+            pid = None if filename == AGGREGATE_FILE else int(filename.split('.')[0])
+            with open(os.path.join(directory, filename), 'rb') as f:
+                data = f.read()
+        except (ValueError, OSError):
+            continue
+        alive = None
+        for key, value, offset in read_entries(data):
+            name, labels = json.loads(key)
+            if METRICS.get(name, ('',))[0] == 'gauge':
+                if alive is None:
+                    alive = pid is not None and pid_alive(pid)
+                if not alive:
+                    continue
+            key = (name, tuple(tuple(label) for label in labels))
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value):
+        return str(int(value)) if abs(value) >= 1 or value == 0 else repr(value)
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join(f'{label}="{_escape(text)}"' for label, text in labels) + '}'
+    return f'{name} {_number(value)}'
+
+
+def render(totals):
+    """Format collected values in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        samples = sorted((key, value) for key, value in totals.items() if key[0] == name)
+        if kind == 'histogram':
+            samples = _histogram_samples(name, totals)
+        if not samples:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (sample_name, labels), value in samples:
+            lines.append(_sample(sample_name, labels, value))
+    return '\n'.join(lines) + '\n'
+
+
+def _histogram_samples(name, totals):
+    series = sorted({
+        labels for (sample_name, labels) in totals if sample_name == name + '_count'
+    })
+    samples = []
+    for labels in series:
+        cumulative = 0.0
+        for le in BUCKETS:
+            bucket_labels = tuple(sorted(labels + (('le', _number(le)),)))
+            cumulative += totals.get((name + '_bucket', bucket_labels), 0.0)
+            samples.append(((name + '_bucket', labels + (('le', _number(le)),)), cumulative))
+        samples.append(((name + '_sum', labels), totals.get((name + '_sum', labels), 0.0)))
+        samples.append(((name + '_count', labels), totals.get((name + '_count', labels), 0.0)))
+    return samples
+
+'''The buckets are stored as plain per-bucket counts, so recording a request touches one bucket instead of every
+bucket above it; they are made cumulative, the way the exposition format wants them, only when /metrics is read.'''
+
+
+def metrics_view():
+    app = current_app._get_current_object()
+    record_stats(get_values(app), app) # include this worker's latest cache and pool numbers
+    body = render(collect(metrics_dir(app)))
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+
+def mark_process_dead(pid, directory):
+    """Fold the counters of a worker that exited into AGGREGATE_FILE and delete its file; call it from gunicorn's
+    child_exit hook, which runs in the master, the only process that writes AGGREGATE_FILE.
+
+    Counters keep counting in the aggregate so that totals never go down; gauges are dropped.
+    """
+    path = os.path.join(directory, f'{pid}.values')
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return
+    aggregate = MmapValues(os.path.join(directory, AGGREGATE_FILE))
+    try:
+        for key, value, offset in read_entries(data):
+            if not is_gauge(key):
+                aggregate.inc(key, value)
+    finally:
+        aggregate.close()
+    os.remove(path)
+
+
+def clear_metrics(directory):
+    """Delete every values file; call it from gunicorn's on_starting hook so a restart begins from zero."""
+    for filename in os.listdir(directory) if os.path.isdir(directory) else ():
+        if filename.endswith('.values'):
+            os.remove(os.path.join(directory, filename))
+
+'''Without the child_exit hook every worker that ever ran leaves a file of at least 64KB behind, and collect() reads
+them all on every scrape. Folding a dead worker into the aggregate file keeps the directory at one file per live
+worker plus one. A scrape that lands between the fold and the delete counts that worker twice, once.'''
+
+
+def init_app(app):
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.before_request(start_request)
+    app.after_request(remember_status)
+    app.teardown_request(finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,118 @@
+import functools
+import hashlib
+import os
+from datetime import timezone
+
+from flask import current_app, g, make_response, request, session
+
+from flaskr.cache import make_cache
+from flaskr.db import get_data_version
+
+
+def get_page_cache():
+    return current_app.extensions['flaskr_page_cache']
+
+
+def request_key(version):
+    return (
+        request.endpoint,
+        tuple(sorted((request.view_args or {}).items())),
+        tuple(sorted(request.args.items(multi=True))),
+        version,
+    )
+
+
+def cached_page(view):
+    """Serve anonymous GETs of ``view`` from the page cache while the data version stays the same."""
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        version = get_data_version()
+        if g.user is not None or request.method != 'GET' or '_flashes' in session or version is None:
+            return view(**kwargs)
+
+        cache = get_page_cache()
+        key = ('page',) + request_key(version['version'])
+        hit = cache.get(key)
+        if hit is not None:
+            body, mimetype = hit
+            return current_app.response_class(body, mimetype=mimetype)
+
+        response = make_response(view(**kwargs))
+        if response.status_code == 200:
+            cache.set(key, (response.get_data(), response.mimetype))
+        return response
+
+    return wrapped_view
+
+
+def page_etag(version):
+    user_id = g.user['id'] if g.user is not None else 0
+    return hashlib.sha1(repr(request_key(version['version']) + (user_id,)).encode('utf8')).hexdigest()
+
+
+def conditional_page(view):
+    """Answer GETs whose validators still match with a 304 before ``view`` runs any of its queries."""
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        version = get_data_version()
+        if request.method not in ('GET', 'HEAD') or '_flashes' in session or version is None:
+            return view(**kwargs)
+
+        etag = page_etag(version)
+        last_modified = version['updated'].replace(tzinfo=timezone.utc)
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = request.if_modified_since is not None and request.if_modified_since >= last_modified
+
+        if not_modified:
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(view(**kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True # keep a copy, but ask every time; the answer is usually a 304
+        response.vary.add('Cookie')
+        return response
+
+    return wrapped_view
+
+'''The validators only depend on the URL, who is asking and the data_version row, so checking them costs one primary
+key lookup. The ETag changes whenever data_version.version does, and Last-Modified is the time of that bump, which
+is also what a browser without the ETag compares against with If-Modified-Since.'''
+
+
+def cached_data(name, args, load):
+    """Return ``load()``, cached under ``name`` and ``args`` until the data version changes."""
+    version = get_data_version()
+    if version is None:
+        return load()
+
+    cache = get_page_cache()
+    key = ('data', name, args, version['version'])
+    value = cache.get(key)
+    if value is None:
+        value = load()
+        cache.set(key, value)
+    return value
+
+'''Two layers share the cache. Anonymous visitors all see the same HTML for a URL, so cached_page() keeps the whole
+rendered response. Logged in users see their own name, edit links and which posts they liked, so for them only
+the expensive, user independent part (the posts of a page with counts and tags) is cached by cached_data(), and
+the caller lays the user's own like flags over it with one small query.
+
+Every key contains data_version.version. The write views bump it in the same transaction as their change, which
+makes every older entry unreachable at once; the entries themselves just age out of the LRU (or the TTL).'''
+
+
+def init_app(app):
+    app.extensions['flaskr_page_cache'] = make_cache(
+        app.config['PAGE_CACHE_TYPE'],
+        app.config['PAGE_CACHE_SIZE'],
+        app.config['PAGE_CACHE_TTL'],
+        app.config['PAGE_CACHE_DIR'] or os.path.join(app.instance_path, 'cache'),
+    )
@@ -0,0 +1,158 @@
+import base64
+import binascii
+
+from flask import current_app, request, url_for
+
+from flaskr.cache import LRUCache
+
+
+PER_PAGE = 15
+
+
+def encode_cursor(created, id):
+    raw = f'{created}|{id}'
+    return base64.urlsafe_b64encode(raw.encode('utf8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(value, key_type=str):
+    """Return the (sort key, id) in ``value``, or None when it isn't a cursor whose key ``key_type`` accepts."""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode('utf8')
+        created, id = raw.rsplit('|', 1)
+        return key_type(created), int(id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+'''A keyset (cursor) page remembers the (created, id) of the last row it showed and asks for the rows strictly
+after it, instead of OFFSET-ing past everything before it. With an index on post(created) SQLite seeks straight to
+the cursor and reads per_page + 1 rows, so page 1 and page 10000 cost the same. The extra row tells us whether
+there is another page without a second query.'''
+
+
+class Page(object):
+    def __init__(self, items, number, total, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.number = number
+        self.total = total
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def total_pages(self):
+        return max((self.total + self.per_page - 1) // self.per_page, 1)
+
+    @property
+    def ids(self):
+        return [item['id'] for item in self.items]
+
+    def url(self, cursor, direction, number):
+        args = dict(request.view_args or {})
+        args.update((k, v) for k, v in request.args.items() if k not in ('cursor', 'dir', 'page'))
+        return url_for(request.endpoint, cursor=cursor, dir=direction, page=number, **args)
+
+    @property
+    def next_url(self):
+        if self.next_cursor is None:
+            return None
+        return self.url(self.next_cursor, 'next', self.number + 1)
+
+    @property
+    def prev_url(self):
+        if self.prev_cursor is None:
+            return None
+        return self.url(self.prev_cursor, 'prev', max(self.number - 1, 1))
+
+
+def paginate_posts(db, where='1', params=(), per_page=PER_PAGE, count_key=None):
+    """Return a Page of (id, created) rows from ``post p`` matching ``where``, newest first.
+
+    The cursor, direction and page number are read from the query string.
+    """
+    return paginate_keyset(
+        db, 'post p', 'p.id', 'p.created', where, params, per_page,
+        lambda: count_posts(db, where, params, count_key)
+    )
+
+
+def paginate_keyset(db, source, id_column, sort_column, where='1', params=(), per_page=PER_PAGE, total=None,
+                    columns='', ascending=False, key_type=str):
+    """Return a Page of (id, sort_key) rows from ``source``, newest first, paging on (sort_column, id_column).
+
+    ``total`` is a function returning the number of matching rows, only called when the page is built. ``columns``
+    adds more expressions to the SELECT, ``ascending`` puts the lowest sort_column first (e.g. bm25 scores), and
+    ``key_type`` converts the sort key read back from a cursor; a cursor it rejects counts as no cursor.
+    """
+    cursor = decode_cursor(request.args.get('cursor'), key_type)
+    direction = request.args.get('dir', 'next')
+    number = max(request.args.get('page', 1, type=int), 1)
+
+    forward, backward = ('ASC', 'DESC') if ascending else ('DESC', 'ASC')
+    after, before = ('>', '<') if ascending else ('<', '>')
+    key = f'({sort_column}, {id_column})'
+    sql = f'SELECT {id_column} AS id, {sort_column} AS sort_key{", " + columns if columns else ""}' \
+          f' FROM {source} WHERE ({where})'
+    args = list(params)
+    if cursor is None:
+        number = 1
+        sql += f' ORDER BY {sort_column} {forward}, {id_column} {forward}'
+    elif direction == 'prev':
+        sql += f' AND {key} {before} (?, ?) ORDER BY {sort_column} {backward}, {id_column} {backward}'
+        args.extend(cursor)
+    else:
+        sql += f' AND {key} {after} (?, ?) ORDER BY {sort_column} {forward}, {id_column} {forward}'
+        args.extend(cursor)
+    sql += ' LIMIT ?'
+    args.append(per_page + 1)
+
+    rows = db.execute(sql, args).fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if cursor is not None and direction == 'prev':
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, cursor is not None
+
+    if cursor is not None and direction == 'prev' and not has_prev:
+        number = 1
+
+    next_cursor = encode_cursor(rows[-1]['sort_key'], rows[-1]['id']) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0]['sort_key'], rows[0]['id']) if rows and has_prev else None
+    return Page(rows, number, total() if total else 0, per_page, next_cursor, prev_cursor)
+
+
+def get_count_cache(app=None):
+    app = app or current_app
+    cache = app.extensions.get('flaskr_page_counts')
+    if cache is None:
+        cache = app.extensions.setdefault(
+            'flaskr_page_counts', LRUCache(app.config['PAGE_COUNT_CACHE_SIZE'], app.config['PAGE_COUNT_TTL'])
+        )
+    return cache
+
+
+def count_posts(db, where='1', params=(), key=None):
+    """Count the posts matching ``where``, caching the result for PAGE_COUNT_TTL seconds."""
+    cache = get_count_cache()
+    key = (key or where, tuple(params))
+
+    total = cache.get(key)
+    if total is None:
+        total = db.execute(f'SELECT count(*) FROM post p WHERE ({where})', tuple(params)).fetchone()[0]
+        cache.set(key, total)
+    return total
+
+
+def invalidate_counts():
+    cache = current_app.extensions.get('flaskr_page_counts')
+    if cache is not None:
+        cache.clear()
+
+'''The total count is only used for the "page x of y" label, so it is fine for it to be a little stale. Each worker
+process keeps its own copy; writes made through this process clear it right away, writes made by other workers show
+up once PAGE_COUNT_TTL runs out. Search counts are keyed by the query text, which is why the cache is an LRU with
+room for PAGE_COUNT_CACHE_SIZE totals rather than a dict any client could grow by searching for new words.'''
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HashPool(object):
+    """A few threads for password hashing, refusing new work once ``workers + queue_size`` jobs are waiting."""
+
+    def __init__(self, workers, queue_size, timeout):
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self.rejected = 0
+        self.timed_out = 0
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='flaskr-passwords')
+
+    def run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise ServiceUnavailable('Too many sign ins at once, please try again in a moment.', retry_after=1)
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError: # concurrent.futures' own class, only an alias of the builtin from Python 3.11
+            future.cancel() # still queued: drop it; already hashing: it finishes and frees its slot
+            self.timed_out += 1
+            raise ServiceUnavailable('Signing in is taking too long, please try again in a moment.', retry_after=1)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+'''hashlib's pbkdf2_hmac and scrypt drop the GIL while they work, so hashing on a thread really does leave the
+request threads free to serve pages. What the pool adds is a bound: a burst of logins queues up to
+PASSWORD_HASH_QUEUE jobs and everything beyond that gets an immediate 503 with Retry-After instead of piling
+up behind a KDF that is slow on purpose. A job that waits longer than PASSWORD_HASH_TIMEOUT is answered the same
+way.'''
+
+
+def get_hash_pool(app=None):
+    app = app or current_app
+    pool = app.extensions.get('flaskr_password_pool')
+    if pool is None or pool.pid != os.getpid():
+        pool = app.extensions['flaskr_password_pool'] = HashPool(
+            app.config['PASSWORD_HASH_WORKERS'], app.config['PASSWORD_HASH_QUEUE'], app.config['PASSWORD_HASH_TIMEOUT']
+        )
+    return pool
+
+
+def hash_password(password):
+    return get_hash_pool().run(generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def verify_password(stored, password):
+    return get_hash_pool().run(check_password_hash, stored, password)
+
+
+def hash_method(stored):
+    return stored.split('$', 1)[0]
+
+
+def current_method(app=None):
+    """The method prefix hashes made now start with, e.g. 'scrypt:32768:8:1' for PASSWORD_HASH_METHOD='scrypt'."""
+    app = app or current_app
+    method = app.config['PASSWORD_HASH_METHOD']
+    expanded = app.extensions.setdefault('flaskr_password_methods', {})
+    if method not in expanded:
+        expanded[method] = expand_method(method)
+    return expanded[method]
+
+
+def expand_method(method):
+    # the defaults werkzeug fills in, see werkzeug.security._hash_internal
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return f'scrypt:{2 ** 15}:8:1'
+    if name == 'pbkdf2' and len(args) < 2:
+        return f'pbkdf2:{args[0] if args else "sha256"}:{DEFAULT_PBKDF2_ITERATIONS}'
+    if name in ('scrypt', 'pbkdf2'):
+        return method
+    # anything else is for werkzeug to accept or reject, off the request thread
+    return hash_method(get_hash_pool().run(generate_password_hash, '', method))
+
+'''A scrypt hash costs as much as a login, so the prefix is worked out from the method string rather than by hashing
+on the request thread; the result is kept per app, as PASSWORD_HASH_METHOD rarely changes.'''
+
+
+def needs_rehash(stored):
+    return hash_method(stored) != current_method()
+
+
+def time_hashes(method, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        generate_password_hash('correct horse battery staple', method)
+    return (time.perf_counter() - started) / rounds
+
+
+@click.command('password-benchmark')
+@click.option('--rounds', default=5, show_default=True, help='Hashes timed per method.')
+@click.option('--method', 'methods', multiple=True, help='Methods to time besides PASSWORD_HASH_METHOD.')
+@with_appcontext
+def password_benchmark_command(rounds, methods):
+    """Time password hashing and the logins per second the hash pool can take."""
+    config = current_app.config
+    methods = (config['PASSWORD_HASH_METHOD'],) + tuple(
+        method for method in methods if method != config['PASSWORD_HASH_METHOD']
+    )
+    for method in methods:
+        seconds = time_hashes(method, rounds)
+        click.echo(f'{method:32} {seconds * 1000:8.1f} ms per hash')
+
+    pool = HashPool(config['PASSWORD_HASH_WORKERS'], rounds * config['PASSWORD_HASH_WORKERS'], None)
+    jobs = rounds * config['PASSWORD_HASH_WORKERS']
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=pool.run, args=(generate_password_hash, 'x', config['PASSWORD_HASH_METHOD']))
+        for _ in range(jobs)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    pool.shutdown()
+    click.echo(f'{jobs / elapsed:.1f} hashes per second with {config["PASSWORD_HASH_WORKERS"]} workers')
+
+
+def init_app(app):
+    app.cli.add_command(password_benchmark_command)
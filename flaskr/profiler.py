@@ -0,0 +1,124 @@
+import collections
+import os
+import random
+import re
+import sys
+import threading
+
+import click
+from flask import current_app, g, request
+from flask.cli import with_appcontext
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+
+class StackSampler(object):
+    """Counts the Python stacks a thread is in, looking at it every ``interval`` seconds from another thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='flaskr-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[collapse(frame)] += 1
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f'{frame.f_globals.get("__name__", "?")}:{getattr(code, "co_qualname", code.co_name)}'
+
+
+def collapse(frame):
+    """'outermost;...;innermost' for the stack ending at ``frame``, the line format flamegraph.pl reads."""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame).replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+'''A sampler only costs the profiled request a few microseconds every PROFILE_INTERVAL (reading the other thread's
+frame needs the GIL), unlike cProfile, which hooks every single function call and makes SQL-light, call-heavy code
+like Jinja rendering look several times slower than it is. Requests that are not picked pay one random() call.'''
+
+
+def get_serializer(app=None):
+    app = app or current_app
+    return URLSafeTimedSerializer(app.secret_key, salt='flaskr-profile')
+
+
+def wants_profile():
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    if rate and random.random() * rate < 1:
+        return True
+
+    token = request.headers.get(current_app.config['PROFILE_HEADER'])
+    if token:
+        try:
+            get_serializer().loads(token, max_age=current_app.config['PROFILE_TOKEN_MAX_AGE'])
+            return True
+        except BadSignature:
+            current_app.logger.info('Ignoring a bad %s header', current_app.config['PROFILE_HEADER'])
+    return False
+
+
+def profiles_dir(app):
+    return app.config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles')
+
+
+def start_profile():
+    if wants_profile():
+        g.profiler = StackSampler(threading.get_ident(), current_app.config['PROFILE_INTERVAL']).start()
+
+
+def finish_profile(exc=None):
+    sampler = g.pop('profiler', None)
+    if sampler is None:
+        return
+    counts = sampler.stop()
+    if counts:
+        write_stacks(profiles_dir(current_app), request.endpoint or 'none', counts)
+
+
+def write_stacks(directory, endpoint, counts):
+    """Append ``counts`` to the collapsed stacks file of ``endpoint``."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, re.sub(r'[^\w.-]', '_', endpoint) + '.folded')
+    data = ''.join(f'{stack} {count}\n' for stack, count in counts.items()).encode('utf8')
+    # one write() on an O_APPEND file, so lines from concurrent requests and workers don't interleave
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+'''Each file grows by one block of "stack count" lines per profiled request; flamegraph.pl and speedscope add up
+repeated stacks themselves, e.g. `flamegraph.pl instance/profiles/blog.index.folded > index.svg`.'''
+
+
+@click.command('profile-token')
+@with_appcontext
+def profile_token_command():
+    """Print a token that gets a request profiled when sent in the PROFILE_HEADER header."""
+    click.echo(get_serializer().dumps('profile'))
+
+
+def init_app(app):
+    app.cli.add_command(profile_token_command)
+    if not app.config['PROFILE_SAMPLE_RATE'] and not app.config['PROFILE_HEADER']:
+        return
+    app.before_request(start_profile)
+    app.teardown_request(finish_profile)
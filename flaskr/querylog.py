@@ -0,0 +1,195 @@
+import collections
+import time
+
+from flask import current_app, g, has_request_context, jsonify, request
+
+
+class QueryLog(object):
+    """The statements one request ran, as dicts with ``sql``, ``params``, ``duration`` (seconds) and ``rows``."""
+
+    def __init__(self):
+        self.queries = []
+
+    def add(self, sql, params, duration, rows=0):
+        query = {'sql': sql, 'params': params, 'duration': duration, 'rows': rows}
+        self.queries.append(query)
+        return query
+
+    def __len__(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(query['duration'] for query in self.queries)
+
+    def slow(self, threshold):
+        return [query for query in self.queries if query['duration'] >= threshold]
+
+    def repeated(self, threshold):
+        """Return [(sql, count)] for statements run at least ``threshold`` times with different parameters."""
+        params = collections.defaultdict(set)
+        counts = collections.Counter()
+        for query in self.queries:
+            counts[query['sql']] += 1
+            params[query['sql']].add(repr(query['params']))
+        return [(sql, count) for sql, count in counts.most_common() if count >= threshold and len(params[sql]) > 1]
+
+'''Running the same statement again and again with only the parameters changing is what an N+1 looks like from the
+database side: a loop in Python doing one query per item where a single IN (...) or JOIN would do.'''
+
+
+class InstrumentedCursor(object):
+    """Wraps a sqlite3.Cursor, adding the time spent fetching and the rows fetched to the statement's entry."""
+
+    def __init__(self, cursor, query):
+        self._cursor = cursor
+        self._query = query
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _timed(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._query['duration'] += time.perf_counter() - started
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        self._query['rows'] += row is not None
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._timed(self._cursor.fetchmany, *args)
+        self._query['rows'] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._query['rows'] += len(rows)
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self._timed(next, self._cursor)
+        self._query['rows'] += 1
+        return row
+
+
+class InstrumentedConnection(object):
+    """Stands in for the request's connection and records every statement run through it in ``log``."""
+
+    def __init__(self, db, log):
+        self._db = db
+        self._log = log
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        cursor = self._db.execute(sql, params) # sqlite runs the statement up to its first row here
+        query = self._log.add(sql, params, time.perf_counter() - started)
+        return InstrumentedCursor(cursor, query)
+
+    def executemany(self, sql, seq_of_params):
+        started = time.perf_counter()
+        cursor = self._db.executemany(sql, seq_of_params)
+        self._log.add(sql, '<many>', time.perf_counter() - started, max(cursor.rowcount, 0))
+        return cursor
+
+    def executescript(self, script):
+        started = time.perf_counter()
+        cursor = self._db.executescript(script)
+        self._log.add(script, (), time.perf_counter() - started)
+        return cursor
+
+
+def get_query_log():
+    if 'query_log' not in g:
+        g.query_log = QueryLog()
+    return g.query_log
+
+
+def instrument(db):
+    """Wrap ``db`` so that the current request records its queries, if SQL_RECORD_QUERIES is on."""
+    if not current_app.config['SQL_RECORD_QUERIES'] or not has_request_context():
+        return db
+    return InstrumentedConnection(db, get_query_log())
+
+
+def add_query_headers(response):
+    log = g.get('query_log')
+    if log is not None and current_app.config['SQL_QUERY_HEADERS']:
+        total_ms = log.total_time * 1000
+        response.headers['X-Query-Count'] = str(len(log))
+        response.headers['X-Query-Time'] = f'{total_ms:.2f}'
+        response.headers.add('Server-Timing', f'db;dur={total_ms:.2f};desc="{len(log)} queries"')
+    return response
+
+
+def report_queries(exc=None):
+    log = g.get('query_log')
+    if log is None:
+        return
+
+    config = current_app.config
+    where = f'{request.method} {request.full_path.rstrip("?")}'
+    for query in log.slow(config['SQL_SLOW_QUERY_MS'] / 1000):
+        params = _short(query['params']) if config['SQL_LOG_PARAMS'] else _placeholder(query['params'])
+        current_app.logger.warning(
+            'Slow query (%.1f ms, %d rows) in %s: %s %s',
+            query['duration'] * 1000, query['rows'], where, ' '.join(query['sql'].split()), params
+        )
+    repeated = log.repeated(config['SQL_N_PLUS_ONE_THRESHOLD'])
+    for sql, count in repeated:
+        current_app.logger.warning('Possible N+1 in %s: ran %d times: %s', where, count, ' '.join(sql.split()))
+
+    history = current_app.extensions.get('flaskr_query_history')
+    if history is not None:
+        history.append({
+            'request': where,
+            'endpoint': request.endpoint,
+            'count': len(log),
+            'time_ms': round(log.total_time * 1000, 3),
+            'repeated': [{'sql': sql, 'count': count} for sql, count in repeated],
+            'queries': [
+                {
+                    'sql': ' '.join(query['sql'].split()),
+                    'params': _short(query['params']),
+                    'time_ms': round(query['duration'] * 1000, 3),
+                    'rows': query['rows'],
+                }
+                for query in log.queries
+            ],
+        })
+
+
+def _short(params, limit=200):
+    text = repr(params)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def _placeholder(params):
+    # parameters carry password hashes, post and comment bodies and search text, none of which belong in a log
+    if isinstance(params, str):
+        return params # '<many>' from executemany
+    return f'<{len(params)} params>'
+
+
+def recent_queries():
+    """The queries of the last SQL_HISTORY_SIZE requests, newest first."""
+    history = current_app.extensions['flaskr_query_history']
+    return jsonify(list(reversed(history)))
+
+
+def init_app(app):
+    app.after_request(add_query_headers)
+    app.teardown_request(report_queries)
+    if app.config['SQL_DEBUG_ENDPOINT']:
+        # lists statements and their parameters, so only for development
+        app.extensions['flaskr_query_history'] = collections.deque(maxlen=app.config['SQL_HISTORY_SIZE'])
+        app.add_url_rule('/_debug/queries', 'recent_queries', recent_queries)
@@ -0,0 +1,67 @@
+import hashlib
+
+import click
+import markdown
+from flask import current_app
+from flask.cli import with_appcontext
+
+from flaskr.cache import LRUCache
+from flaskr.db import bump_data_version, get_db, migrate_db
+
+
+def render_markdown(body):
+    cache = current_app.extensions['flaskr_markdown_cache']
+    key = hashlib.sha1(body.encode('utf8')).hexdigest()
+
+    html = cache.get(key)
+    if html is None:
+        html = markdown.markdown(body)
+        cache.set(key, html)
+    return html
+
+'''post.body_html holds the rendered HTML written by create() and update(), so normally nothing gets rendered
+while serving a page. The LRU cache above only covers rows whose body_html is still NULL (posts written before the
+column existed, or by other tools); it is keyed by a hash of the markdown source, so an edited body never hits a
+stale entry.'''
+
+
+def rerender_markdown(missing_only=False, batch_size=500):
+    db = get_db()
+    last_id = 0
+    count = 0
+
+    while True:
+        rows = db.execute(
+            'SELECT id, body FROM post WHERE id > ?'
+            + (' AND body_html IS NULL' if missing_only else '')
+            + ' ORDER BY id LIMIT ?',
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+
+        db.executemany(
+            'UPDATE post SET body_html = ? WHERE id = ?',
+            [(markdown.markdown(row['body']), row['id']) for row in rows]
+        )
+        bump_data_version(db)
+        db.commit()
+        last_id = rows[-1]['id']
+        count += len(rows)
+
+    return count
+
+
+@click.command('rerender-markdown')
+@click.option('--missing-only', is_flag=True, help='Only render posts that have no stored HTML yet.')
+@with_appcontext
+def rerender_markdown_command(missing_only):
+    """Render every post's markdown body into post.body_html."""
+    migrate_db()
+    count = rerender_markdown(missing_only)
+    click.echo(f'Rendered {count} posts.')
+
+
+def init_app(app):
+    app.extensions['flaskr_markdown_cache'] = LRUCache(app.config['MARKDOWN_CACHE_SIZE'])
+    app.cli.add_command(rerender_markdown_command)
@@ -13,6 +13,9 @@ CREATE TABLE IF NOT EXISTS post (
   created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   title TEXT NOT NULL,
   body TEXT NOT NULL,
+  body_html TEXT,
+  like_count INTEGER NOT NULL DEFAULT 0,
+  comment_count INTEGER NOT NULL DEFAULT 0,
   FOREIGN KEY (author_id) REFERENCES user (id)
 );
 
@@ -38,7 +41,8 @@ CREATE TABLE IF NOT EXISTS comments(
 
 CREATE TABLE IF NOT EXISTS tags(
   id INTEGER PRIMARY KEY AUTOINCREMENT,
-  tag text NOT NULL
+  tag text NOT NULL,
+  post_count INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE TABLE IF NOT EXISTS post_tag(
@@ -56,5 +60,94 @@ CREATE TABLE IF NOT EXISTS images (
     filename TEXT NOT NULL,
     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     status TEXT DEFAULT 'active',
+    width INTEGER,
+    height INTEGER,
     FOREIGN KEY (post_id) REFERENCES posts (id)
-);
\ No newline at end of file
+);
+
+-- Resized WebP copies of an upload, made in the background by flaskr/images.py.
+CREATE TABLE IF NOT EXISTS image_variants (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    image_id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    FOREIGN KEY (image_id) REFERENCES images (id)
+);
+
+-- A single row whose version goes up with every write that changes what a page shows.
+-- Cached pages are keyed by it (see flaskr/pagecache.py), so bumping it invalidates them all.
+CREATE TABLE IF NOT EXISTS data_version (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL,
+  updated TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0);
+
+-- Secondary indexes for the columns the views join, filter and sort on. likes(post_id) is
+-- already covered by the UNIQUE(post_id, user_id) index. `flask db-explain` checks that the
+-- queries in blog.py and auth.py keep using them.
+CREATE INDEX IF NOT EXISTS post_created ON post (created);
+CREATE INDEX IF NOT EXISTS post_author ON post (author_id);
+CREATE INDEX IF NOT EXISTS comments_post_created ON comments (post_id, created);
+CREATE INDEX IF NOT EXISTS images_post ON images (post_id);
+CREATE INDEX IF NOT EXISTS images_filename ON images (filename);
+CREATE INDEX IF NOT EXISTS image_variants_image ON image_variants (image_id, width);
+CREATE UNIQUE INDEX IF NOT EXISTS tags_tag_unique ON tags (tag);
+CREATE INDEX IF NOT EXISTS post_tag_tag_created ON post_tag (tag_id, created DESC, post_id DESC);
+CREATE INDEX IF NOT EXISTS tags_post_count ON tags (post_count DESC, tag);
+
+-- like_count / comment_count on post are kept up to date by these triggers, so the read
+-- queries never have to count likes or comments. `flask rebuild-counters` recomputes them.
+CREATE TRIGGER IF NOT EXISTS likes_count_insert AFTER INSERT ON likes BEGIN
+  UPDATE post SET like_count = like_count + 1 WHERE id = NEW.post_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS likes_count_delete AFTER DELETE ON likes BEGIN
+  UPDATE post SET like_count = like_count - 1 WHERE id = OLD.post_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_count_insert AFTER INSERT ON comments BEGIN
+  UPDATE post SET comment_count = comment_count + 1 WHERE id = NEW.post_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_count_delete AFTER DELETE ON comments BEGIN
+  UPDATE post SET comment_count = comment_count - 1 WHERE id = OLD.post_id;
+END;
+
+-- Full-text index over post titles and bodies used by /search. The post table holds the
+-- text (content='post'); the triggers keep the index in step with it.
+CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(
+  title, body, content='post', content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS post_fts_insert AFTER INSERT ON post BEGIN
+  INSERT INTO post_fts(rowid, title, body) VALUES (NEW.id, NEW.title, NEW.body);
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_fts_delete AFTER DELETE ON post BEGIN
+  INSERT INTO post_fts(post_fts, rowid, title, body) VALUES ('delete', OLD.id, OLD.title, OLD.body);
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_fts_update AFTER UPDATE OF title, body ON post BEGIN
+  INSERT INTO post_fts(post_fts, rowid, title, body) VALUES ('delete', OLD.id, OLD.title, OLD.body);
+  INSERT INTO post_fts(rowid, title, body) VALUES (NEW.id, NEW.title, NEW.body);
+END;
+
+-- The tag read model: post_tag.created is a copy of the post's created time, so a tag page is a
+-- range of the post_tag_tag_created index, and tags.post_count is kept up to date for the tag
+-- cloud and the page count. Deleting a post removes its post_tag rows, which fixes the counts.
+CREATE TRIGGER IF NOT EXISTS post_tag_insert AFTER INSERT ON post_tag BEGIN
+  UPDATE post_tag SET created = COALESCE((SELECT created FROM post WHERE id = NEW.post_id), NEW.created)
+    WHERE post_id = NEW.post_id AND tag_id = NEW.tag_id;
+  UPDATE tags SET post_count = post_count + 1 WHERE id = NEW.tag_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_tag_delete AFTER DELETE ON post_tag BEGIN
+  UPDATE tags SET post_count = post_count - 1 WHERE id = OLD.tag_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_delete_tags AFTER DELETE ON post BEGIN
+  DELETE FROM post_tag WHERE post_id = OLD.id;
+END;
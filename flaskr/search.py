@@ -0,0 +1,78 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from markupsafe import escape
+
+from flaskr.db import get_db, migrate_db
+from flaskr.pagination import PER_PAGE, Page, count_posts, paginate_keyset
+
+
+def fts_query(text):
+    # Quote every word so that user input can't be parsed as FTS5 syntax (AND, NEAR, column filters, ...),
+    # and let the last word match as a prefix so results show up while someone is still typing.
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+
+def search_posts(db, text, per_page=PER_PAGE):
+    """Return a Page of post ids matching ``text``, best bm25 match first, with a highlighted snippet for each."""
+    match = fts_query(text)
+    if not match:
+        return Page([], 1, 0, per_page)
+
+    candidates = current_app.config['SEARCH_CANDIDATES']
+
+    # the oldest post among the newest `candidates` matches; only posts from there on get ranked
+    oldest = db.execute(
+        'SELECT rowid FROM post_fts WHERE post_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?',
+        (match, candidates - 1)
+    ).fetchone()
+
+    pagination = paginate_keyset(
+        db, 'post_fts', 'rowid', 'bm25(post_fts, 10.0, 1.0)', 'post_fts MATCH ? AND rowid >= ?',
+        (match, oldest[0] if oldest else 0), per_page,
+        lambda: count_posts(
+            db, 'p.id IN (SELECT rowid FROM post_fts WHERE post_fts MATCH ? LIMIT ?)', (match, candidates), 'search'
+        ),
+        columns="snippet(post_fts, 1, char(2), char(3), '...', 24) AS snippet", ascending=True, key_type=float,
+    )
+    pagination.items = [{'id': row['id'], 'snippet': highlight(row['snippet'])} for row in pagination.items]
+    return pagination
+
+
+def highlight(snippet):
+    # snippet() returns raw post text, so escape it first and only then turn the \x02/\x03 markers into tags.
+    return str(escape(snippet)).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+'''post_fts is an external-content FTS5 table: it stores only the inverted index and reads title/body back from
+post when it needs them. The triggers in schema.sql keep it in step with every INSERT, UPDATE and DELETE on post.
+bm25() is lower for better matches, which is why results are sorted ascending. Paging uses the same kind of cursor
+as flaskr/pagination.py, only on (score, id) instead of (created, id).
+
+Scoring has to look at every row it ranks, so only the newest SEARCH_CANDIDATES matches are ranked and paged; a
+word found in 70,000 posts costs about what a word found in 1,000 does, and older matches of such a word are not
+shown (the total says at most SEARCH_CANDIDATES too). Words with fewer matches are ranked in full. FTS5 finds the
+cut-off with an OFFSET walk down the rowids and answers `rowid >= ?` by seeking, and snippet() is only worked out
+for the rows on the page. What is left that grows with the corpus is the prefix match on the last word: FTS5
+reads the whole doclist of every word a prefix expands to, about 3ms per statement for a word in 70,000 posts.'''
+
+
+def rebuild_search_index():
+    db = get_db()
+    db.execute("INSERT INTO post_fts(post_fts) VALUES('rebuild')")
+    db.commit()
+
+
+@click.command('rebuild-search')
+@with_appcontext
+def rebuild_search_command():
+    """Rebuild the full-text search index from the post table."""
+    migrate_db()
+    rebuild_search_index()
+    click.echo('Rebuilt the search index.')
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_search_command)
@@ -0,0 +1,24 @@
+// "More comments" fetches the next page as an HTML fragment and puts it where the link was; the fragment ends with
+// the link to the page after it. Without fetch, or when the request fails, the link opens the post at that page.
+
+function loadMoreComments(link) {
+  if (!window.fetch || !link.dataset.moreUrl) {
+    return true;
+  }
+  if (link.dataset.busy) {
+    return false;
+  }
+  link.dataset.busy = '1';
+
+  fetch(link.dataset.moreUrl, {credentials: 'same-origin'}).then(function (response) {
+    if (!response.ok) {
+      throw new Error(response.status);
+    }
+    return response.text();
+  }).then(function (html) {
+    link.closest('.more-comments').outerHTML = html;
+  }).catch(function () {
+    window.location = link.href;
+  });
+  return false;
+}
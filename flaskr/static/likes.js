@@ -0,0 +1,40 @@
+// Likes update in place: the heart posts to the JSON endpoint and only the heart and its count change.
+// Without fetch, or when the request fails (e.g. logged out), the hidden form is submitted as before.
+
+function submitForm(post_id) {
+  document.getElementById('likeForm-' + post_id).submit();
+}
+
+function toggleLike(heart, post_id) {
+  if (!window.fetch || !heart.dataset.likeUrl) {
+    submitForm(post_id);
+    return;
+  }
+  if (heart.dataset.busy) {
+    return;
+  }
+  heart.dataset.busy = '1';
+
+  var body = new FormData();
+  body.append('liked', heart.classList.contains('liked') ? '0' : '1');
+
+  fetch(heart.dataset.likeUrl, {
+    method: 'POST',
+    body: body,
+    credentials: 'same-origin',
+    headers: {'Accept': 'application/json'}
+  }).then(function (response) {
+    if (!response.ok) {
+      throw new Error(response.status);
+    }
+    return response.json();
+  }).then(function (data) {
+    heart.classList.toggle('liked', data.liked);
+    heart.classList.toggle('like_illa', !data.liked);
+    heart.querySelector('#count_likes').textContent = ' ' + data.likes;
+  }).catch(function () {
+    submitForm(post_id);
+  }).finally(function () {
+    delete heart.dataset.busy;
+  });
+}
@@ -0,0 +1,68 @@
+from flaskr.pagination import PER_PAGE, Page, paginate_keyset
+
+
+def parse_tags(text):
+    # "#flask #python #flask" -> ['flask', 'python']
+    names = []
+    for name in (text or '').split('#'):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def add_post_tags(db, post_id, names):
+    """Attach the tags called ``names`` to a post, creating missing tags. Does not commit."""
+    if not names:
+        return []
+
+    db.executemany('INSERT INTO tags (tag) VALUES (?) ON CONFLICT (tag) DO NOTHING', [(name,) for name in names])
+    placeholders = ','.join('?' * len(names))
+    tag_ids = [row[0] for row in db.execute(f'SELECT id FROM tags WHERE tag IN ({placeholders})', names)]
+    db.executemany(
+        'INSERT OR IGNORE INTO post_tag (post_id, tag_id) VALUES (?, ?)',
+        [(post_id, tag_id) for tag_id in tag_ids]
+    )
+    return tag_ids
+
+'''Three statements however many tags there are: insert whatever tags are new (the unique index on tags.tag turns
+the rest into no-ops), read all of their ids back in one go, and link them to the post. executemany() can't hand
+back RETURNING rows, which is why the ids come from a single SELECT ... IN instead.'''
+
+
+def set_post_tags(db, post_id, names):
+    """Make ``names`` the exact set of tags of a post. Does not commit."""
+    placeholders = ','.join('?' * len(names))
+    db.execute(
+        f'DELETE FROM post_tag WHERE post_id = ? AND tag_id NOT IN (SELECT id FROM tags WHERE tag IN ({placeholders}))',
+        (post_id, *names)
+    )
+    return add_post_tags(db, post_id, names)
+
+
+def post_tag_names(db, post_id):
+    return [row['tag'] for row in db.execute(
+        'SELECT t.tag FROM post_tag pt JOIN tags t ON t.id = pt.tag_id WHERE pt.post_id = ? ORDER BY t.tag', (post_id,)
+    )]
+
+
+def paginate_tag(db, tag_name, per_page=PER_PAGE):
+    """Return a Page of the ids of the posts tagged ``tag_name``, newest first."""
+    tag = db.execute('SELECT id, post_count FROM tags WHERE tag = ?', (tag_name,)).fetchone()
+    if tag is None:
+        return Page([], 1, 0, per_page)
+    return paginate_keyset(
+        db, 'post_tag pt', 'pt.post_id', 'pt.created', 'pt.tag_id = ?', (tag['id'],), per_page,
+        lambda: tag['post_count']
+    )
+
+
+def tag_cloud(db, limit=100):
+    return db.execute(
+        'SELECT tag, post_count FROM tags WHERE post_count > 0 ORDER BY post_count DESC, tag LIMIT ?', (limit,)
+    ).fetchall()
+
+'''A tag page never touches the post table to find its posts: post_tag rows carry a copy of the post's created time
+(set by a trigger in schema.sql), so the page is a range scan of post_tag_tag_created that stops after per_page + 1
+rows, and the total comes from tags.post_count instead of a COUNT. The cost depends on the page size, not on how
+many posts the tag has.'''
@@ -0,0 +1,309 @@
+import json
+import os
+import shutil
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from flaskr.db import bump_data_version, get_db, migrate_db
+from flaskr.pagination import invalidate_counts
+
+
+DATA_FILE = 'data.jsonl'
+UPLOADS_DIR = 'uploads'
+BATCH_SIZE = 5000
+
+# What `flask export` writes, parents before children so that `flask import` can insert the records in file order.
+# The counters (post.like_count, post.comment_count, tags.post_count) and post_tag.created are left out on purpose:
+# the triggers in schema.sql fill them in again as the rows go in.
+TABLES = (
+    ('user', ('id', 'username', 'password')),
+    ('post', ('id', 'author_id', 'created', 'title', 'body', 'body_html')),
+    ('tags', ('id', 'tag')),
+    ('post_tag', ('post_id', 'tag_id')),
+    ('likes', ('id', 'post_id', 'user_id', 'created')),
+    ('comments', ('id', 'comment', 'post_id', 'user_id', 'created')),
+    ('images', ('id', 'post_id', 'filename', 'upload_date', 'status', 'width', 'height')),
+    ('image_variants', ('id', 'image_id', 'filename', 'width', 'height')),
+)
+COLUMNS = dict(TABLES)
+
+# The columns holding ids, and the table each id belongs to. A merge moves every id by the same offset per table.
+REFERENCES = {
+    'user': {'id': 'user'},
+    'post': {'id': 'post', 'author_id': 'user'},
+    'tags': {'id': 'tags'},
+    'post_tag': {'post_id': 'post', 'tag_id': 'tags'},
+    'likes': {'id': 'likes', 'post_id': 'post', 'user_id': 'user'},
+    'comments': {'id': 'comments', 'post_id': 'post', 'user_id': 'user'},
+    'images': {'id': 'images', 'post_id': 'post'},
+    'image_variants': {'id': 'image_variants', 'image_id': 'images'},
+}
+
+# Unique columns that identify a row across databases; a merge reuses the existing row instead of adding a second.
+NATURAL_KEYS = {'user': 'username', 'tags': 'tag'}
+
+# Tables whose rows point at a file in UPLOAD_FOLDER.
+FILE_TABLES = ('images', 'image_variants')
+
+
+def iter_table(db, table, batch_size=BATCH_SIZE):
+    """Yield every row of ``table`` in rowid order, reading ``batch_size`` rows at a time."""
+    columns = ', '.join(COLUMNS[table])
+    last_rowid = 0
+    while True:
+        rows = db.execute(
+            f'SELECT rowid AS _rowid, {columns} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?',
+            (last_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_rowid = rows[-1]['_rowid']
+
+
+def copy_file(source_folder, target_folder, filename):
+    """Copy ``filename`` unless the target already has it. Returns False when the source file is missing."""
+    target = os.path.join(target_folder, filename)
+    if os.path.exists(target):
+        return True
+    source = os.path.join(source_folder, filename)
+    if not os.path.isfile(source):
+        return False
+    temp_path = target + '.part'
+    shutil.copyfile(source, temp_path)
+    os.replace(temp_path, target)
+    return True
+
+
+def export_data(directory, batch_size=BATCH_SIZE, with_files=True, progress=None):
+    """Write every table in TABLES to ``directory``/data.jsonl, one JSON object per row, and copy the uploads
+    the images refer to into ``directory``/uploads. Returns the number of rows written per table.
+    """
+    db = get_db()
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    files_folder = os.path.join(directory, UPLOADS_DIR)
+    os.makedirs(files_folder if with_files else directory, exist_ok=True)
+
+    path = os.path.join(directory, DATA_FILE)
+    temp_path = path + '.part'
+    counts = {}
+    missing = 0
+
+    db.execute('BEGIN') # one read transaction, so that all tables come from the same snapshot
+    try:
+        with open(temp_path, 'w', encoding='utf8') as out:
+            for table, columns in TABLES:
+                counts[table] = 0
+                for row in iter_table(db, table, batch_size):
+                    record = {'type': table}
+                    record.update((column, row[column]) for column in columns)
+                    out.write(json.dumps(record, default=str, ensure_ascii=False) + '\n')
+                    if with_files and table in FILE_TABLES:
+                        if not copy_file(upload_folder, files_folder, row['filename']):
+                            missing += 1
+                    counts[table] += 1
+                    if progress is not None:
+                        progress(1)
+    finally:
+        db.rollback()
+
+    os.replace(temp_path, path)
+    if missing:
+        current_app.logger.warning('%d uploads referenced by images were not found in %s', missing, upload_folder)
+    return counts
+
+
+def read_state(state_path):
+    """The progress of an interrupted import: the byte offset reached, and for a merge the id offsets and the
+    rows that were matched to existing ones."""
+    state = {'offset': 0, 'merge': False, 'id_offsets': {}, 'matched': {}}
+    if state_path is not None:
+        try:
+            with open(state_path) as f:
+                state.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+    # JSON object keys are strings
+    state['matched'] = {table: {int(old): new for old, new in ids.items()} for table, ids in state['matched'].items()}
+    return state
+
+
+def write_state(state_path, state):
+    temp_path = state_path + '.part'
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, state_path)
+
+
+def is_empty(db):
+    return not any(db.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone() for table, columns in TABLES)
+
+
+def import_data(directory, batch_size=BATCH_SIZE, with_files=True, resume=True, progress=None, merge=False):
+    """Insert the records of ``directory``/data.jsonl, committing every ``batch_size`` records.
+
+    The database has to be empty unless ``merge`` is set. A merge moves the imported ids past the ones already
+    taken, rewriting the references to them, and reuses existing users and tags with the same username or name.
+
+    After each commit the byte offset reached is saved next to the data file, and a later run starts from there
+    (unless ``resume`` is False). Rows whose id is already taken are skipped, so replaying records is harmless.
+    Returns ({table: imported}, {table: skipped}).
+    """
+    db = get_db()
+    path = os.path.join(directory, DATA_FILE)
+    state_path = path + '.progress'
+    files_folder = os.path.join(directory, UPLOADS_DIR)
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    state = read_state(state_path if resume else None)
+    start = state['offset']
+
+    if not start:
+        if not merge and not is_empty(db):
+            raise ValueError('The database already has data; use merge to add the import to it.')
+        state['merge'] = merge
+        if merge:
+            state['id_offsets'] = {
+                name: db.execute(f'SELECT coalesce(max(id), 0) FROM {name}').fetchone()[0]
+                for name, columns in TABLES if 'id' in columns
+            }
+    id_offsets = state['id_offsets']
+    matched = state['matched']
+
+    def new_id(name, old):
+        if old is None:
+            return None
+        return matched.get(name, {}).get(old, old + id_offsets.get(name, 0))
+
+    imported = {name: 0 for name, columns in TABLES}
+    skipped = {name: 0 for name, columns in TABLES}
+    table = None
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        columns = COLUMNS[table]
+        references = REFERENCES[table]
+        records = batch
+        key = NATURAL_KEYS.get(table)
+        if state['merge'] and key is not None:
+            existing = dict(db.execute(
+                f'SELECT {key}, id FROM {table} WHERE {key} IN ({", ".join("?" * len(batch))})',
+                [record[key] for record in batch]
+            ).fetchall())
+            ids = matched.setdefault(table, {})
+            for record in batch:
+                if record[key] in existing:
+                    ids[record['id']] = existing[record[key]]
+            records = [record for record in batch if record[key] not in existing]
+            skipped[table] += len(batch) - len(records)
+        if with_files and table in FILE_TABLES:
+            for record in records:
+                copy_file(files_folder, upload_folder, record['filename'])
+        cursor = db.executemany(
+            f'INSERT OR IGNORE INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+            [
+                [new_id(references[column], record.get(column)) if column in references else record.get(column)
+                 for column in columns]
+                for record in records
+            ]
+        )
+        imported[table] += cursor.rowcount
+        skipped[table] += len(records) - cursor.rowcount
+        batch.clear()
+
+    def commit(offset):
+        flush()
+        bump_data_version(db)
+        db.commit()
+        state['offset'] = offset
+        write_state(state_path, state)
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        if progress is not None:
+            progress(start)
+        pending = 0
+        for line in f:
+            if progress is not None:
+                progress(len(line))
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            name = record.pop('type', None)
+            if name not in COLUMNS:
+                raise ValueError(f'Unknown record type {name!r} at byte {f.tell() - len(line)}.')
+            if name != table:
+                flush()
+                table = name
+            batch.append(record)
+            pending += 1
+            if pending >= batch_size:
+                commit(f.tell())
+                pending = 0
+        commit(f.tell())
+
+    os.remove(state_path)
+    invalidate_counts()
+    return imported, skipped
+
+'''Both directions stream: export reads each table in rowid ranges of batch_size rows and writes one line per row,
+import reads one line at a time and hands batch_size rows to executemany() inside a single transaction, so memory
+use stays flat however big the blog is, and SQLite only syncs once per batch instead of once per row. The saved
+byte offset is only written after its batch is committed; if an import dies, the next run redoes at most one batch,
+and INSERT OR IGNORE turns the rows that did make it in into no-ops.
+
+Ids are kept as they are, which is only safe in an empty database: with INSERT OR IGNORE a post whose id is taken
+would be skipped while its comments and likes went in, attached to someone else's post. A merge therefore adds
+max(id) of the target table to every id and every reference to it. The offsets, and the users and tags that were
+matched by name, go into the progress file with the byte offset, so a resumed merge maps ids the same way.'''
+
+
+@click.command('export')
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Rows read per query.')
+@click.option('--no-files', is_flag=True, help='Only write data.jsonl, without copying the uploads.')
+@with_appcontext
+def export_command(directory, batch_size, no_files):
+    """Write users, posts, tags, likes, comments and images to DIRECTORY as JSON lines."""
+    db = get_db()
+    total = sum(db.execute(f'SELECT count(*) FROM {table}').fetchone()[0] for table, columns in TABLES)
+    with click.progressbar(length=total, label='Exporting') as bar:
+        counts = export_data(directory, batch_size, not no_files, bar.update)
+    click.echo(f'Exported {sum(counts.values())} rows: '
+               + ', '.join(f'{count} {table}' for table, count in counts.items()) + '.')
+
+
+@click.command('import')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Rows inserted per transaction.')
+@click.option('--no-files', is_flag=True, help='Do not copy the uploads into UPLOAD_FOLDER.')
+@click.option('--restart', is_flag=True, help='Ignore the saved progress of an interrupted import.')
+@click.option('--merge', is_flag=True, help='Add to a database that already has data, giving the rows new ids.')
+@with_appcontext
+def import_command(directory, batch_size, no_files, restart, merge):
+    """Load what `flask export` wrote to DIRECTORY into the database."""
+    path = os.path.join(directory, DATA_FILE)
+    if not os.path.isfile(path):
+        raise click.ClickException(f'{path} does not exist.')
+    migrate_db()
+    start = 0 if restart else read_state(path + '.progress')['offset']
+    if start:
+        click.echo(f'Resuming at byte {start}.')
+    with click.progressbar(length=os.path.getsize(path), label='Importing') as bar:
+        try:
+            imported, skipped = import_data(directory, batch_size, not no_files, not restart, bar.update, merge)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    click.echo(f'Imported {sum(imported.values())} rows: '
+               + ', '.join(f'{count} {table}' for table, count in imported.items()) + '.')
+    if any(skipped.values()):
+        click.echo('Skipped rows that already existed: '
+                   + ', '.join(f'{count} {table}' for table, count in skipped.items() if count) + '.')
+
+
+def init_app(app):
+    app.cli.add_command(export_command)
+    app.cli.add_command(import_command)
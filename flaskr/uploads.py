@@ -0,0 +1,183 @@
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import time
+
+import click
+from flask import current_app, request, send_file
+from flask.cli import with_appcontext
+from werkzeug.exceptions import abort
+from werkzeug.security import safe_join
+
+from flaskr.cache import LRUCache
+from flaskr.db import get_db
+
+
+CHUNK_SIZE = 64 * 1024
+
+# The first bytes of the image formats we accept, and the extension they are stored under.
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+CONTENT_ADDRESSED = re.compile(r'^([0-9a-f]{64})\.\w+$')
+# blobs and the resized variants flaskr/images.py makes of them
+STORED_UPLOAD = re.compile(r'^[0-9a-f]{64}(?:_\d+w)?\.\w+$')
+
+
+def sniff_image_type(head):
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def store_upload(file_storage):
+    """Stream an uploaded file into UPLOAD_FOLDER under the sha256 of its content.
+
+    Returns (filename, created, error): ``created`` is False when an identical file was already stored,
+    ``error`` is a message for the user when the upload was rejected.
+    """
+    folder = current_app.config['UPLOAD_FOLDER']
+    limit = current_app.config['MAX_IMAGE_SIZE']
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
+
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.upload-')
+    try:
+        digest = hashlib.sha256()
+        head = b''
+        size = 0
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file_storage.stream.read(chunk_size), b''):
+                size += len(chunk)
+                if size > limit:
+                    return None, False, f'Images can be at most {limit // (1024 * 1024)} MB.'
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                digest.update(chunk)
+                out.write(chunk)
+
+        extension = sniff_image_type(head)
+        if extension is None:
+            return None, False, 'Only PNG, JPEG, GIF and WebP images can be uploaded.'
+
+        filename = f'{digest.hexdigest()}.{extension}'
+        path = os.path.join(folder, filename)
+        if os.path.exists(path):
+            return filename, False, None
+        os.replace(temp_path, path)
+        return filename, True, None
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+'''The upload is copied in UPLOAD_CHUNK_SIZE pieces and hashed on the way, so memory use doesn't depend on the file
+size, and an oversized file is dropped as soon as it crosses MAX_IMAGE_SIZE (MAX_CONTENT_LENGTH already refuses
+whole requests that are too big with a 413 before they are read). The type comes from the file's first bytes, not
+from the name the browser sent. Naming the blob after its hash means the same picture uploaded twice is stored
+once and simply referenced from several images rows; os.replace() makes the file appear atomically, so two
+concurrent uploads of the same content can't leave a half written blob behind.'''
+
+
+def file_etag(path, stat):
+    match = CONTENT_ADDRESSED.match(os.path.basename(path))
+    if match:
+        return match.group(1) # the name already is the content hash
+
+    # Hashing a file is only done once per worker; the key changes whenever the file is replaced.
+    cache = current_app.extensions['flaskr_upload_etags']
+    key = (path, stat.st_mtime_ns, stat.st_size)
+
+    etag = cache.get(key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        etag = digest.hexdigest()
+        cache.set(key, etag)
+    return etag
+
+
+def send_upload(filename):
+    path = safe_join(current_app.config['UPLOAD_FOLDER'], filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    stat = os.stat(path)
+    etag = file_etag(path, stat)
+    max_age = current_app.config['UPLOAD_MAX_AGE']
+    accel_prefix = current_app.config['UPLOAD_ACCEL_REDIRECT']
+
+    if accel_prefix:
+        # nginx serves the bytes (including ranges) from its internal location; we only answer with headers
+        response = current_app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+        response.set_etag(etag)
+        response.last_modified = stat.st_mtime
+        response.make_conditional(request)
+    else:
+        # send_file answers If-None-Match with 304 and Range with 206, and hands off to the
+        # front end server with X-Sendfile when USE_X_SENDFILE is set
+        response = send_file(path, conditional=True, etag=etag, last_modified=stat.st_mtime, max_age=max_age)
+
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    return response
+
+'''Upload names are the hash of their content (see store_upload) and never reused for different content, so a
+browser or proxy that has a copy never needs to ask again: Cache-Control: immutable with a long max-age. The content
+hash is still sent as the ETag so that revalidation (e.g. on a forced reload) is a cheap 304.'''
+
+
+def unused_uploads(min_age):
+    """Yield the paths in UPLOAD_FOLDER that no images or image_variants row refers to and that are older than
+    ``min_age`` seconds."""
+    db = get_db()
+    used = {row[0] for row in db.execute('SELECT filename FROM images UNION SELECT filename FROM image_variants')}
+    folder = current_app.config['UPLOAD_FOLDER']
+    cutoff = time.time() - min_age
+
+    for entry in os.scandir(folder):
+        if not entry.is_file() or entry.name in used:
+            continue
+        if STORED_UPLOAD.match(entry.name) or entry.name.startswith('.upload-'):
+            if entry.stat().st_mtime < cutoff:
+                yield entry.path
+
+'''A post whose transaction fails after its image was stored leaves the blob behind: removing it right there could
+delete a file that a concurrent upload of the same picture has just found and is about to reference. Sweeping
+later, and only files older than min_age, avoids that race; a worker killed mid upload leaves a .upload- temp file,
+which is swept the same way.'''
+
+
+@click.command('clean-uploads')
+@click.option('--min-age', default=3600, show_default=True, help='Only remove files older than this many seconds.')
+@click.option('--dry-run', is_flag=True, help='List the files instead of removing them.')
+@with_appcontext
+def clean_uploads_command(min_age, dry_run):
+    """Remove uploaded files that no post uses any more."""
+    count = 0
+    for path in unused_uploads(min_age):
+        if dry_run:
+            click.echo(path)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError: # another clean-uploads got there first
+                continue
+        count += 1
+    click.echo(f'{"Would remove" if dry_run else "Removed"} {count} unused uploads.')
+
+
+def init_app(app):
+    app.extensions['flaskr_upload_etags'] = LRUCache(app.config['UPLOAD_ETAG_CACHE_SIZE'])
+    app.cli.add_command(clean_uploads_command)
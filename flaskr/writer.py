@@ -0,0 +1,153 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+
+from flaskr.db import bump_data_version, connect, get_write_db
+
+
+class WriteQueue(object):
+    """One thread per process that owns a connection and commits queued writes in groups.
+
+    A write is a function ``operation(db, *args)`` that changes the database without committing. The thread takes
+    the first queued write, keeps collecting for up to ``window`` seconds or ``max_batch`` writes, runs them all in
+    one transaction (each under a savepoint, so one failing write doesn't take the others with it), bumps the data
+    version once and commits. Every caller's future is resolved only after that commit.
+    """
+
+    def __init__(self, app, window, max_batch):
+        self.app = app
+        self.window = window
+        self.max_batch = max_batch
+        self.pid = os.getpid()
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='flaskr-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, *args):
+        future = Future()
+        self._queue.put((operation, args, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None) # finish this batch, stop at the next one
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            db = connect(self.app.config)
+            try:
+                while True:
+                    batch = self._next_batch()
+                    if batch is None:
+                        break
+                    self._commit(db, batch)
+            finally:
+                db.close()
+
+    def _commit(self, db, batch):
+        # a caller that gave up cancelled its future; from here on cancel() fails, so the others wait for the commit
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        results = []
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            for operation, args, future in batch:
+                db.execute('SAVEPOINT write')
+                try:
+                    results.append((future, operation(db, *args), None))
+                except Exception as e:
+                    db.execute('ROLLBACK TO write')
+                    results.append((future, None, e))
+                db.execute('RELEASE write')
+            bump_data_version(db)
+            db.commit()
+        except Exception as e:
+            if db.in_transaction:
+                db.rollback()
+            for operation, args, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+'''SQLite lets one connection write at a time, and every commit costs a lock round trip, a WAL append and, with
+synchronous=FULL, an fsync. Request threads that each commit their own like fight over that lock (and time out
+with "database is locked" in bursts); handing the writes to one thread turns a burst of N commits into a few
+group commits and leaves the other workers' writers far less to wait for. Callers block until their group is
+committed, so a response never claims a write that could still be lost, and the request's next read already sees
+it.'''
+
+
+def get_write_queue(app=None):
+    app = app or current_app._get_current_object()
+    write_queue = app.extensions.get('flaskr_write_queue')
+    if write_queue is None or write_queue.pid != os.getpid():
+        # one writer per process, started again after a fork
+        write_queue = app.extensions['flaskr_write_queue'] = WriteQueue(
+            app, app.config['WRITE_QUEUE_WINDOW'], app.config['WRITE_QUEUE_MAX_BATCH']
+        )
+    return write_queue
+
+
+def close_write_queue(app):
+    write_queue = app.extensions.pop('flaskr_write_queue', None)
+    if write_queue is not None and write_queue.pid == os.getpid():
+        write_queue.close()
+
+
+def write(operation, *args):
+    """Run ``operation(db, *args)`` in a committed transaction and return its result.
+
+    With WRITE_QUEUE_ENABLED it goes through the process's write queue; otherwise it runs right here on the
+    request's connection. Either way the data version is bumped and the write is committed when this returns. A
+    write still queued after WRITE_QUEUE_TIMEOUT seconds is dropped and the request gets a 503.
+    """
+    if current_app.config['WRITE_QUEUE_ENABLED']:
+        future = get_write_queue().submit(operation, *args)
+        try:
+            return future.result(current_app.config['WRITE_QUEUE_TIMEOUT'])
+        except TimeoutError: # concurrent.futures.TimeoutError, the builtin only from Python 3.11
+            if future.cancel(): # still queued, so it will never be applied
+                raise ServiceUnavailable('Too many writes at once, please try again in a moment.', retry_after=1)
+            return future.result() # already in the transaction being committed
+
+    db = get_write_db()
+    try:
+        result = operation(db, *args)
+        bump_data_version(db)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return result
@@ -0,0 +1,318 @@
+"""Generate a blog of a given size and time the read-only pages against it.
+
+Run from the project root:
+
+    python -m tests.bench --posts 20000 --output before.json
+    python -m tests.bench --posts 20000 --output after.json --compare before.json
+
+Every page is requested ``--repeat`` times through the Flask test client, once anonymously and once logged in,
+with the page cache turned off (unless ``--page-cache`` is given) so that the numbers are about the queries and the
+templates. Latencies are in milliseconds; ``queries`` is the number of SQL statements one request ran.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import markdown
+from flask import request_finished, request_started
+
+from flaskr import create_app
+from flaskr.db import close_pool, get_db, init_db
+from flaskr.pagination import encode_cursor
+
+
+# The hash of the password 'test', the same one tests/data.sql uses; hashing once per user would dominate the setup.
+PASSWORD = 'pbkdf2:sha256:50000$TCI4GzcX$0de171a4f4dac32e3364c7ddc7c14f3e2fa61f2d17574483f7ffbb431b4acb2f'
+
+WORDS = (
+    'flask sqlite python index query cache page cursor tag search image upload blog post comment like '
+    'latency worker thread pool batch stream trigger counter version cookie session template render'
+).split()
+
+SCALES = {
+    'tiny': dict(users=5, posts=50, tags=10, likes=2, comments=2, images=0.2),
+    'small': dict(users=50, posts=2000, tags=100, likes=5, comments=3, images=0.2),
+    'medium': dict(users=500, posts=20000, tags=500, likes=10, comments=5, images=0.2),
+    'large': dict(users=5000, posts=200000, tags=2000, likes=20, comments=5, images=0.2),
+}
+
+BATCH_SIZE = 5000
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate_data(db, users, posts, tags, likes, comments, images, seed=0):
+    """Fill an empty database with ``users`` users and ``posts`` posts.
+
+    Every post gets up to three of ``tags`` tags, on average ``likes`` likes and ``comments`` comments, and an
+    image with probability ``images``. The same seed always produces the same blog.
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2020, 1, 1)
+
+    db.executemany(
+        'INSERT INTO user (username, password) VALUES (?, ?)',
+        ((f'user{i}', PASSWORD) for i in range(1, users + 1))
+    )
+    db.executemany('INSERT INTO tags (tag) VALUES (?)', ((f'tag{i}',) for i in range(1, tags + 1)))
+
+    def post_rows():
+        for i in range(1, posts + 1):
+            body = _sentence(rng, rng.randint(20, 120))
+            created = start + datetime.timedelta(minutes=i * 7 + rng.randint(0, 6))
+            yield rng.randint(1, users), created, _sentence(rng, rng.randint(2, 8)), body, markdown.markdown(body)
+
+    for batch in _batches(post_rows()):
+        db.executemany(
+            'INSERT INTO post (author_id, created, title, body, body_html) VALUES (?, ?, ?, ?, ?)', batch
+        )
+
+    def post_tag_rows():
+        for post_id in range(1, posts + 1):
+            # a few popular tags and a long tail, like real tagging
+            for tag_id in {min(int(rng.paretovariate(1)), tags) for _ in range(rng.randint(0, 3))}:
+                yield post_id, tag_id
+
+    def like_rows():
+        for post_id in range(1, posts + 1):
+            for user_id in rng.sample(range(1, users + 1), min(rng.randint(0, 2 * likes), users)):
+                yield post_id, user_id
+
+    def comment_rows():
+        for post_id in range(1, posts + 1):
+            for _ in range(rng.randint(0, 2 * comments)):
+                yield _sentence(rng, rng.randint(3, 20)), post_id, rng.randint(1, users)
+
+    def image_rows():
+        for post_id in range(1, posts + 1):
+            if rng.random() < images:
+                yield post_id, hashlib.sha256(str(post_id).encode()).hexdigest() + '.png'
+
+    for sql, rows in (
+        ('INSERT OR IGNORE INTO post_tag (post_id, tag_id) VALUES (?, ?)', post_tag_rows()),
+        ('INSERT INTO likes (post_id, user_id) VALUES (?, ?)', like_rows()),
+        ('INSERT INTO comments (comment, post_id, user_id) VALUES (?, ?, ?)', comment_rows()),
+        ('INSERT INTO images (post_id, filename) VALUES (?, ?)', image_rows()),
+    ):
+        for batch in _batches(rows):
+            db.executemany(sql, batch)
+    db.commit()
+    db.execute('ANALYZE')
+
+
+def benchmark_paths(db):
+    """The pages to time: the first, a middle and the last page of the feed, a post, tag pages and a search."""
+    paths = {'index': '/', 'tag_cloud': '/tags', 'search': '/search>?query=cache+pag'}
+
+    count = db.execute('SELECT count(*) FROM post').fetchone()[0]
+    for name, offset in (('index_middle', count // 2), ('index_last', max(count - 2, 0))):
+        row = db.execute(
+            'SELECT id, created FROM post ORDER BY created DESC, id DESC LIMIT 1 OFFSET ?', (offset,)
+        ).fetchone()
+        if row is not None:
+            paths[name] = '/?cursor=' + encode_cursor(row['created'], row['id']) + '&dir=next&page=2'
+
+    post = db.execute('SELECT id FROM post ORDER BY comment_count DESC LIMIT 1').fetchone()
+    if post is not None:
+        paths['post'] = f'/{post["id"]}'
+
+    tags = db.execute('SELECT tag FROM tags ORDER BY post_count DESC').fetchall()
+    if tags:
+        paths['tag_popular'] = f'/tag/{tags[0]["tag"]}'
+        paths['tag_rare'] = f'/tag/{tags[-1]["tag"]}'
+    return paths
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(int(round(fraction * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def summarize(timings, queries):
+    return {
+        'count': len(timings),
+        'mean': round(sum(timings) / len(timings), 3),
+        'min': round(min(timings), 3),
+        'p50': round(percentile(timings, 0.50), 3),
+        'p90': round(percentile(timings, 0.90), 3),
+        'p99': round(percentile(timings, 0.99), 3),
+        'max': round(max(timings), 3),
+        'queries': max(queries),
+    }
+
+
+def measure(app, paths, repeat=50, warmup=3, user_id=None):
+    """Request every path ``warmup`` + ``repeat`` times and summarize the latencies (ms) and query counts."""
+    statements = []
+
+    def trace(sql):
+        if not sql.startswith('--'): # statements run inside triggers and virtual tables (FTS5) come commented
+            statements.append(sql)
+
+    def start_tracing(sender, **extra):
+        get_db().set_trace_callback(trace)
+
+    def stop_tracing(sender, **extra):
+        get_db().set_trace_callback(None)
+
+    client = app.test_client()
+    if user_id is not None:
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+
+    results = {}
+    with request_started.connected_to(start_tracing, app), request_finished.connected_to(stop_tracing, app):
+        for name, path in paths.items():
+            timings = []
+            queries = []
+            for i in range(warmup + repeat):
+                del statements[:]
+                started = time.perf_counter()
+                response = client.get(path)
+                elapsed = (time.perf_counter() - started) * 1000
+                if response.status_code != 200:
+                    raise RuntimeError(f'GET {path} answered {response.status_code}')
+                if i >= warmup:
+                    timings.append(elapsed)
+                    queries.append(len(statements))
+            results[name] = dict(summarize(timings, queries), path=path)
+    return results
+
+
+def run(scale, repeat=50, warmup=3, page_cache=False, seed=0):
+    """Build a temporary blog of the given scale (a dict like the ones in SCALES) and benchmark it."""
+    db_fd, db_path = tempfile.mkstemp(suffix='.sqlite')
+    metrics_dir = tempfile.mkdtemp()
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': db_path,
+        'METRICS_DIR': metrics_dir,
+        'PAGE_CACHE_TYPE': 'simple' if page_cache else 'null',
+    })
+    try:
+        with app.app_context():
+            init_db()
+            started = time.perf_counter()
+            generate_data(get_db(), seed=seed, **scale)
+            generate_seconds = time.perf_counter() - started
+            paths = benchmark_paths(get_db())
+
+        endpoints = {}
+        for who, user_id in (('anonymous', None), ('user', 1)):
+            for name, result in measure(app, paths, repeat, warmup, user_id).items():
+                endpoints[f'{name}:{who}'] = result
+    finally:
+        close_pool(app)
+        os.close(db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+        shutil.rmtree(metrics_dir)
+
+    return {
+        'meta': {
+            'scale': scale,
+            'repeat': repeat,
+            'page_cache': page_cache,
+            'seed': seed,
+            'generate_seconds': round(generate_seconds, 3),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        },
+        'endpoints': endpoints,
+    }
+
+
+def compare(old, new, metric='p50', threshold=0.2):
+    """Return (lines, regressions) comparing two results; a regression is ``metric`` growing by more than
+    ``threshold`` (a fraction) or a page running more queries than before."""
+    lines = [f'{"endpoint":28} {"old " + metric:>10} {"new " + metric:>10} {"change":>8} {"queries":>9}']
+    regressions = []
+    for name, result in new['endpoints'].items():
+        before = old['endpoints'].get(name)
+        if before is None:
+            lines.append(f'{name:28} {"-":>10} {result[metric]:>10.2f} {"new":>8} {result["queries"]:>9}')
+            continue
+        change = (result[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+        queries = f'{before["queries"]}->{result["queries"]}' if before['queries'] != result['queries'] \
+            else str(result['queries'])
+        lines.append(
+            f'{name:28} {before[metric]:>10.2f} {result[metric]:>10.2f} {change:>+8.0%} {queries:>9}'
+        )
+        if change > threshold or result['queries'] > before['queries']:
+            regressions.append(name)
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scale', choices=SCALES, default='small', help='preset data size (default: small)')
+    for field in ('users', 'posts', 'tags'):
+        parser.add_argument(f'--{field}', type=int, help=f'override the number of {field}')
+    parser.add_argument('--likes', type=float, help='override the average likes per post')
+    parser.add_argument('--comments', type=float, help='override the average comments per post')
+    parser.add_argument('--images', type=float, help='override the share of posts with an image')
+    parser.add_argument('--repeat', type=int, default=50, help='timed requests per page (default: 50)')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per page first (default: 3)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--page-cache', action='store_true', help='keep the page cache on')
+    parser.add_argument('--output', '-o', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='a previous JSON result to compare against')
+    parser.add_argument('--metric', default='p50', choices=('mean', 'p50', 'p90', 'p99'))
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fail when the metric grows by more than this fraction (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    scale = dict(SCALES[args.scale])
+    for field in scale:
+        if getattr(args, field) is not None:
+            scale[field] = getattr(args, field)
+
+    result = run(scale, args.repeat, args.warmup, args.page_cache, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+
+    for name, endpoint in result['endpoints'].items():
+        print(f'{name:28} p50 {endpoint["p50"]:8.2f}  p90 {endpoint["p90"]:8.2f}  p99 {endpoint["p99"]:8.2f}'
+              f'  queries {endpoint["queries"]}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        lines, regressions = compare(old, result, args.metric, args.threshold)
+        print()
+        print('\n'.join(lines))
+        if regressions:
+            print(f'\nRegressed: {", ".join(regressions)}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
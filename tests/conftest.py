@@ -1,9 +1,11 @@
 import os
+import shutil
 import tempfile
 
 import pytest
 from flaskr import create_app
-from flaskr.db import get_db, init_db
+from flaskr.db import close_pool, get_db, init_db
+from flaskr.writer import close_write_queue
 
 with open(os.path.join(os.path.dirname(__file__), 'data.sql'), 'rb') as f:
     _data_sql = f.read().decode('utf8')
@@ -12,10 +14,13 @@ with open(os.path.join(os.path.dirname(__file__), 'data.sql'), 'rb') as f:
 @pytest.fixture
 def app():
     db_fd, db_path = tempfile.mkstemp()
+    metrics_dir = tempfile.mkdtemp()
 
     app = create_app({
         'TESTING': True,
         'DATABASE': db_path,
+        'METRICS_DIR': metrics_dir,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000', # cheap, the tests log in a lot
     }) #When you call app = create_app({'TESTING': True}), you are invoking the create_app function with a specific test_config dictionary:
 
     with app.app_context():
@@ -24,8 +29,11 @@ def app():
 
     yield app
 
+    close_write_queue(app)
+    close_pool(app)
     os.close(db_fd)
     os.unlink(db_path)
+    shutil.rmtree(metrics_dir)
 
 '''the term app refers to the Flask application instance that is created and configured within the fixture function itself.'''
 
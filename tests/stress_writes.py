@@ -0,0 +1,163 @@
+"""Hammer the like and comment endpoints from several processes and threads, with and without the write queue.
+
+Run from the project root:
+
+    python -m tests.stress_writes --processes 4 --threads 8 --seconds 5
+
+Each process stands in for a gunicorn worker (forked from one app, the way gunicorn --preload does), each thread
+for a request thread. Every thread is logged in as its own user and toggles likes (and sometimes comments) on
+random posts as fast as it can. The script prints the writes per second and the failed requests of both modes and
+checks that like_count still matches the likes table afterwards.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from flaskr import create_app
+from flaskr.db import close_pool, get_db, init_db
+from flaskr.writer import close_write_queue
+
+from tests.bench import generate_data
+
+
+def _hammer(app, user_id, posts, deadline, comment_share, counts, lock):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    rng = random.Random(user_id)
+    ok = failed = 0
+    latencies = []
+    while time.monotonic() < deadline:
+        post_id = rng.randint(1, posts)
+        started = time.perf_counter()
+        try:
+            if rng.random() < comment_share:
+                response = client.post(f'/{post_id}/comment', data={'comment': 'stress'})
+                success = response.status_code == 302
+            else:
+                response = client.post(f'/{post_id}/like.json')
+                success = response.status_code == 200
+        except Exception:
+            success = False
+        latencies.append(time.perf_counter() - started)
+        if success:
+            ok += 1
+        else:
+            failed += 1
+    with lock:
+        counts['ok'] += ok
+        counts['failed'] += failed
+        counts['latencies'].extend(latencies)
+
+
+def _worker(app, first_user, threads, posts, seconds, comment_share, results):
+    counts = {'ok': 0, 'failed': 0, 'latencies': []}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+    pool = [
+        threading.Thread(target=_hammer, args=(app, first_user + i, posts, deadline, comment_share, counts, lock))
+        for i in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    close_write_queue(app)
+    results.put(counts)
+
+
+def run(write_queue, processes=4, threads=8, seconds=5.0, posts=100, comment_share=0.2, synchronous='normal'):
+    """Return {'writes_per_second', 'ok', 'failed', 'p50_ms', 'p99_ms', 'consistent'} for one mode."""
+    directory = tempfile.mkdtemp()
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': os.path.join(directory, 'stress.sqlite'),
+        'METRICS_DIR': os.path.join(directory, 'metrics'),
+        'WRITE_QUEUE_ENABLED': write_queue,
+        'SQLITE_SYNCHRONOUS': synchronous,
+        'PROPAGATE_EXCEPTIONS': False,
+        'SQL_SLOW_QUERY_MS': 10 ** 6, # waiting for the lock is the point here, don't log every wait
+    })
+    try:
+        with app.app_context():
+            init_db()
+            generate_data(get_db(), users=processes * threads, posts=posts, tags=5, likes=0, comments=0, images=0)
+        close_pool(app) # don't hand the parent's connections to the children
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [
+            context.Process(
+                target=_worker, args=(app, 1 + p * threads, threads, posts, seconds, comment_share, results)
+            )
+            for p in range(processes)
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        totals = {'ok': 0, 'failed': 0}
+        latencies = []
+        for _ in workers:
+            counts = results.get()
+            totals['ok'] += counts['ok']
+            totals['failed'] += counts['failed']
+            latencies.extend(counts['latencies'])
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+
+        with app.app_context():
+            db = get_db()
+            wrong = db.execute(
+                'SELECT count(*) FROM post p'
+                ' WHERE like_count != (SELECT count(*) FROM likes l WHERE l.post_id = p.id)'
+                ' OR comment_count != (SELECT count(*) FROM comments c WHERE c.post_id = p.id)'
+            ).fetchone()[0]
+        close_pool(app)
+    finally:
+        shutil.rmtree(directory)
+
+    latencies.sort()
+    return {
+        'writes_per_second': round(totals['ok'] / elapsed, 1),
+        'ok': totals['ok'],
+        'failed': totals['failed'],
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 1) if latencies else None,
+        'consistent': wrong == 0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8, help='threads per process')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--posts', type=int, default=100, help='fewer posts means more contention per row')
+    parser.add_argument('--comment-share', type=float, default=0.2)
+    parser.add_argument('--synchronous', default='normal', choices=('off', 'normal', 'full'))
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, write_queue in (('direct', False), ('queue', True)):
+        results[name] = run(
+            write_queue, args.processes, args.threads, args.seconds, args.posts, args.comment_share, args.synchronous
+        )
+        result = results[name]
+        print(f'{name:8} {result["writes_per_second"]:10.1f} writes/s  {result["ok"]:8} ok  {result["failed"]:6} failed'
+              f'  p50 {result["p50_ms"]} ms  p99 {result["p99_ms"]} ms'
+              f'  {"consistent" if result["consistent"] else "COUNTERS WRONG"}')
+
+    speedup = results['queue']['writes_per_second'] / max(results['direct']['writes_per_second'], 0.1)
+    print(f'queue/direct: {speedup:.2f}x')
+    return 0 if all(result['consistent'] for result in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
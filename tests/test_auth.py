@@ -63,4 +63,28 @@ def test_logout(client, auth):
 
     with client:
         auth.logout()
-        assert 'user_id' not in session
\ No newline at end of file
+        assert 'user_id' not in session
+
+def test_user_cache(client, auth, app):
+    auth.login()
+    client.get('/')
+    client.get('/')
+    stats = app.extensions['flaskr_user_cache'].stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+    with client:
+        client.get('/hello')
+        assert g.user is None
+    assert app.extensions['flaskr_user_cache'].stats()['hits'] == 1
+
+    auth.logout()
+    assert len(app.extensions['flaskr_user_cache']) == 0
+
+
+def test_cached_user_is_read_only(client, auth):
+    auth.login()
+    with client:
+        client.get('/')
+        assert dict(g.user) == {'id': 1, 'username': 'test'}
+        with pytest.raises(TypeError):
+            g.user['username'] = 'changed'
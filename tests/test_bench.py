@@ -0,0 +1,43 @@
+import json
+
+from bench import SCALES, compare, main, run
+
+
+def test_run_tiny_scale():
+    result = run(SCALES['tiny'], repeat=2, warmup=1)
+    endpoints = result['endpoints']
+    assert {'index:anonymous', 'index_last:user', 'post:anonymous', 'tag_popular:user', 'search:anonymous'} \
+        <= set(endpoints)
+    for endpoint in endpoints.values():
+        assert endpoint['count'] == 2
+        assert endpoint['min'] <= endpoint['p50'] <= endpoint['max']
+        assert endpoint['queries'] > 0
+
+
+def test_compare_flags_regressions():
+    old = {'endpoints': {'index:anonymous': {'p50': 10.0, 'queries': 3}, 'post:user': {'p50': 5.0, 'queries': 4}}}
+    new = {'endpoints': {'index:anonymous': {'p50': 10.5, 'queries': 3}, 'post:user': {'p50': 5.0, 'queries': 9},
+                         'tags:user': {'p50': 1.0, 'queries': 2}}}
+    lines, regressions = compare(old, new)
+    assert regressions == ['post:user']
+    assert len(lines) == 4
+
+    new['endpoints']['index:anonymous']['p50'] = 20.0
+    assert compare(old, new)[1] == ['index:anonymous', 'post:user']
+
+
+def test_main_writes_and_compares(tmp_path, capsys):
+    output = tmp_path / 'result.json'
+    args = ['--scale', 'tiny', '--repeat', '2']
+    assert main(args + ['--output', str(output)]) == 0
+
+    # same data and code, so the same queries; a 1000x threshold leaves room for any timing noise
+    assert main(args + ['--compare', str(output), '--threshold', '1000']) == 0
+    out = capsys.readouterr().out
+    assert 'endpoint' in out and 'Regressed' not in out
+
+    baseline = json.loads(output.read_text())
+    baseline['endpoints']['index:anonymous']['p50'] = 1e-6 # impossibly fast
+    output.write_text(json.dumps(baseline))
+    assert main(args + ['--compare', str(output), '--threshold', '1000']) == 1
+    assert 'Regressed: index:anonymous\n' in capsys.readouterr().out
@@ -90,4 +90,140 @@ def test_delete(client, auth, app):
     with app.app_context():
         db = get_db()
         post = db.execute('SELECT * FROM post WHERE id = 1').fetchone()
-        assert post is None
\ No newline at end of file
+        assert post is None
+
+def test_like_and_comment_counters(client, auth, app):
+    auth.login()
+    client.post('/1/like')
+    client.post('/1/comment', data={'comment': 'first'})
+    client.post('/1/comment', data={'comment': 'second'})
+
+    with app.app_context():
+        post = get_db().execute('SELECT like_count, comment_count FROM post WHERE id = 1').fetchone()
+        assert (post['like_count'], post['comment_count']) == (1, 2)
+
+    client.post('/1/like')
+    client.post('/1/delete/1/')
+
+    with app.app_context():
+        post = get_db().execute('SELECT like_count, comment_count FROM post WHERE id = 1').fetchone()
+        assert (post['like_count'], post['comment_count']) == (0, 1)
+
+
+def test_load_images_by_post(app):
+    from flaskr.blog import load_images_by_post
+
+    with app.test_request_context(method='POST'):
+        db = get_db()
+        db.execute("INSERT INTO post (title, body, author_id) VALUES ('second', '', 1)")
+        db.execute("INSERT INTO images (post_id, filename) VALUES (1, 'a.png'), (2, 'b.png'), (1, 'c.png')")
+        db.commit()
+
+        images_by_post = load_images_by_post(db, [1, 2, 3])
+        assert [image['filename'] for image in images_by_post[1]] == ['a.png', 'c.png']
+        assert [image['filename'] for image in images_by_post[2]] == ['b.png']
+        assert 3 not in images_by_post
+        assert load_images_by_post(db, []) == {}
+
+
+def test_tag_page_shows_images(client, app):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO tags (tag) VALUES ('pics')")
+        db.execute('INSERT INTO post_tag (post_id, tag_id) VALUES (1, 1)')
+        db.execute("INSERT INTO images (post_id, filename) VALUES (1, 'a.png')")
+        db.commit()
+
+    assert b'/uploads/a.png' in client.get('/tag/pics').data
+
+
+def test_like_api(client, auth, app):
+    assert client.post('/1/like.json').status_code == 401
+
+    auth.login()
+    assert client.post('/1/like.json').get_json() == {'post_id': 1, 'liked': True, 'likes': 1}
+    assert client.post('/1/like.json').get_json() == {'post_id': 1, 'liked': False, 'likes': 0}
+
+    # an explicit state is idempotent, so a double click can't undo itself
+    for _ in range(2):
+        assert client.post('/1/like.json', data={'liked': '1'}).get_json()['likes'] == 1
+    assert client.post('/1/like.json', data={'liked': 'false'}).get_json() == {'post_id': 1, 'liked': False, 'likes': 0}
+
+    assert client.post('/2/like.json').status_code == 404
+    with app.app_context():
+        assert get_db().execute('SELECT count(*) FROM likes').fetchone()[0] == 0
+
+
+def test_like_api_runs_no_feed_queries(client, auth, app):
+    app.config.update(SQL_QUERY_HEADERS=True, WRITE_QUEUE_ENABLED=False)
+    auth.login()
+    client.get('/')
+    response = client.post('/1/like.json')
+    # the like, the count read back and the version bump; the user comes from the cache
+    assert int(response.headers['X-Query-Count']) == 3
+
+    app.config['WRITE_QUEUE_ENABLED'] = True
+    response = client.post('/1/like.json')
+    assert response.get_json()['liked'] is False
+    assert 'X-Query-Count' not in response.headers # the writer thread did it all on its own connection
+
+
+def add_comments(app, count):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO comments (comment, post_id, user_id, created) VALUES (?, 1, 1, ?)',
+            # every two comments share a timestamp, so the cursor has to break ties on id
+            [(f'comment {i}', f'2018-01-02 00:00:{i // 2:02}') for i in range(count)]
+        )
+        db.commit()
+
+
+def test_post_shows_first_page_of_comments(client, auth, app):
+    app.config['COMMENTS_PER_PAGE'] = 3
+    add_comments(app, 7)
+    auth.login()
+
+    page = client.get('/1').get_data(as_text=True)
+    assert [f'comment {i}' in page for i in range(7)] == [False] * 4 + [True] * 3
+    assert 'More comments' in page
+
+    # without javascript the link reloads the post at the next page
+    cursor = page.split('data-more-url="/1/comments?cursor=')[1].split('"')[0]
+    page = client.get(f'/1?cursor={cursor}').get_data(as_text=True)
+    assert [f'comment {i}' in page for i in range(7)] == [False, True, True, True, False, False, False]
+
+
+def test_post_comments_fragment(client, auth, app):
+    app.config['COMMENTS_PER_PAGE'] = 3
+    add_comments(app, 7)
+    assert client.get('/1/comments').status_code == 401
+    auth.login()
+
+    seen = []
+    url = '/1/comments'
+    while url:
+        fragment = client.get(url).get_data(as_text=True)
+        assert '<nav>' not in fragment
+        shown = [i for i in range(7) if f'comment {i}<' in fragment]
+        seen.extend(sorted(shown, key=lambda i: fragment.index(f'comment {i}<')))
+        url = fragment.split('data-more-url="')[1].split('"')[0] if 'data-more-url' in fragment else None
+    assert seen == [6, 5, 4, 3, 2, 1, 0]
+    assert client.get('/2/comments').status_code == 404
+
+
+def test_post_comments_api(client, auth, app):
+    app.config['COMMENTS_PER_PAGE'] = 4
+    add_comments(app, 5)
+    assert client.get('/1/comments.json').status_code == 401
+    auth.login()
+
+    data = client.get('/1/comments.json').get_json()
+    assert data['total'] == 5
+    assert [comment['comment'] for comment in data['comments']] == ['comment 4', 'comment 3', 'comment 2', 'comment 1']
+    assert data['comments'][0]['username'] == 'test'
+
+    data = client.get(data['next_url']).get_json()
+    assert [comment['comment'] for comment in data['comments']] == ['comment 0']
+    assert data['next_url'] is None
+    assert client.get('/2/comments.json').status_code == 404
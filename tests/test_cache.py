@@ -0,0 +1,69 @@
+import os
+import time
+
+from flaskr.cache import FileSystemCache, LRUCache, make_cache
+
+
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'size': 2, 'maxsize': 2}
+
+
+def test_lru_ttl(monkeypatch):
+    cache = LRUCache(ttl=10)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+
+    later = time.monotonic() + 11
+    monkeypatch.setattr('flaskr.cache.time.monotonic', lambda: later)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_filesystem_cache_is_shared(tmp_path):
+    first = FileSystemCache(str(tmp_path), maxsize=10)
+    second = FileSystemCache(str(tmp_path), maxsize=10)
+
+    first.set(('page', 1), b'html')
+    assert second.get(('page', 1)) == b'html'
+    second.delete(('page', 1))
+    assert first.get(('page', 1)) is None
+    assert (second.hits, first.misses) == (1, 1)
+
+
+def test_filesystem_cache_prunes(tmp_path):
+    cache = FileSystemCache(str(tmp_path), maxsize=5)
+    for i in range(6):
+        cache.set(i, i)
+    assert len(os.listdir(tmp_path)) == 4
+
+
+def test_make_cache(tmp_path):
+    assert isinstance(make_cache('simple', 10), LRUCache)
+    assert isinstance(make_cache('filesystem', 10, directory=str(tmp_path)), FileSystemCache)
+    null = make_cache('null', 10)
+    null.set('a', 1)
+    assert null.get('a') is None
+
+
+def test_filesystem_cache_lists_directory_rarely(tmp_path, monkeypatch):
+    cache = FileSystemCache(str(tmp_path), maxsize=100)
+    listings = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, '_entries', lambda: listings.append(1) or entries())
+
+    for i in range(25):
+        cache.set(i, i)
+    assert len(listings) == 2 # every maxsize // 10 sets
+    assert cache.stats()['size'] == 25
+    cache.delete(0)
+    assert cache.stats()['size'] == 24
+    assert len(listings) == 2
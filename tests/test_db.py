@@ -1,7 +1,9 @@
+import datetime
+import os
 import sqlite3
 
 import pytest
-from flaskr.db import get_db
+from flaskr.db import close_pool, get_db, get_pool, get_write_db, needs_writer
 
 
 def test_get_close_db(app):
@@ -40,4 +42,155 @@ def test_init_db_command(runner, monkeypatch):
 
 
 '''It provides methods to replace or mock parts of the codebase temporarily, enabling isolated testing and preventing external dependencies from affecting test outcomes.'''
-'''The runner fixture in Flask applications typically refers to an instance of flask.testing.FlaskCliRunner. This is used to invoke Flask CLI commands programmatically within tests.'''
\ No newline at end of file
+'''The runner fixture in Flask applications typically refers to an instance of flask.testing.FlaskCliRunner. This is used to invoke Flask CLI commands programmatically within tests.'''
+
+def test_rebuild_counters_command(runner, app):
+    with app.app_context():
+        db = get_db()
+        db.execute('INSERT INTO likes (post_id, user_id) VALUES (1, 1), (1, 2)')
+        db.execute('UPDATE post SET like_count = 0, comment_count = 5')
+        db.commit()
+
+    result = runner.invoke(args=['rebuild-counters'])
+    assert 'Rebuilt' in result.output
+
+    with app.app_context():
+        post = get_db().execute('SELECT like_count, comment_count FROM post WHERE id = 1').fetchone()
+        assert (post['like_count'], post['comment_count']) == (2, 0)
+
+
+def test_pool_reuses_connections(app):
+    with app.app_context():
+        first = get_db()._connection
+    with app.app_context():
+        assert get_db()._connection is first
+        assert get_db().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert get_db().execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+
+    stats = get_pool(app).stats()
+    assert stats['connections'] == 1
+    assert stats['checkouts'] >= 2
+    assert stats['idle'] == 1
+
+
+def test_pool_rolls_back_unfinished_work(app):
+    with app.app_context():
+        get_db().execute("INSERT INTO user (username, password) VALUES ('x', 'x')")
+    with app.app_context():
+        assert get_db().execute("SELECT * FROM user WHERE username = 'x'").fetchone() is None
+
+
+def test_pool_waits_when_exhausted(app):
+    app.config.update(DB_POOL_SIZE=1, DB_POOL_TIMEOUT=0.01)
+    close_pool(app)
+    pool = get_pool(app)
+    db = pool.acquire()
+
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    assert pool.stats()['waits'] == 1
+
+    pool.release(db)
+    assert pool.acquire() is db
+    pool.release(db)
+
+
+def test_get_requests_read_through_read_only_connections(app):
+    with app.test_request_context('/'):
+        db = get_db()
+        assert db.execute('PRAGMA query_only').fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError, match='readonly'):
+            db.execute("INSERT INTO user (username, password) VALUES ('x', 'x')")
+        assert get_write_db() is not db
+    assert get_pool(app, read_only=True).stats()['idle'] == 1
+
+    with app.test_request_context('/create', method='POST'):
+        assert get_db() is get_write_db()
+        assert get_db().execute('PRAGMA query_only').fetchone()[0] == 0
+    with app.app_context():
+        assert get_db() is get_write_db()
+
+
+def test_read_only_requests_can_be_turned_off(app):
+    app.config['DB_READ_ONLY_REQUESTS'] = False
+    with app.test_request_context('/'):
+        assert get_db() is get_write_db()
+
+
+def test_view_decides_the_connection(app):
+    with app.test_request_context('/search>', method='POST'):
+        assert get_db().execute('PRAGMA query_only').fetchone()[0] == 1
+
+    @needs_writer
+    def touch():
+        return ''
+    app.add_url_rule('/touch', 'touch', touch)
+    with app.test_request_context('/touch'):
+        assert get_db() is get_write_db()
+
+
+def test_reads_see_committed_writes(client, auth, app):
+    auth.login()
+    client.post('/1/update', data={'title': 'fresh title', 'body': 'new', 'tags': ''})
+    assert b'fresh title' in client.get('/1').data
+
+
+def test_reads_from_replica(app, tmp_path):
+    replica = tmp_path / 'replica.sqlite'
+    with app.app_context():
+        get_db().execute("VACUUM INTO ?", (str(replica),))
+        get_db().execute("UPDATE post SET title = 'only on the primary' WHERE id = 1")
+        get_db().commit()
+    close_pool(app)
+
+    app.config['DATABASE_REPLICA'] = str(replica)
+    with app.test_request_context('/'):
+        assert get_db().execute('SELECT title FROM post WHERE id = 1').fetchone()[0] == 'test title'
+        assert get_write_db().execute('SELECT title FROM post WHERE id = 1').fetchone()[0] == 'only on the primary'
+    close_pool(app)
+
+
+# the schema before the counters, the stored HTML, the tag read model and the search index
+LEGACY_SCHEMA = '''
+CREATE TABLE user (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL);
+CREATE TABLE post (id INTEGER PRIMARY KEY AUTOINCREMENT, author_id INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, title TEXT NOT NULL, body TEXT NOT NULL);
+CREATE TABLE likes (id INTEGER PRIMARY KEY AUTOINCREMENT, post_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, UNIQUE(post_id, user_id));
+CREATE TABLE comments (id INTEGER PRIMARY KEY AUTOINCREMENT, comment text NOT NULL, post_id INTEGER NOT NULL,
+  user_id INTEGER NOT NULL, created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE tags (id INTEGER PRIMARY KEY AUTOINCREMENT, tag text NOT NULL);
+CREATE TABLE post_tag (post_id INTEGER, tag_id INTEGER, created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (post_id, tag_id));
+CREATE TABLE images (id INTEGER PRIMARY KEY AUTOINCREMENT, post_id INTEGER NOT NULL, filename TEXT NOT NULL,
+  upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, status TEXT DEFAULT 'active');
+
+INSERT INTO user (username, password) VALUES ('test', 'x'), ('other', 'y');
+INSERT INTO post (title, body, author_id, created) VALUES ('old raccoons', 'body', 1, '2018-01-01 00:00:00');
+INSERT INTO likes (post_id, user_id) VALUES (1, 1), (1, 2);
+INSERT INTO comments (comment, post_id, user_id) VALUES ('hi', 1, 2);
+INSERT INTO tags (tag) VALUES ('flask');
+INSERT INTO post_tag (post_id, tag_id) VALUES (1, 1);
+'''
+
+
+def test_migrate_db_fills_in_derived_data(app, runner):
+    close_pool(app)
+    os.remove(app.config['DATABASE'])
+    with sqlite3.connect(app.config['DATABASE']) as db:
+        db.executescript(LEGACY_SCHEMA)
+
+    assert 'Migrated' in runner.invoke(args=['migrate-db']).output
+    with app.app_context():
+        db = get_db()
+        post = db.execute('SELECT like_count, comment_count FROM post WHERE id = 1').fetchone()
+        assert (post['like_count'], post['comment_count']) == (2, 1)
+        assert db.execute("SELECT post_count FROM tags WHERE tag = 'flask'").fetchone()[0] == 1
+        assert db.execute('SELECT created FROM post_tag').fetchone()[0] == datetime.datetime(2018, 1, 1)
+        assert db.execute("SELECT rowid FROM post_fts WHERE post_fts MATCH 'raccoons'").fetchone()[0] == 1
+        version = db.execute('SELECT version FROM data_version').fetchone()[0]
+
+    # nothing left to add, so nothing is recomputed
+    runner.invoke(args=['migrate-db'])
+    with app.app_context():
+        assert get_db().execute('SELECT version FROM data_version').fetchone()[0] == version
@@ -0,0 +1,48 @@
+from flaskr.db import get_db
+import flaskr.explain
+from flaskr.explain import static_queries, table_aliases
+
+
+def test_static_queries_cover_views():
+    locations = {location.split(':')[0] for location, sql in static_queries()}
+    assert locations == {'blog.py', 'auth.py'}
+
+
+def test_table_aliases():
+    sql = 'SELECT * FROM post p JOIN user AS u ON u.id = p.author_id LEFT JOIN likes WHERE 1'
+    assert table_aliases(sql) == {'post': 'post', 'p': 'post', 'user': 'user', 'u': 'user', 'likes': 'likes'}
+
+
+def test_db_explain_passes(runner):
+    result = runner.invoke(args=['db-explain'])
+    assert result.exit_code == 0
+    assert '0 failing' in result.output
+
+
+def test_db_explain_fails_on_missing_index(runner, app):
+    with app.app_context():
+        db = get_db()
+        db.execute('DROP INDEX comments_post_created')
+        db.commit()
+
+    result = runner.invoke(args=['db-explain'])
+    assert result.exit_code == 1
+    assert 'FROM comments c' in result.output
+    assert 'SCAN c\n' in result.output
+
+
+def test_db_explain_fails_on_unexplainable_query(runner, monkeypatch):
+    queries = list(static_queries()) + [('blog.py:1', 'SELECT * FROM no_such_table')]
+    monkeypatch.setattr(flaskr.explain, 'static_queries', lambda: queries)
+    result = runner.invoke(args=['db-explain'])
+    assert result.exit_code == 1
+    assert 'ERROR blog.py:1: could not explain' in result.output
+    assert '1 failing' in result.output
+
+
+def test_db_explain_crawls_each_page_separately(app, runner, caplog):
+    # the post page runs its post query once, so crawling it twice must not look like an N+1
+    app.config['SQL_N_PLUS_ONE_THRESHOLD'] = 2
+    result = runner.invoke(args=['db-explain'])
+    assert result.exit_code == 0
+    assert 'Possible N+1' not in caplog.text
@@ -0,0 +1,83 @@
+import io
+import os
+
+import pytest
+
+from flaskr.db import get_db
+from flaskr.images import process_image
+
+Image = pytest.importorskip('PIL.Image')
+
+
+@pytest.fixture
+def upload_folder(app, tmp_path):
+    app.config.update(UPLOAD_FOLDER=str(tmp_path), IMAGE_PROCESSING_SYNC=True)
+    return tmp_path
+
+
+def png(width, height):
+    data = io.BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(data, 'PNG')
+    data.seek(0)
+    return data
+
+
+def test_create_makes_variants(client, auth, app, upload_folder):
+    auth.login()
+    client.post('/create', data={'title': 'pic', 'body': '', 'image': (png(1000, 500), 'pic.png')})
+
+    with app.app_context():
+        db = get_db()
+        image = db.execute('SELECT * FROM images').fetchone()
+        assert (image['width'], image['height']) == (1000, 500)
+        variants = db.execute('SELECT filename, width, height FROM image_variants ORDER BY width').fetchall()
+        assert [(v['width'], v['height']) for v in variants] == [(320, 160), (640, 320), (1000, 500)]
+        for variant in variants:
+            assert os.path.exists(os.path.join(upload_folder, variant['filename']))
+
+    response = client.get('/')
+    assert b'srcset="/uploads/' in response.data
+    assert b' 320w, /uploads/' in response.data
+    assert b'width="1000" height="500"' in response.data
+
+
+def test_unreadable_upload_keeps_original(client, app, upload_folder):
+    # a file that looks like an image but that Pillow can't decode
+    with open(os.path.join(upload_folder, 'broken.png'), 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + b'garbage')
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO images (post_id, filename) VALUES (1, 'broken.png')")
+        db.commit()
+        process_image(1)
+        assert db.execute('SELECT width FROM images').fetchone()[0] is None
+    assert b'srcset' not in client.get('/').data
+
+
+def test_process_images_command(runner, app, upload_folder):
+    with open(os.path.join(upload_folder, 'old.png'), 'wb') as f:
+        f.write(png(400, 400).read())
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO images (post_id, filename) VALUES (1, 'old.png')")
+        db.commit()
+
+    result = runner.invoke(args=['process-images'])
+    assert 'Processed 1 images.' in result.output
+
+    with app.app_context():
+        assert get_db().execute('SELECT count(*) FROM image_variants').fetchone()[0] == 2
+
+
+def test_processing_runs_in_background(app, upload_folder):
+    from flaskr.images import schedule_image_processing
+
+    app.config['IMAGE_PROCESSING_SYNC'] = False
+    with open(os.path.join(upload_folder, 'bg.png'), 'wb') as f:
+        f.write(png(800, 600).read())
+    with app.app_context():
+        db = get_db()
+        image_id = db.execute("INSERT INTO images (post_id, filename) VALUES (1, 'bg.png')").lastrowid
+        db.commit()
+        schedule_image_processing(image_id).result(timeout=10)
+        assert db.execute('SELECT width FROM images WHERE id = ?', (image_id,)).fetchone()[0] == 800
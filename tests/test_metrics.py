@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+
+import pytest
+
+from flaskr.metrics import (
+    AGGREGATE_FILE, MmapValues, clear_metrics, collect, get_values, mark_process_dead, metric_key, read_entries,
+    render,
+)
+
+
+def test_values_survive_reopening_and_growth(tmp_path):
+    path = str(tmp_path / '1.values')
+    values = MmapValues(path)
+    values.inc('a')
+    values.inc('a', 2.5)
+    values.set('b', 7)
+    for i in range(3000): # more than fits in the initial 64 KiB
+        values.inc(f'key-{i:04d}-' + 'x' * 20)
+    values.close()
+
+    with open(path, 'rb') as f:
+        entries = {key: value for key, value, offset in read_entries(f.read())}
+    assert entries['a'] == 3.5 and entries['b'] == 7 and len(entries) == 3002
+
+    values = MmapValues(path)
+    values.inc('a')
+    values.close()
+    with open(path, 'rb') as f:
+        assert dict((key, value) for key, value, offset in read_entries(f.read()))['a'] == 4.5
+
+
+def test_collect_adds_up_processes(tmp_path):
+    dead_pid = 2 ** 22 + 1 # above the largest pid Linux hands out
+    for pid in (os.getpid(), dead_pid):
+        values = MmapValues(str(tmp_path / f'{pid}.values'))
+        values.inc(metric_key('flaskr_http_requests_total', endpoint='blog.index', method='GET', status='200'), 2)
+        values.inc(metric_key('flaskr_http_requests_in_flight'), 1)
+        values.close()
+
+    totals = collect(str(tmp_path))
+    assert totals[('flaskr_http_requests_total', (('endpoint', 'blog.index'), ('method', 'GET'), ('status', '200')))] == 4
+    assert totals[('flaskr_http_requests_in_flight', ())] == 1 # the dead process's gauge is left out
+
+    text = render(totals)
+    assert '# TYPE flaskr_http_requests_total counter' in text
+    assert 'flaskr_http_requests_total{endpoint="blog.index",method="GET",status="200"} 4' in text
+
+
+def test_mark_process_dead(tmp_path):
+    for pid in (123, 124):
+        values = MmapValues(str(tmp_path / f'{pid}.values'))
+        values.inc(metric_key('flaskr_http_requests_in_flight'))
+        values.inc(metric_key('flaskr_db_pool_waits_total'), 3)
+        values.close()
+
+    mark_process_dead(123, str(tmp_path))
+    mark_process_dead(124, str(tmp_path))
+    mark_process_dead(125, str(tmp_path)) # never wrote anything
+    assert os.listdir(tmp_path) == [AGGREGATE_FILE]
+    totals = collect(str(tmp_path))
+    assert totals == {('flaskr_db_pool_waits_total', ()): 6}
+
+    clear_metrics(str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_reused_pid_starts_without_gauges(app):
+    with app.app_context():
+        values = get_values()
+        values.inc(metric_key('flaskr_http_requests_in_flight'))
+        values.inc(metric_key('flaskr_db_pool_waits_total'))
+        values.pid = -1 # as if written by an earlier process that had this pid
+        values = get_values()
+        with open(values.path, 'rb') as f:
+            entries = {key: value for key, value, offset in read_entries(f.read())}
+    assert entries[metric_key('flaskr_http_requests_in_flight')] == 0
+    assert entries[metric_key('flaskr_db_pool_waits_total')] == 1
+
+
+def test_stats_are_recorded_at_most_once_per_interval(app, client, monkeypatch):
+    calls = []
+    monkeypatch.setattr('flaskr.metrics.record_stats', lambda values, app: calls.append(1))
+    app.config['METRICS_STATS_INTERVAL'] = 60
+    for _ in range(3):
+        client.get('/hello')
+    assert len(calls) == 1
+    client.get('/metrics')
+    assert len(calls) == 2 # a scrape always has this worker's latest numbers
+
+
+def test_metrics_endpoint(client):
+    client.get('/')
+    client.get('/')
+    client.get('/does-not-exist')
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert 'flaskr_http_requests_total{endpoint="blog.index",method="GET",status="200"} 2' in text
+    assert 'flaskr_http_requests_total{endpoint="none",method="GET",status="404"} 1' in text
+    assert 'flaskr_http_request_duration_seconds_bucket{endpoint="blog.index",le="+Inf"} 2' in text
+    assert 'flaskr_http_request_duration_seconds_count{endpoint="blog.index"} 2' in text
+    assert 'flaskr_http_requests_in_flight 1' in text # the /metrics request itself
+    assert 'flaskr_db_queries_total{endpoint="blog.index"}' in text
+    assert 'flaskr_cache_hits_total{cache="page"} 1' in text
+    assert 'flaskr_db_pool_connections{pool="read"} 1' in text
+    assert 'flaskr_db_pool_connections{pool="write"} 1' in text
+
+
+def _serve_requests(app, count):
+    client = app.test_client()
+    for _ in range(count):
+        client.get('/hello')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_metrics_aggregate_across_workers(app, client):
+    # like gunicorn: the app is created once, then forked into workers that each record their own requests
+    workers = [multiprocessing.get_context('fork').Process(target=_serve_requests, args=(app, 3)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    client.get('/hello')
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'flaskr_http_requests_total{endpoint="hello",method="GET",status="200"} 7' in text
+    assert 'flaskr_http_requests_in_flight 1' in text
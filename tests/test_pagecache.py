@@ -0,0 +1,75 @@
+from flaskr.db import get_db
+
+
+def rename_post_behind_the_cache(app, title):
+    with app.app_context():
+        db = get_db()
+        db.execute('UPDATE post SET title = ? WHERE id = 1', (title,))
+        db.commit()
+
+
+def test_anonymous_pages_are_cached(client, app):
+    assert b'test title' in client.get('/').data
+    assert b'test title' in client.get('/1').data
+
+    rename_post_behind_the_cache(app, 'sneaky')
+    assert b'test title' in client.get('/').data
+    assert b'test title' in client.get('/1').data
+
+
+def test_writes_bump_the_version(client, auth, app):
+    assert b'test title' in client.get('/').data
+
+    auth.login()
+    client.post('/1/update', data={'title': 'updated', 'body': ''})
+    auth.logout()
+
+    assert b'updated' in client.get('/').data
+    with app.app_context():
+        assert get_db().execute('SELECT version FROM data_version').fetchone()[0] == 1
+
+
+def test_logged_in_users_get_their_own_likes(client, auth, app):
+    auth.login()
+    assert b'like_illa' in client.get('/').data
+
+    with app.app_context():
+        db = get_db()
+        db.execute('INSERT INTO likes (post_id, user_id) VALUES (1, 1)')
+        db.commit()
+
+    # the posts data comes from the cache, the like flag is looked up for the user
+    assert b'class="like-comment liked"' in client.get('/').data
+
+
+def test_flashes_skip_the_cache(client, app):
+    client.get('/')
+    rename_post_behind_the_cache(app, 'sneaky')
+    with client.session_transaction() as session:
+        session['_flashes'] = [('message', 'hello')]
+
+    assert b'hello' in client.get('/').data
+    assert b'hello' not in client.get('/').data # shown once, and never stored in the shared page
+
+
+def test_conditional_get(client, auth, app):
+    response = client.get('/')
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified']
+    assert 'no-cache' in response.headers['Cache-Control']
+
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/', headers={'If-Modified-Since': response.headers['Last-Modified']}).status_code == 304
+    assert client.get('/tag/x', headers={'If-None-Match': etag}).status_code == 200
+
+    auth.login()
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 200 # another user, another etag
+    client.post('/1/like')
+    auth.logout()
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 200 # the data changed
+
+
+def test_conditional_get_skips_queries(client, monkeypatch):
+    etag = client.get('/1').headers['ETag']
+    monkeypatch.setattr('flaskr.blog.load_images_by_post', None) # would blow up if the view ran
+    assert client.get('/1', headers={'If-None-Match': etag}).status_code == 304
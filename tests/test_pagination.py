@@ -0,0 +1,65 @@
+import re
+
+from flaskr.db import get_db
+from flaskr.pagination import decode_cursor, encode_cursor
+
+
+def add_posts(app, count):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO post (title, body, author_id, created) VALUES (?, ?, 1, ?)',
+            [(f'post {i}', f'body {i}', f'2019-01-{i + 1:02d} 00:00:00') for i in range(count)]
+        )
+        db.commit()
+
+
+def titles(response):
+    return re.findall(rb'<h1>(post \d+|test title)</h1>', response.data)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor('2018-01-01 00:00:00', 7)
+    assert decode_cursor(cursor) == ('2018-01-01 00:00:00', 7)
+    assert decode_cursor('not a cursor') is None
+    assert decode_cursor(None) is None
+
+
+def test_index_pages(client, app):
+    add_posts(app, 20)
+
+    response = client.get('/')
+    first = titles(response)
+    assert len(first) == 15
+    assert first[0] == b'post 19'
+    assert b'Page 1 of 2' in response.data
+
+    next_url = re.search(rb'href="([^"]+)">Next', response.data).group(1).decode().replace('&amp;', '&')
+    response = client.get(next_url)
+    second = titles(response)
+    assert second == [b'post 4', b'post 3', b'post 2', b'post 1', b'post 0', b'test title']
+    assert b'Page 2 of 2' in response.data
+    assert b'Next' not in response.data
+
+    prev_url = re.search(rb'href="([^"]+)">&laquo; Previous', response.data).group(1).decode().replace('&amp;', '&')
+    assert titles(client.get(prev_url)) == first
+
+
+def test_tag_and_search_pages(client, app):
+    add_posts(app, 3)
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO tags (tag) VALUES ('flask')")
+        db.execute('INSERT INTO post_tag (post_id, tag_id) VALUES (2, 1)')
+        db.commit()
+
+    assert titles(client.get('/tag/flask')) == [b'post 0']
+    assert titles(client.get('/search>?query=body 2')) == [b'post 2']
+
+
+def test_search_counts_are_bounded(client, app):
+    app.config['PAGE_COUNT_CACHE_SIZE'] = 3
+    for i in range(10):
+        client.get(f'/search>?query=word{i}')
+    cache = app.extensions['flaskr_page_counts']
+    assert len(cache) == 3
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import generate_password_hash
+
+from flaskr.db import get_db
+from flaskr.passwords import HashPool, expand_method, get_hash_pool, hash_method, needs_rehash
+
+
+def stored_password(app, username='test'):
+    with app.app_context():
+        return get_db().execute('SELECT password FROM user WHERE username = ?', (username,)).fetchone()[0]
+
+
+def test_register_uses_configured_method(client, app):
+    client.post('/auth/register', data={'username': 'a', 'password': 'a'})
+    assert stored_password(app, 'a').startswith('pbkdf2:sha256:1000$')
+
+
+def test_login_rehashes_legacy_hash(client, auth, app):
+    assert stored_password(app).startswith('pbkdf2:sha256:50000$')
+    assert auth.login().headers['Location'] == '/'
+
+    upgraded = stored_password(app)
+    assert upgraded.startswith('pbkdf2:sha256:1000$')
+    with app.app_context():
+        assert not needs_rehash(upgraded)
+
+    auth.logout()
+    assert auth.login().headers['Location'] == '/'
+    assert stored_password(app) == upgraded
+
+    assert b'Incorrect password.' in auth.login(password='wrong').data
+
+
+def test_wrong_password_is_not_rehashed(auth, app):
+    auth.login(password='wrong')
+    assert stored_password(app).startswith('pbkdf2:sha256:50000$')
+
+
+def test_saturated_pool_answers_503(client, app):
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0)
+    release = threading.Event()
+    with app.app_context():
+        pool = get_hash_pool()
+    busy = threading.Thread(target=pool.run, args=(release.wait,))
+    busy.start()
+    try:
+        response = client.post('/auth/login', data={'username': 'test', 'password': 'test'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert pool.rejected == 1
+    finally:
+        release.set()
+        busy.join()
+
+    assert client.post('/auth/login', data={'username': 'test', 'password': 'test'}).status_code == 302
+
+
+def test_pool_frees_slots_after_errors():
+    pool = HashPool(1, 0, None)
+
+    def fail():
+        raise ValueError('boom')
+
+    for _ in range(3):
+        try:
+            pool.run(fail)
+        except ValueError:
+            pass
+    assert pool.run(lambda: 'ok') == 'ok'
+    pool.shutdown()
+
+
+def test_pool_times_out_with_503():
+    pool = HashPool(1, 0, 0.05)
+    release = threading.Event()
+    busy = pool._executor.submit(release.wait) # holds the only worker without taking a slot
+    try:
+        with pytest.raises(ServiceUnavailable) as info:
+            pool.run(lambda: 'never')
+        assert info.value.retry_after == 1
+        assert pool.timed_out == 1
+    finally:
+        release.set()
+        busy.result()
+    assert pool.run(lambda: 'ok') == 'ok' # the cancelled job gave its slot back
+    pool.shutdown()
+
+
+@pytest.mark.parametrize('method', ('scrypt', 'scrypt:16384:8:1', 'pbkdf2', 'pbkdf2:sha512', 'pbkdf2:sha256:1000'))
+def test_expand_method_matches_werkzeug(method):
+    assert expand_method(method) == hash_method(generate_password_hash('', method))
+
+
+def test_password_benchmark_command(runner):
+    result = runner.invoke(args=['password-benchmark', '--rounds', '1', '--method', 'pbkdf2:sha256:2000'])
+    assert 'pbkdf2:sha256:1000' in result.output
+    assert 'pbkdf2:sha256:2000' in result.output
+    assert 'hashes per second with 2 workers' in result.output
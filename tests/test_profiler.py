@@ -0,0 +1,67 @@
+import sys
+import threading
+import time
+
+from flaskr import blog
+from flaskr.profiler import StackSampler, collapse, get_serializer
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_collapse():
+    def inner():
+        return collapse(sys._getframe())
+
+    stack = inner()
+    assert stack.endswith('test_profiler:test_collapse;test_profiler:test_collapse.<locals>.inner')
+
+
+def test_sampler_sees_the_busy_function():
+    sampler = StackSampler(threading.get_ident(), 0.001).start()
+    busy(0.05)
+    counts = sampler.stop()
+    assert sum(counts.values()) > 5
+    assert any(stack.endswith('test_profiler:busy') for stack in counts)
+
+
+def test_sampled_requests_write_stacks(app, client, tmp_path, monkeypatch):
+    app.config.update(PROFILE_SAMPLE_RATE=1, PROFILE_DIR=str(tmp_path), PROFILE_INTERVAL=0.001)
+    monkeypatch.setattr('flaskr.blog.load_page_posts', slow(blog.load_page_posts))
+    client.get('/')
+
+    lines = (tmp_path / 'blog.index.folded').read_text().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(' ', 1)
+    assert int(count) > 0
+    assert any('flaskr.blog:index' in line for line in lines)
+
+
+def slow(function):
+    def wrapped(*args, **kwargs):
+        busy(0.02)
+        return function(*args, **kwargs)
+    return wrapped
+
+
+def test_signed_header(app, client, tmp_path):
+    app.config.update(PROFILE_DIR=str(tmp_path), PROFILE_INTERVAL=0.001)
+    app.add_url_rule('/busy', 'busy', lambda: busy(0.02) or 'ok')
+
+    client.get('/busy', headers={'X-Profile-Token': 'forged'})
+    client.get('/busy')
+    assert not (tmp_path / 'busy.folded').exists()
+
+    with app.app_context():
+        token = get_serializer().dumps('profile')
+    client.get('/busy', headers={'X-Profile-Token': token})
+    assert 'test_profiler:busy' in (tmp_path / 'busy.folded').read_text()
+
+
+def test_profile_token_command(runner, app):
+    token = runner.invoke(args=['profile-token']).output.strip()
+    with app.app_context():
+        assert get_serializer().loads(token) == 'profile'
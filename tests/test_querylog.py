@@ -0,0 +1,102 @@
+import logging
+
+from flask import g
+
+from flaskr import create_app
+from flaskr.db import close_pool, get_db, init_db
+from flaskr.querylog import QueryLog
+
+
+def test_repeated():
+    log = QueryLog()
+    for post_id in range(5):
+        log.add('SELECT * FROM comments WHERE post_id = ?', (post_id,), 0.001)
+    for _ in range(5):
+        log.add('SELECT version FROM data_version', (), 0.001)
+    log.add('SELECT 1', (), 0.5)
+
+    assert log.repeated(5) == [('SELECT * FROM comments WHERE post_id = ?', 5)]
+    assert log.repeated(6) == []
+    assert [query['sql'] for query in log.slow(0.1)] == ['SELECT 1']
+    assert len(log) == 11
+
+
+def test_records_rows_and_time(app):
+    with app.test_request_context('/'):
+        db = get_db()
+        rows = db.execute('SELECT id FROM user').fetchall()
+        for row in db.execute('SELECT id FROM post'):
+            pass
+        log = g.query_log
+        assert [query['rows'] for query in log.queries] == [len(rows), 1]
+        assert log.total_time > 0
+
+
+def test_headers(app, client):
+    app.config['SQL_QUERY_HEADERS'] = True
+    response = client.get('/')
+    assert int(response.headers['X-Query-Count']) > 0
+    assert float(response.headers['X-Query-Time']) >= 0
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+
+    app.config['SQL_QUERY_HEADERS'] = False
+    assert 'X-Query-Count' not in client.get('/').headers
+
+
+def test_slow_and_repeated_queries_are_logged(app, client, caplog):
+    app.config.update(SQL_SLOW_QUERY_MS=0, SQL_N_PLUS_ONE_THRESHOLD=3)
+
+    @app.route('/n-plus-one')
+    def n_plus_one():
+        db = get_db()
+        for post_id in range(3):
+            db.execute('SELECT * FROM post WHERE id = ?', (post_id,)).fetchone()
+        return 'ok'
+
+    with caplog.at_level(logging.WARNING):
+        client.get('/n-plus-one')
+    assert 'Slow query' in caplog.text
+    assert 'Possible N+1 in GET /n-plus-one: ran 3 times: SELECT * FROM post WHERE id = ?' in caplog.text
+
+
+def test_slow_query_log_leaves_out_params(app, client, caplog):
+    app.config.update(SQL_SLOW_QUERY_MS=0)
+
+    @app.route('/secret')
+    def secret():
+        get_db().execute('SELECT * FROM user WHERE password = ?', ('hash-value',)).fetchone()
+        return 'ok'
+
+    with caplog.at_level(logging.WARNING):
+        client.get('/secret')
+    assert 'SELECT * FROM user WHERE password = ? <1 params>' in caplog.text
+    assert 'hash-value' not in caplog.text
+
+    app.config['SQL_LOG_PARAMS'] = True
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        client.get('/secret')
+    assert "('hash-value',)" in caplog.text
+
+
+def test_recording_off(app, client):
+    app.config.update(SQL_RECORD_QUERIES=False, SQL_QUERY_HEADERS=True)
+    assert 'X-Query-Count' not in client.get('/').headers
+
+
+def test_debug_endpoint(tmp_path):
+    app = create_app({
+        'TESTING': True, 'DATABASE': str(tmp_path / 'db.sqlite'), 'METRICS_DIR': str(tmp_path / 'metrics'),
+        'SQL_DEBUG_ENDPOINT': True,
+    })
+    with app.app_context():
+        init_db()
+    client = app.test_client()
+    client.get('/')
+    history = client.get('/_debug/queries').get_json()
+    assert history[0]['request'] == 'GET /'
+    assert history[0]['count'] == len(history[0]['queries']) > 0
+    close_pool(app)
+
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'db.sqlite'), 'METRICS_DIR': str(tmp_path / 'metrics')})
+    assert app.test_client().get('/_debug/queries').status_code == 404
@@ -0,0 +1,37 @@
+from flaskr.db import get_db
+from flaskr.render import render_markdown
+
+
+def test_render_markdown_is_cached(app, monkeypatch):
+    calls = []
+
+    def fake_markdown(body):
+        calls.append(body)
+        return f'<p>{body}</p>'
+
+    monkeypatch.setattr('flaskr.render.markdown.markdown', fake_markdown)
+    with app.app_context():
+        assert render_markdown('hello') == '<p>hello</p>'
+        assert render_markdown('hello') == '<p>hello</p>'
+        assert render_markdown('other') == '<p>other</p>'
+    assert calls == ['hello', 'other']
+
+
+def test_update_stores_html(client, auth, app):
+    auth.login()
+    client.post('/1/update', data={'title': 'updated', 'body': '*new*'})
+
+    with app.app_context():
+        post = get_db().execute('SELECT body_html FROM post WHERE id = 1').fetchone()
+        assert post['body_html'] == '<p><em>new</em></p>'
+
+
+def test_rerender_markdown_command(runner, app):
+    with app.app_context():
+        assert get_db().execute('SELECT body_html FROM post WHERE id = 1').fetchone()[0] is None
+
+    result = runner.invoke(args=['rerender-markdown', '--missing-only'])
+    assert 'Rendered 1 posts.' in result.output
+
+    with app.app_context():
+        assert get_db().execute('SELECT body_html FROM post WHERE id = 1').fetchone()[0] == '<p>test\nbody</p>'
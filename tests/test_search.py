@@ -0,0 +1,111 @@
+import re
+
+from flaskr.db import get_db
+from flaskr.search import fts_query
+
+
+def result_ids(response):
+    return [int(id) for id in re.findall(rb'href="/(\d+)" class="no-underline"', response.data)]
+
+
+def test_fts_query_quotes_input():
+    assert fts_query('hello "world') == '"hello" """world"*'
+    assert fts_query('   ') == ''
+
+
+def test_search_ranks_titles_first(client, app):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO post (title, body, author_id) VALUES ('other', 'a post about raccoons', 1)")
+        db.execute("INSERT INTO post (title, body, author_id) VALUES ('raccoons', 'nothing to see', 1)")
+        db.commit()
+
+    response = client.get('/search>?query=raccoons')
+    assert result_ids(response) == [3, 2]
+    assert b'a post about <mark>raccoons</mark>' in response.data
+
+
+def test_search_escapes_snippets(client, app):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO post (title, body, author_id) VALUES ('x', '<script>evil()</script>', 1)")
+        db.commit()
+
+    response = client.get('/search>?query=evil')
+    assert b'<script>' not in response.data
+    assert b'&lt;script&gt;<mark>evil</mark>' in response.data
+
+
+def test_search_follows_update_and_delete(client, auth):
+    assert result_ids(client.get('/search>?query=test')) == [1]
+
+    auth.login()
+    client.post('/1/update', data={'title': 'renamed', 'body': 'different'})
+    assert result_ids(client.get('/search>?query=test')) == []
+    assert result_ids(client.get('/search>?query=different')) == [1]
+
+    client.post('/1/delete')
+    assert result_ids(client.get('/search>?query=different')) == []
+
+
+def test_search_handles_fts_syntax(client):
+    assert client.get('/search>?query=AND OR (').status_code == 200
+    assert client.get('/search>').status_code == 200
+
+
+def test_rebuild_search_command(runner, app):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO post_fts(post_fts) VALUES('delete-all')")
+        db.commit()
+
+    result = runner.invoke(args=['rebuild-search'])
+    assert 'Rebuilt' in result.output
+
+    with app.app_context():
+        assert get_db().execute("SELECT rowid FROM post_fts WHERE post_fts MATCH 'test'").fetchall()[0][0] == 1
+
+
+def test_search_pages(client, app):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO post (title, body, author_id) VALUES (?, ?, 1)',
+            [(f'post {i}', 'same words ' * (i + 1), ) for i in range(20)]
+        )
+        db.commit()
+
+    response = client.get('/search>?query=words')
+    first = result_ids(response)
+    next_url = re.search(rb'href="([^"]+)">Next', response.data).group(1).decode().replace('&amp;', '&')
+    response = client.get(next_url)
+    second = result_ids(response)
+
+    assert len(first) == 15 and len(second) == 5
+    assert sorted(first + second) == list(range(2, 22))
+    prev_url = re.search(rb'href="([^"]+)">&laquo; Previous', response.data).group(1).decode().replace('&amp;', '&')
+    assert result_ids(client.get(prev_url)) == first
+
+
+def test_search_ranks_only_the_newest_candidates(client, app):
+    app.config['SEARCH_CANDIDATES'] = 3
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO post (title, body, author_id) VALUES ('raccoons', 'best match but old', 1)")
+        db.executemany(
+            'INSERT INTO post (title, body, author_id) VALUES (?, ?, 1)',
+            [('other', f'raccoons {i}') for i in range(3)]
+        )
+        db.commit()
+
+    response = client.get('/search>?query=raccoons')
+    assert result_ids(response) == [3, 4, 5]
+    assert b'Page 1 of 1' in response.data
+
+
+def test_search_ignores_bad_cursors(client):
+    # not a cursor at all, and a feed cursor whose key is a date rather than a score
+    for cursor in ('YWJjfDE', 'MjAyMC0wMS0wMSAwMDowMDowMHw1', '!!!'):
+        response = client.get(f'/search>?query=test&cursor={cursor}')
+        assert response.status_code == 200
+        assert result_ids(response) == [1]
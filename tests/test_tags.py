@@ -0,0 +1,117 @@
+import pytest
+
+from flaskr.db import get_db
+from flaskr.tags import add_post_tags, paginate_tag, parse_tags, set_post_tags, tag_cloud
+
+
+def test_parse_tags():
+    assert parse_tags('#flask #python  #flask #') == ['flask', 'python']
+    assert parse_tags('') == []
+    assert parse_tags(None) == []
+
+
+def test_add_post_tags_reuses_existing(app):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO tags (tag) VALUES ('flask')")
+        add_post_tags(db, 1, ['flask', 'python'])
+        add_post_tags(db, 1, ['python'])
+        db.commit()
+
+        assert db.execute('SELECT count(*) FROM tags').fetchone()[0] == 2
+        tags = db.execute(
+            'SELECT t.tag FROM post_tag pt JOIN tags t ON t.id = pt.tag_id WHERE pt.post_id = 1 ORDER BY t.tag'
+        ).fetchall()
+        assert [row['tag'] for row in tags] == ['flask', 'python']
+
+
+def test_create_with_tags(client, auth, app):
+    auth.login()
+    client.post('/create', data={'title': 'tagged', 'body': '', 'tags': '#a #b'})
+    client.post('/create', data={'title': 'also tagged', 'body': '', 'tags': '#b'})
+
+    with app.app_context():
+        db = get_db()
+        assert db.execute('SELECT count(*) FROM tags').fetchone()[0] == 2
+        assert db.execute('SELECT count(*) FROM post_tag').fetchone()[0] == 3
+
+
+def test_create_is_atomic(client, auth, app, monkeypatch):
+    def broken(db, post_id, names):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr('flaskr.blog.add_post_tags', broken)
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    auth.login()
+    with pytest.raises(RuntimeError):
+        client.post('/create', data={'title': 'half', 'body': '', 'tags': '#a'})
+
+    with app.app_context():
+        assert get_db().execute("SELECT count(*) FROM post WHERE title = 'half'").fetchone()[0] == 0
+
+
+def tag_counts(db):
+    return {row['tag']: row['post_count'] for row in db.execute('SELECT tag, post_count FROM tags')}
+
+
+def test_post_count_maintained(client, auth, app):
+    auth.login()
+    client.post('/create', data={'title': 'one', 'body': '', 'tags': '#a #b'})
+    client.post('/create', data={'title': 'two', 'body': '', 'tags': '#b'})
+    with app.app_context():
+        assert tag_counts(get_db()) == {'a': 1, 'b': 2}
+
+    client.post('/2/update', data={'title': 'one', 'body': '', 'tags': '#b #c'})
+    with app.app_context():
+        assert tag_counts(get_db()) == {'a': 0, 'b': 2, 'c': 1}
+
+    client.post('/3/delete')
+    with app.app_context():
+        db = get_db()
+        assert tag_counts(db) == {'a': 0, 'b': 1, 'c': 1}
+        assert db.execute('SELECT count(*) FROM post_tag WHERE post_id = 3').fetchone()[0] == 0
+
+
+def test_update_shows_tags(client, auth, app):
+    with app.app_context():
+        db = get_db()
+        add_post_tags(db, 1, ['flask'])
+        db.commit()
+    auth.login()
+    assert b'value="#flask"' in client.get('/1/update').data
+
+
+def test_paginate_tag(app):
+    with app.app_context():
+        db = get_db()
+        for i in range(5):
+            post_id = db.execute(
+                "INSERT INTO post (title, body, author_id, created) VALUES (?, '', 1, ?)",
+                (f'p{i}', f'2020-01-0{i + 1} 00:00:00')
+            ).lastrowid
+            set_post_tags(db, post_id, ['many'])
+        db.commit()
+
+        with app.test_request_context('/tag/many'):
+            first = paginate_tag(db, 'many', per_page=2)
+        assert first.total == 5 and first.total_pages == 3
+        assert first.ids == [6, 5]
+
+        with app.test_request_context(f'/tag/many?cursor={first.next_cursor}&dir=next&page=2'):
+            second = paginate_tag(db, 'many', per_page=2)
+        assert second.ids == [4, 3]
+
+        with app.test_request_context('/tag/none'):
+            assert paginate_tag(db, 'none').total == 0
+
+
+def test_tag_cloud(client, auth, app):
+    auth.login()
+    client.post('/create', data={'title': 'one', 'body': '', 'tags': '#rare #common'})
+    client.post('/create', data={'title': 'two', 'body': '', 'tags': '#common'})
+    with app.app_context():
+        assert [(row['tag'], row['post_count']) for row in tag_cloud(get_db())] == [('common', 2), ('rare', 1)]
+
+    response = client.get('/tags')
+    assert b'#common (2)' in response.data
+    assert b'/tag/rare' in response.data
@@ -0,0 +1,142 @@
+import json
+import os
+
+import pytest
+
+from flaskr import create_app
+from flaskr.db import close_pool, get_db, init_db
+from flaskr.transfer import DATA_FILE, export_data, import_data, write_state
+
+
+@pytest.fixture
+def source(app, tmp_path):
+    upload_folder = tmp_path / 'source_uploads'
+    upload_folder.mkdir()
+    (upload_folder / 'pic.png').write_bytes(b'png bytes')
+    app.config['UPLOAD_FOLDER'] = str(upload_folder)
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO post (title, body, author_id, created) VALUES ('second', 'body', 2, '2019-01-01 00:00:00')")
+        db.execute("INSERT INTO tags (tag) VALUES ('flask')")
+        db.execute('INSERT INTO post_tag (post_id, tag_id) VALUES (1, 1), (2, 1)')
+        db.execute('INSERT INTO likes (post_id, user_id) VALUES (1, 2)')
+        db.execute("INSERT INTO comments (comment, post_id, user_id) VALUES ('hi', 1, 2)")
+        db.execute("INSERT INTO images (post_id, filename) VALUES (1, 'pic.png')")
+        db.commit()
+    return app
+
+
+@pytest.fixture
+def target(tmp_path):
+    db_path = str(tmp_path / 'target.sqlite')
+    upload_folder = tmp_path / 'target_uploads'
+    upload_folder.mkdir()
+    app = create_app({
+        'TESTING': True, 'DATABASE': db_path, 'UPLOAD_FOLDER': str(upload_folder),
+        'METRICS_DIR': str(tmp_path / 'metrics'),
+    })
+    with app.app_context():
+        init_db()
+    yield app
+    close_pool(app)
+
+
+def test_export_import_round_trip(source, target, tmp_path):
+    dump = tmp_path / 'dump'
+    with source.app_context():
+        counts = export_data(str(dump), batch_size=2)
+    assert counts['post'] == 2 and counts['likes'] == 1 and counts['images'] == 1
+    assert (dump / 'uploads' / 'pic.png').read_bytes() == b'png bytes'
+
+    with target.app_context():
+        imported, skipped = import_data(str(dump), batch_size=3)
+        assert imported == counts
+        assert sum(skipped.values()) == 0
+
+        db = get_db()
+        post = db.execute('SELECT * FROM post WHERE id = 1').fetchone()
+        assert (post['title'], post['like_count'], post['comment_count']) == ('test title', 1, 1)
+        assert db.execute("SELECT post_count FROM tags WHERE tag = 'flask'").fetchone()[0] == 2
+        assert db.execute("SELECT rowid FROM post_fts WHERE post_fts MATCH 'second'").fetchone()[0] == 2
+        assert db.execute("SELECT password FROM user WHERE username = 'test'").fetchone()[0].startswith('pbkdf2')
+    assert os.path.exists(os.path.join(target.config['UPLOAD_FOLDER'], 'pic.png'))
+    assert not os.path.exists(dump / (DATA_FILE + '.progress'))
+
+    # the ids of a second import would collide with the first one
+    with target.app_context():
+        with pytest.raises(ValueError, match='already has data'):
+            import_data(str(dump))
+        assert get_db().execute('SELECT like_count FROM post WHERE id = 1').fetchone()[0] == 1
+
+
+def test_import_resumes(source, target, tmp_path):
+    dump = tmp_path / 'dump'
+    with source.app_context():
+        export_data(str(dump), with_files=False)
+
+    path = dump / DATA_FILE
+    lines = path.read_bytes().splitlines(keepends=True)
+    # pretend an earlier run committed the users and stopped
+    write_state(str(path) + '.progress', {'offset': sum(len(line) for line in lines[:2])})
+    with target.app_context():
+        db = get_db()
+        db.executescript(
+            "INSERT INTO user (id, username, password) VALUES (1, 'test', 'x'), (2, 'other', 'y');"
+        )
+        imported, skipped = import_data(str(dump), with_files=False)
+        assert sum(imported.values()) == len(lines) - 2
+        assert imported['user'] == 0 and sum(skipped.values()) == 0
+
+
+def test_import_rejects_unknown_records(target, tmp_path):
+    (tmp_path / DATA_FILE).write_text(json.dumps({'type': 'sqlite_master', 'name': 'x'}) + '\n')
+    with target.app_context(), pytest.raises(ValueError, match='Unknown record type'):
+        import_data(str(tmp_path))
+
+
+def test_commands(source, runner, tmp_path):
+    dump = tmp_path / 'dump'
+    result = runner.invoke(args=['export', str(dump)])
+    assert 'Exported 10 rows' in result.output
+
+    result = runner.invoke(args=['import', str(dump)])
+    assert 'already has data' in result.output
+
+    result = runner.invoke(args=['import', str(dump), '--merge'])
+    assert 'Imported 7 rows: 0 user, 2 post, 0 tags, 2 post_tag' in result.output
+    assert 'Skipped rows that already existed: 2 user, 1 tags.' in result.output
+
+    result = runner.invoke(args=['import', str(tmp_path)])
+    assert 'does not exist' in result.output
+
+
+def test_merge_into_database_with_posts(source, target, tmp_path):
+    dump = tmp_path / 'dump'
+    with source.app_context():
+        export_data(str(dump), with_files=False)
+
+    with target.app_context():
+        db = get_db()
+        db.execute("INSERT INTO user (username, password) VALUES ('someone', 'x'), ('other', 'y')")
+        db.execute("INSERT INTO post (title, body, author_id) VALUES ('theirs', '', 1)")
+        db.execute("INSERT INTO comments (comment, post_id, user_id) VALUES ('mine', 1, 1)")
+        db.commit()
+
+        imported, skipped = import_data(str(dump), batch_size=2, with_files=False, merge=True)
+        assert imported['post'] == 2 and imported['comments'] == 1
+        assert skipped['user'] == sum(skipped.values()) == 1 # 'other' already exists
+
+        # the existing post keeps its own comment; the imported one goes to the imported post
+        assert [row[0] for row in db.execute('SELECT comment FROM comments WHERE post_id = 1')] == ['mine']
+        post = db.execute(
+            "SELECT p.id, u.username, p.like_count, p.comment_count FROM post p JOIN user u ON u.id = p.author_id"
+            " WHERE title = 'test title'"
+        ).fetchone()
+        assert tuple(post) == (2, 'test', 1, 1)
+        comment = db.execute('SELECT c.comment, u.username FROM comments c JOIN user u ON u.id = c.user_id'
+                             ' WHERE c.post_id = 2').fetchone()
+        assert tuple(comment) == ('hi', 'other')
+        assert db.execute(
+            "SELECT u.username FROM post p JOIN user u ON u.id = p.author_id WHERE title = 'second'"
+        ).fetchone()[0] == 'other'
+        assert db.execute('SELECT post_id FROM images').fetchone()[0] == 2
@@ -0,0 +1,99 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from flaskr.db import get_db
+
+
+@pytest.fixture
+def upload(app, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    content = b'0123456789' * 100
+    with open(os.path.join(tmp_path, 'a.png'), 'wb') as f:
+        f.write(content)
+    return content
+
+
+def test_upload_caching_headers(client, upload):
+    response = client.get('/uploads/a.png')
+    assert response.status_code == 200
+    assert response.data == upload
+    assert response.headers['ETag'] == '"%s"' % hashlib.sha256(upload).hexdigest()
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+
+    response = client.get('/uploads/a.png', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+
+def test_upload_range(client, upload):
+    response = client.get('/uploads/a.png', headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.data == upload[10:20]
+
+
+def test_upload_accel_redirect(client, app, upload):
+    app.config['UPLOAD_ACCEL_REDIRECT'] = '/protected/'
+    response = client.get('/uploads/a.png')
+    assert response.headers['X-Accel-Redirect'] == '/protected/a.png'
+    assert response.data == b''
+    assert client.get('/uploads/a.png', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_upload_missing(client, upload):
+    assert client.get('/uploads/missing.png').status_code == 404
+    assert client.get('/uploads/..%2Fflaskr.sqlite').status_code == 404
+
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'pixels' * 100
+
+
+def test_create_dedupes_uploads(client, auth, app, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    auth.login()
+    for title in ('one', 'two'):
+        client.post('/create', data={'title': title, 'body': '', 'image': (io.BytesIO(PNG), 'photo.png')})
+
+    digest = hashlib.sha256(PNG).hexdigest()
+    assert sorted(os.listdir(tmp_path)) == [f'{digest}.png']
+    with app.app_context():
+        rows = get_db().execute('SELECT filename FROM images').fetchall()
+        assert [row['filename'] for row in rows] == [f'{digest}.png'] * 2
+
+    response = client.get(f'/uploads/{digest}.png')
+    assert response.headers['ETag'] == f'"{digest}"'
+
+
+@pytest.mark.parametrize(('content', 'message'), (
+    (b'#!/bin/sh\necho hi', b'Only PNG, JPEG, GIF and WebP images can be uploaded.'),
+    (PNG * 10, b'Images can be at most'),
+))
+def test_create_rejects_uploads(client, auth, app, tmp_path, content, message):
+    app.config.update(UPLOAD_FOLDER=str(tmp_path), MAX_IMAGE_SIZE=len(PNG) * 5, UPLOAD_CHUNK_SIZE=64)
+    auth.login()
+    response = client.post('/create', data={'title': 'x', 'body': '', 'image': (io.BytesIO(content), 'x.png')})
+
+    assert message in response.data
+    assert os.listdir(tmp_path) == []
+    with app.app_context():
+        assert get_db().execute('SELECT count(*) FROM post').fetchone()[0] == 1
+
+
+def test_clean_uploads(app, runner, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    used, orphan, variant = 'a' * 64 + '.png', 'b' * 64 + '.png', 'b' * 64 + '_320w.webp'
+    for name in (used, orphan, variant, 'notes.txt'):
+        (tmp_path / name).write_bytes(PNG)
+    with app.app_context():
+        db = get_db()
+        db.execute('INSERT INTO images (post_id, filename) VALUES (1, ?)', (used,))
+        db.commit()
+
+    # too new, an upload may still be about to reference it
+    assert 'Removed 0 unused uploads.' in runner.invoke(args=['clean-uploads']).output
+
+    result = runner.invoke(args=['clean-uploads', '--min-age', '-1'])
+    assert 'Removed 2 unused uploads.' in result.output
+    assert sorted(os.listdir(tmp_path)) == sorted([used, 'notes.txt'])
@@ -0,0 +1,101 @@
+import os
+import threading
+
+import pytest
+from werkzeug.exceptions import ServiceUnavailable
+
+from flaskr.db import get_db
+from flaskr.writer import WriteQueue, get_write_queue, write
+import stress_writes
+
+
+def insert_like(db, post_id, user_id):
+    db.execute('INSERT INTO likes (post_id, user_id) VALUES (?, ?)', (post_id, user_id))
+    return user_id
+
+
+def test_writes_are_grouped(app):
+    app.config['WRITE_QUEUE_WINDOW'] = 0.05
+    with app.app_context():
+        db = get_db()
+        db.executemany('INSERT INTO user (username, password) VALUES (?, ?)', [(f'u{i}', 'x') for i in range(20)])
+        db.commit()
+        write_queue = get_write_queue()
+
+    futures = [write_queue.submit(insert_like, 1, user_id) for user_id in range(3, 23)]
+    assert [future.result(5) for future in futures] == list(range(3, 23))
+    assert write_queue.writes == 20
+    assert write_queue.batches < 20
+
+    with app.app_context():
+        db = get_db()
+        assert db.execute('SELECT like_count FROM post WHERE id = 1').fetchone()[0] == 20
+        assert db.execute('SELECT version FROM data_version').fetchone()[0] == write_queue.batches
+
+
+def test_failing_write_leaves_the_rest_of_its_group(app):
+    app.config['WRITE_QUEUE_WINDOW'] = 0.05
+    with app.app_context():
+        write_queue = get_write_queue()
+    first = write_queue.submit(insert_like, 1, 1)
+    duplicate = write_queue.submit(insert_like, 1, 1) # UNIQUE(post_id, user_id)
+    second = write_queue.submit(insert_like, 1, 2)
+
+    assert first.result(5) == 1 and second.result(5) == 2
+    with pytest.raises(Exception, match='UNIQUE'):
+        duplicate.result(5)
+    with app.app_context():
+        assert get_db().execute('SELECT like_count FROM post WHERE id = 1').fetchone()[0] == 2
+
+
+def test_read_your_writes(client, auth):
+    auth.login()
+    client.post('/1/comment', data={'comment': 'right away'})
+    assert b'right away' in client.get('/1').data
+
+
+def test_write_without_queue(app):
+    app.config['WRITE_QUEUE_ENABLED'] = False
+    with app.test_request_context():
+        assert write(insert_like, 1, 2) == 2
+        assert 'flaskr_write_queue' not in app.extensions
+        assert get_db().execute('SELECT like_count FROM post WHERE id = 1').fetchone()[0] == 1
+
+
+def test_close_finishes_queued_writes(app):
+    write_queue = WriteQueue(app, 0.01, 100)
+    futures = [write_queue.submit(insert_like, 1, user_id) for user_id in (1, 2)]
+    write_queue.close()
+    assert all(future.done() for future in futures)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_stress_stays_consistent():
+    for write_queue in (False, True):
+        result = stress_writes.run(write_queue, processes=2, threads=3, seconds=0.5, posts=5)
+        assert result['ok'] > 0
+        assert result['failed'] == 0
+        assert result['consistent']
+
+
+def test_timed_out_write_is_never_applied(app):
+    app.config['WRITE_QUEUE_TIMEOUT'] = 0.05
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(db):
+        started.set()
+        release.wait(5)
+
+    with app.test_request_context(method='POST'):
+        write_queue = get_write_queue()
+        blocker = write_queue.submit(slow)
+        started.wait(5)
+        with pytest.raises(ServiceUnavailable):
+            write(insert_like, 1, 2)
+        release.set()
+        blocker.result(5)
+        write_queue.submit(lambda db: None).result(5) # the writer has moved past the cancelled write
+
+        assert get_db().execute('SELECT like_count FROM post WHERE id = 1').fetchone()[0] == 0
+    assert write_queue.writes == 2